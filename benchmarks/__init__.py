@@ -0,0 +1 @@
+"""Бенчмарки и нагрузочные сценарии бота"""
@@ -0,0 +1,164 @@
+"""
+Графики прогресса: скорость отрисовки в пуле процессов и попадания в кэш
+
+Синтетическая БД (benchmarks/synthetic_db.py) в профиле production, графики
+рисует ChartRenderer (services/charts.py) с --workers процессами. Этапы:
+
+- холодный: --concurrent пользователей одновременно нажимают "📊 Статистика",
+  все графики рисуются; графиков в секунду и задержка цикла событий;
+- повтор: те же пользователи нажимают еще --repeats раз - ответы из памяти;
+- перезапуск: новый ChartRenderer с пустой памятью и тем же CHART_DIR -
+  ответы с диска;
+- смесь: --sessions сессий случайных пользователей одновременно: нажатие,
+  иногда двойное, иногда отметка через CheckinWriter (новый ключ) и снова
+  нажатие; итоговая доля попаданий в кэш;
+- для сравнения --inline графиков рисуются прямо в цикле событий.
+
+Запуск: python -m benchmarks.charts [--users 5000 --concurrent 200 --sessions 2000]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("BOT_TOKEN", "123456:benchmark")
+
+from benchmarks.synthetic_db import build, user_ids
+from database.checkin_writer import CheckinWriter
+from database.database import SQLiteDatabase
+from services.charts import CHART_DAYS, ChartRenderer, _init_worker, day_statuses, render_chart
+
+
+async def lag_probe(stop: asyncio.Event, lags: list):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lags.append(time.perf_counter() - started - 0.001)
+
+
+async def with_lag(work) -> tuple:
+    """(результат work(), секунды, p99 и максимум задержки цикла событий)"""
+    stop, lags = asyncio.Event(), []
+    probe = asyncio.create_task(lag_probe(stop, lags))
+    started = time.perf_counter()
+    result = await work()
+    seconds = time.perf_counter() - started
+    stop.set()
+    await probe
+    lags.sort()
+    return result, seconds, lags[int(len(lags) * 0.99)] if lags else 0.0, lags[-1] if lags else 0.0
+
+
+def describe(count: int, seconds: float, p99: float, worst: float, unit: str) -> str:
+    return (f"{count} {unit} за {seconds:.2f} с ({count / seconds:.1f}/с), задержка цикла событий "
+            f"p99 {p99 * 1000:.1f} мс, max {worst * 1000:.1f} мс")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Графики прогресса: пул процессов и кэш")
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--history-days", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=0, help="процессов отрисовки (0 - по числу ядер)")
+    parser.add_argument("--concurrent", type=int, default=200, help="пользователей в холодном этапе")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--sessions", type=int, default=2000, help="сессий в смешанном этапе")
+    parser.add_argument("--checkin-share", type=float, default=0.2, help="доля сессий с отметкой")
+    parser.add_argument("--inline", type=int, default=20, help="графиков в цикле событий для сравнения")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    random.seed(args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        built = await build(path, args.users, args.seed, args.history_days)
+        conn = sqlite3.connect(path)
+        habit_names = dict(conn.execute("SELECT user_id, current_habit FROM user_habits"))
+        conn.close()
+        ids = [user_id for user_id in user_ids(args.users).tolist() if user_id in habit_names]
+
+        database = SQLiteDatabase(f"sqlite+aiosqlite:///{path}", profile="production")
+        chart_dir = os.path.join(tmp, "charts")
+        renderer = ChartRenderer(database, chart_dir, workers=args.workers)
+        started = time.perf_counter()
+        renderer.start()
+        await renderer.chart(ids[-1])
+        print(f"Пользователей с привычкой: {len(ids)}, логов: {built['logs']}; процессов отрисовки: "
+              f"{renderer.workers} (ядер {os.cpu_count()}), запуск пула и первый график {time.perf_counter() - started:.1f} с")
+
+        cold_users = ids[:args.concurrent]
+
+        async def press_all():
+            return await asyncio.gather(*(renderer.chart(user_id) for user_id in cold_users))
+        charts, seconds, p99, worst = await with_lag(press_all)
+        sizes = [len(png) for png in charts]
+        print(f"Холодный: {describe(len(charts), seconds, p99, worst, 'графиков')}, PNG в среднем "
+              f"{statistics.mean(sizes) / 1024:.0f} КБ")
+
+        async def repeat_all():
+            return await asyncio.gather(*(renderer.chart(user_id) for user_id in cold_users * args.repeats))
+        _, seconds, p99, worst = await with_lag(repeat_all)
+        print(f"Повтор:    {describe(len(cold_users) * args.repeats, seconds, p99, worst, 'нажатий')}, "
+              f"из памяти {renderer.memory_hits}")
+
+        restarted = ChartRenderer(database, chart_dir, workers=args.workers)
+        _, seconds, p99, worst = await with_lag(
+            lambda: asyncio.gather(*(restarted.chart(user_id) for user_id in cold_users))
+        )
+        print(f"Перезапуск: {describe(len(cold_users), seconds, p99, worst, 'нажатий')}, с диска "
+              f"{restarted.disk_hits}, перерисовано {restarted.renders}")
+
+        # Смесь: новые счетчики, чтобы доля попаданий была только по этому этапу
+        renderer.memory_hits = renderer.disk_hits = renderer.shared = renderer.renders = 0
+        writer = CheckinWriter(database)
+        writer.start()
+        # Частые пользователи нажимают чаще: квадрат равномерного смещает выбор к началу списка
+        pool = ids[:max(args.sessions // 3, 1)]
+        checked_in = set()
+
+        async def session():
+            user_id = pool[int(random.random() ** 2 * len(pool))]
+            presses = [renderer.chart(user_id)]
+            if random.random() < 0.1:
+                presses.append(renderer.chart(user_id))  # двойное нажатие
+            await asyncio.gather(*presses)
+            if random.random() < args.checkin_share and user_id not in checked_in:
+                checked_in.add(user_id)
+                await writer.submit(user_id, habit_names[user_id], True)
+                await renderer.chart(user_id)
+
+        async def mixed():
+            return await asyncio.gather(*(session() for _ in range(args.sessions)))
+        _, seconds, p99, worst = await with_lag(mixed)
+        await writer.stop()
+        mix = renderer.stats()
+        requests = mix['memory_hits'] + mix['disk_hits'] + mix['shared'] + mix['renders']
+        print(f"Смесь:     {describe(requests, seconds, p99, worst, 'запросов')}; {len(checked_in)} отметок")
+        print(f"           из памяти {mix['memory_hits']}, с диска {mix['disk_hits']}, общая отрисовка "
+              f"{mix['shared']}, нарисовано {mix['renders']} - попаданий в кэш {mix['hit_rate'] * 100:.1f}%")
+
+        if args.inline:
+            _init_worker()
+            stats = [await database.get_habit_stats(user_id, CHART_DAYS) for user_id in cold_users[:args.inline]]
+
+            async def inline():
+                for item in stats:
+                    render_chart(item['habit'].current_habit, item['calendar_start'],
+                                 day_statuses(item['calendar'], item['calendar_start'], CHART_DAYS),
+                                 item['habit'].current_streak, item['habit'].best_streak)
+                    await asyncio.sleep(0)
+            _, seconds, p99, worst = await with_lag(inline)
+            print(f"В цикле событий: {describe(len(stats), seconds, p99, worst, 'графиков')}")
+
+        await asyncio.to_thread(renderer.stop)
+        await asyncio.to_thread(restarted.stop)
+        await database.engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
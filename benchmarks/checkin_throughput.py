@@ -0,0 +1,92 @@
+"""
+Пропускная способность ежедневных отметок: по одной vs групповой коммит
+
+"До" - add_habit_log_simple (несколько сессий и два коммита на отметку),
+"после" - CheckinWriter (одна транзакция на пачку отметок многих
+пользователей). Одновременно отмечаются --concurrency пользователей.
+
+Запуск: python -m benchmarks.checkin_throughput [--users 2000 --concurrency 200]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import logging
+import os
+import tempfile
+import time
+
+os.environ.setdefault("BOT_TOKEN", "123456:benchmark")
+
+from database.database import SQLiteDatabase, UserHabit
+from database.checkin_writer import CheckinWriter
+
+
+async def make_database(path: str, users: int) -> SQLiteDatabase:
+    database = SQLiteDatabase(f"sqlite+aiosqlite:///{path}", profile="production")
+    await database.init_models()
+    async with database.engine.begin() as conn:
+        await conn.execute(
+            UserHabit.__table__.insert(),
+            [
+                {"user_id": user_id, "current_habit": "Медитация", "habit_type": "positive",
+                 "current_streak": 0, "best_streak": 0, "total_days": 0}
+                for user_id in range(users)
+            ]
+        )
+    return database
+
+
+async def drive(check_in, users: int, concurrency: int):
+    """concurrency параллельных клиентов отмечают всех users пользователей"""
+    failures = 0
+    next_user = iter(range(users))
+
+    async def client():
+        nonlocal failures
+        for user_id in next_user:
+            try:
+                result = await check_in(user_id)
+            except Exception:
+                result = None
+            if result is None:
+                failures += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return time.perf_counter() - started, failures
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database = await make_database(os.path.join(tmp, "before.db"), args.users)
+        with contextlib.redirect_stdout(io.StringIO()):
+            elapsed, failures = await drive(
+                lambda user_id: database.add_habit_log_simple(user_id, "Медитация", True),
+                args.users, args.concurrency
+            )
+        await database.engine.dispose()
+        print(f"по одной:          {args.users / elapsed:8.0f} отметок/с, ошибок {failures}")
+
+        database = await make_database(os.path.join(tmp, "after.db"), args.users)
+        writer = CheckinWriter(database)
+
+        async def submit(user_id):
+            habit, _ = await writer.submit(user_id, "Медитация", True)
+            return habit
+
+        elapsed, failures = await drive(submit, args.users, args.concurrency)
+        await writer.stop()
+        await database.engine.dispose()
+        print(f"групповой коммит:  {args.users / elapsed:8.0f} отметок/с, ошибок {failures}, "
+              f"транзакций {writer.batches}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
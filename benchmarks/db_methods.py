@@ -0,0 +1,247 @@
+"""
+Микробенчмарки методов SQLiteDatabase на синтетических данных
+
+Для каждого размера (--sizes, по умолчанию 10k, 100k и 1M пользователей)
+строится БД из benchmarks/synthetic_db.py и замеряются методы:
+
+- по одному вызову подряд (isolated) - задержка одного вызова;
+- --concurrency корутин одновременно (concurrent) - пропускная способность
+  и задержки с ожиданием пула соединений и блокировки записи.
+
+Кэши SQLiteDatabase выключены (HabitCache размера 0, пустой KnownUsers):
+меряется путь до БД, а не попадание в кэш. Каждый вызов берет своего
+пользователя, пишущие методы идут после читающих.
+
+Результаты пишутся в JSON (--json) и сравниваются с прошлым запуском
+(--compare): для isolated сравнивается медиана задержки, для concurrent -
+операций в секунду. Изменение хуже --threshold считается регрессией, и
+скрипт выходит с кодом 1 (как и при ошибках вызовов).
+
+Запуск: python -m benchmarks.db_methods [--sizes 10k,100k,1M --calls 2000 --concurrency 32]
+        python -m benchmarks.db_methods --sizes 10k --json new.json --compare old.json
+        python -m benchmarks.db_methods --current new.json --compare old.json  (без замеров)
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+os.environ.setdefault("BOT_TOKEN", "123456:benchmark")
+
+from benchmarks.synthetic_db import HABITS, build, user_ids
+from database.cache import HabitCache, KnownUsers
+from database.database import SQLiteDatabase
+
+SIZE_SUFFIXES = {"k": 1_000, "M": 1_000_000}
+WARMUP_CALLS = 50
+# Чем сравниваются режимы: (ключ, True - больше значит хуже)
+COMPARED = {"isolated": ("p50_us", True), "concurrent": ("ops_per_s", False)}
+
+
+def parse_size(label: str) -> int:
+    if label[-1:] in SIZE_SUFFIXES:
+        return int(float(label[:-1]) * SIZE_SUFFIXES[label[-1]])
+    return int(label)
+
+
+def make_cases(users: int, habits: dict) -> dict:
+    """Название -> (пользователи, вызов метода для пользователя, проверка результата)"""
+    everyone = user_ids(users)
+    newcomers = np.arange(everyone[-1] + 1, everyone[-1] + 1 + users, dtype=np.int64)
+    with_habit = np.fromiter(habits, dtype=np.int64, count=len(habits))
+    return {
+        # Чтения - на нетронутых данных
+        "get_or_create_user": (
+            everyone, lambda db, u: db.get_or_create_user(u, f"user{u}", "Тест"), lambda r: r is False),
+        "get_user_habit": (with_habit, lambda db, u: db.get_user_habit(u), lambda r: r is not None),
+        "get_habit_stats": (with_habit, lambda db, u: db.get_habit_stats(u), lambda r: r is not None),
+        # Записи
+        "get_or_create_user[new]": (
+            newcomers, lambda db, u: db.get_or_create_user(u, f"user{u}", "Новый"), lambda r: r is True),
+        "add_habit_log_simple": (
+            with_habit, lambda db, u: db.add_habit_log_simple(u, habits[u], u % 4 != 0), lambda r: r is not None),
+        "update_habit_streak_simple": (
+            with_habit, lambda db, u: db.update_habit_streak_simple(u, u % 4 != 0), lambda r: r is not None),
+        "create_user_habit": (
+            with_habit, lambda db, u: db.create_user_habit(u, *HABITS[u % len(HABITS)]), lambda r: r is not None),
+    }
+
+
+async def timed(database, call, check, user_id: int, latencies: list) -> bool:
+    started = time.perf_counter()
+    try:
+        ok = check(await call(database, user_id))
+    except Exception:
+        ok = False
+    latencies.append(time.perf_counter() - started)
+    return ok
+
+
+async def run_isolated(database, call, check, users) -> tuple:
+    latencies, errors = [], 0
+    started = time.perf_counter()
+    for user_id in users:
+        errors += not await timed(database, call, check, user_id, latencies)
+    return latencies, errors, time.perf_counter() - started
+
+
+async def run_concurrent(database, call, check, users, concurrency: int) -> tuple:
+    latencies, errors = [], 0
+    pending = iter(users)
+
+    async def worker():
+        nonlocal errors
+        for user_id in pending:
+            errors += not await timed(database, call, check, user_id, latencies)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+def summarize(latencies: list, errors: int, seconds: float) -> dict:
+    micros = np.array(latencies) * 1e6
+    return {
+        "calls": len(latencies),
+        "errors": errors,
+        "ops_per_s": round(len(latencies) / seconds, 1),
+        "mean_us": round(float(micros.mean()), 1),
+        "p50_us": round(float(np.percentile(micros, 50)), 1),
+        "p95_us": round(float(np.percentile(micros, 95)), 1),
+        "p99_us": round(float(np.percentile(micros, 99)), 1),
+    }
+
+
+async def bench_size(label: str, users: int, args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        built = await build(path, users, args.seed)
+        print(f"\n{label}: {built['users']} пользователей, {built['logs']} логов, "
+              f"сгенерировано за {built['seconds']} с")
+
+        conn = sqlite3.connect(path)
+        habits = dict(conn.execute("SELECT user_id, current_habit FROM user_habits ORDER BY user_id"))
+        conn.close()
+
+        database = SQLiteDatabase(f"sqlite+aiosqlite:///{path}", profile="production")
+        rng = np.random.default_rng(args.seed)
+        results = {}
+        print(f"{'метод':28} {'режим':10} {'оп/с':>9} {'p50':>8} {'p95':>8} {'p99':>8} мкс  ошибок")
+        for name, (population, call, check) in make_cases(users, habits).items():
+            needed = WARMUP_CALLS + 2 * args.calls
+            picked = rng.choice(population, needed, replace=needed > len(population)).tolist()
+            warmup, isolated, concurrent = (
+                picked[:WARMUP_CALLS], picked[WARMUP_CALLS:WARMUP_CALLS + args.calls], picked[WARMUP_CALLS + args.calls:]
+            )
+            database.cache = HabitCache(max_size=0)
+            database.known_users = KnownUsers()
+            await run_concurrent(database, call, check, warmup, args.concurrency)
+
+            results[name] = {
+                "isolated": summarize(*await run_isolated(database, call, check, isolated)),
+                "concurrent": summarize(*await run_concurrent(database, call, check, concurrent, args.concurrency)),
+            }
+            for mode, stats in results[name].items():
+                print(f"{name:28} {mode:10} {stats['ops_per_s']:9.0f} {stats['p50_us']:8.0f} "
+                      f"{stats['p95_us']:8.0f} {stats['p99_us']:8.0f}      {stats['errors']}")
+        await database.engine.dispose()
+    return results
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list:
+    """Печатает изменения относительно baseline; возвращает список регрессий"""
+    for key in ("calls", "concurrency"):
+        if baseline["meta"].get(key) != current["meta"].get(key):
+            print(f"⚠️ {key} отличается: {baseline['meta'].get(key)} -> {current['meta'].get(key)}, "
+                  f"сравнение может быть нечестным")
+
+    print(f"\nСравнение с {baseline['meta'].get('commit') or 'базой'} (порог {threshold * 100:.0f}%, плюс - хуже):")
+    regressions = []
+    for label, methods in current["results"].items():
+        for name, modes in methods.items():
+            for mode, stats in modes.items():
+                old = baseline["results"].get(label, {}).get(name, {}).get(mode)
+                if not old:
+                    continue
+                key, higher_is_worse = COMPARED[mode]
+                before, after = old[key], stats[key]
+                worse = (after / before if higher_is_worse else before / after) - 1 if before and after else 0
+                marker = "  ⚠️ регрессия" if worse > threshold else ""
+                print(f"{label:5} {name:28} {mode:10} {key:9} {before:10.1f} -> {after:10.1f} "
+                      f"({worse * 100:+6.1f}%){marker}")
+                if marker:
+                    regressions.append((label, name, mode))
+    return regressions
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Микробенчмарки методов SQLiteDatabase")
+    parser.add_argument("--sizes", default="10k,100k,1M", help="размеры через запятую: 10k,100k,1M")
+    parser.add_argument("--calls", type=int, default=2000, help="вызовов на метод в каждом режиме")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="записать результаты в файл")
+    parser.add_argument("--compare", help="JSON прошлого запуска для сравнения")
+    parser.add_argument("--current", help="сравнить этот JSON вместо новых замеров")
+    parser.add_argument("--threshold", type=float, default=0.2, help="допустимое ухудшение (0.2 = 20%%)")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    if args.current:
+        with open(args.current, encoding="utf-8") as file:
+            current = json.load(file)
+    else:
+        current = {
+            "meta": {
+                "commit": git_commit(),
+                "date": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "sqlite": sqlite3.sqlite_version,
+                "calls": args.calls,
+                "concurrency": args.concurrency,
+                "seed": args.seed,
+            },
+            "results": {},
+        }
+        for label in args.sizes.split(","):
+            current["results"][label] = await bench_size(label, parse_size(label), args)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as file:
+                json.dump(current, file, ensure_ascii=False, indent=2)
+            print(f"\nРезультаты записаны в {args.json}")
+
+    failed = sum(stats["errors"] for methods in current["results"].values()
+                 for modes in methods.values() for stats in modes.values())
+    if failed:
+        print(f"❌ Ошибок вызовов: {failed}")
+
+    regressions = []
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            regressions = compare(json.load(file), current, args.threshold)
+        print(f"Регрессий: {len(regressions)}")
+
+    sys.exit(1 if failed or regressions else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,151 @@
+"""
+Сравнение профилей движка SQLite на большой таблице habit_logs
+
+Для каждого профиля из database/engine.py меряются задержки точечного
+чтения, чтения диапазона, одиночной записи с коммитом и пропускная
+способность конкурентных записей.
+
+Запуск: python -m benchmarks.engine_profiles [--rows 10000000 --ops 2000]
+"""
+import argparse
+import asyncio
+import contextlib
+import logging
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault("BOT_TOKEN", "123456:benchmark")
+
+from sqlalchemy import text
+
+from database.database import Base
+from database.engine import create_engine_for_profile
+
+# default и debug идут раньше production: режим WAL сохраняется в файле
+PROFILES = ["default", "debug", "production"]
+
+
+def populate(path: str, rows: int, users: int):
+    """Синтетические habit_logs: rows записей по users пользователям"""
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA journal_mode=MEMORY")
+    start = datetime(2024, 1, 1)
+    rng = random.Random(1)
+
+    def generate():
+        for i in range(rows):
+            user_id = i % users
+            yield (user_id, "Медитация", rng.random() < 0.7, start + timedelta(days=i // users))
+
+    conn.executemany(
+        "INSERT INTO habit_logs (user_id, habit_name, success, log_date) VALUES (?, ?, ?, ?)",
+        generate()
+    )
+    conn.commit()
+    conn.close()
+
+
+def percentiles(samples):
+    samples.sort()
+    return statistics.median(samples), samples[max(0, int(len(samples) * 0.99) - 1)]
+
+
+async def bench_profile(url: str, profile: str, rows: int, ops: int, devnull):
+    with contextlib.redirect_stdout(devnull):
+        # Эхо профиля debug пишет в sys.stdout, захваченный при создании движка
+        engine = create_engine_for_profile(url, profile)
+    rng = random.Random(7)
+    result = {}
+
+    point, ranged, writes = [], [], []
+    for _ in range(ops):
+        row_id = rng.randrange(1, rows)
+        started = time.perf_counter()
+        async with engine.connect() as conn:
+            (await conn.execute(text("SELECT * FROM habit_logs WHERE id = :id"), {"id": row_id})).first()
+        point.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        async with engine.connect() as conn:
+            (await conn.execute(
+                text("SELECT count(*), sum(success) FROM habit_logs WHERE id BETWEEN :a AND :a + 500"),
+                {"a": row_id}
+            )).first()
+        ranged.append((time.perf_counter() - started) * 1000)
+
+    for _ in range(ops // 4):
+        started = time.perf_counter()
+        async with engine.begin() as conn:
+            await conn.execute(
+                text("INSERT INTO habit_logs (user_id, habit_name, success, log_date) VALUES (1, 'x', 1, :d)"),
+                {"d": datetime.now()}
+            )
+        writes.append((time.perf_counter() - started) * 1000)
+
+    result["point"] = percentiles(point)
+    result["range"] = percentiles(ranged)
+    result["write"] = percentiles(writes)
+
+    errors = 0
+
+    async def writer():
+        nonlocal errors
+        for _ in range(25):
+            try:
+                async with engine.begin() as conn:
+                    await conn.execute(
+                        text("INSERT INTO habit_logs (user_id, habit_name, success, log_date) VALUES (2, 'y', 0, :d)"),
+                        {"d": datetime.now()}
+                    )
+            except Exception:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(writer() for _ in range(20)))
+    result["concurrent"] = (500 - errors) / (time.perf_counter() - started), errors
+
+    await engine.dispose()
+    return result
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--ops", type=int, default=2000)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+    # Эхо профиля debug должно уходить только в свой обработчик (в /dev/null)
+    logging.getLogger("sqlalchemy.engine.Engine").propagate = False
+
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, "w") as devnull:
+        path = os.path.join(tmp, "logs.db")
+        url = f"sqlite+aiosqlite:///{path}"
+
+        engine = create_engine_for_profile(url, "default")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        await engine.dispose()
+
+        started = time.perf_counter()
+        populate(path, args.rows, args.users)
+        print(f"{args.rows} строк habit_logs созданы за {time.perf_counter() - started:.1f} с\n")
+
+        print(f"{'профиль':<12}{'точечное p50/p99, мс':>24}{'диапазон p50/p99, мс':>24}"
+              f"{'запись p50/p99, мс':>22}{'конкурентно, зап/с':>22}")
+        for profile in PROFILES:
+            r = await bench_profile(url, profile, args.rows, args.ops, devnull)
+            print(f"{profile:<12}{r['point'][0]:>12.2f}/{r['point'][1]:<11.2f}"
+                  f"{r['range'][0]:>12.2f}/{r['range'][1]:<11.2f}"
+                  f"{r['write'][0]:>10.2f}/{r['write'][1]:<11.2f}"
+                  f"{r['concurrent'][0]:>12.0f} (ошибок {r['concurrent'][1]})")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,236 @@
+"""
+Память выгрузки истории: 5 млн строк habit_logs с ограничением пикового RSS
+
+Синтетическая БД (benchmarks/synthetic_db.py) строится так, чтобы в
+habit_logs было около --rows строк. Каждая выгрузка запускается в отдельном
+процессе, и замеряется, насколько пиковый RSS процесса вырос за время
+выгрузки относительно уже импортированного бота с открытым соединением.
+Бюджет проверяется по анонимной памяти (RssAnon: куча и буферы процесса) -
+страницы файла БД, прочитанные через mmap, это кэш страниц ОС, и они
+показываются отдельно как рост полного RSS. В рост входит кэш страниц
+самой SQLite (cache_size профиля production, 64 МБ на соединение): на
+большой выгрузке он заполняется целиком и дальше не растет.
+
+Выгрузки:
+
+- all  - services.export.export_all: все логи в один gzip-файл;
+- user - export_user для пользователя с самой длинной историей, затем
+         отправка документа в FakeBotAPI (проверяется, что дошли все байты);
+- naive - прежний подход debug.py: fetchall() по --naive-rows строкам и
+         кодирование списка целиком (для сравнения).
+
+Для all дополнительно меряется задержка цикла событий во время выгрузки.
+Если рост RSS выгрузки all или user больше --budget-mb, бенчмарк
+завершается с кодом 1.
+
+Запуск: python -m benchmarks.export_memory [--rows 5000000 --budget-mb 96]
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import os
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# Средняя доля дней с отметкой у пользователя с привычкой (Beta(1, 3) в synthetic_db)
+ENGAGEMENT = 0.25
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def anon_rss_mb() -> float:
+    """Анонимная часть RSS (куча, буферы); страницы файла БД через mmap сюда не входят"""
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("RssAnon:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+class AnonPeak(threading.Thread):
+    """Максимум anon_rss_mb(), опрашиваемый каждые 5 мс"""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.peak = anon_rss_mb()
+        self.done = threading.Event()
+
+    def run(self):
+        while not self.done.wait(0.005):
+            self.peak = max(self.peak, anon_rss_mb())
+
+    def stop(self) -> float:
+        self.done.set()
+        self.join()
+        return max(self.peak, anon_rss_mb())
+
+
+async def lag_probe(stop: asyncio.Event, lags: list):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lags.append(time.perf_counter() - started - 0.001)
+
+
+async def child_all(args) -> dict:
+    from database.database import db
+    from services.export import export_all
+
+    path = os.path.join(os.path.dirname(args.path), f"all.{args.format}.gz")
+    stop, lags = asyncio.Event(), []
+    probe = asyncio.create_task(lag_probe(stop, lags))
+    report = await export_all(args.format, path)
+    stop.set()
+    await probe
+    await db.engine.dispose()
+
+    lines = 0
+    with gzip.open(path, "rb") as exported:
+        for _ in exported:
+            lines += 1
+    lags.sort()
+    return {
+        'rows': report['rows'], 'lines': lines, 'bytes': report['bytes'], 'seconds': report['seconds'],
+        'lag_p99': lags[int(len(lags) * 0.99)] if lags else 0.0, 'lag_max': lags[-1] if lags else 0.0,
+    }
+
+
+async def child_user(args) -> dict:
+    from benchmarks.fake_bot_api import FakeBotAPI
+    from database.database import db
+    from services.export import export_user
+    from services.bot_session import PrebuiltMarkupSession
+
+    conn = sqlite3.connect(args.path)
+    user_id, expected = conn.execute(
+        "SELECT user_id, count(*) AS n FROM habit_logs GROUP BY user_id ORDER BY n DESC LIMIT 1"
+    ).fetchone()
+    conn.close()
+
+    started = time.perf_counter()
+    document, rows = await export_user(user_id, args.format)
+    seconds = time.perf_counter() - started
+    size = document.spool.seek(0, os.SEEK_END)
+
+    api = FakeBotAPI(global_rate=None, per_chat_rate=None)
+    await api.start()
+    bot = api.make_bot(session_class=PrebuiltMarkupSession)
+    try:
+        await bot.send_document(user_id, document, caption="export")
+    finally:
+        document.spool.close()
+        await bot.session.close()
+        await api.stop()
+        await db.engine.dispose()
+    delivered = len(api.outbox[-1][3]["document"])
+    return {'rows': rows, 'expected': expected, 'bytes': size, 'delivered': delivered, 'seconds': round(seconds, 3)}
+
+
+async def child_naive(args) -> dict:
+    from sqlalchemy import select
+    from database.database import db
+    from database.models import HabitLog
+    from services.export import ALL_COLUMNS, _columns, encode_rows
+
+    logs = HabitLog.__table__.c
+    started = time.perf_counter()
+    async with db.engine.connect() as conn:
+        rows = (await conn.execute(select(*_columns(ALL_COLUMNS)).order_by(logs.id).limit(args.naive_rows))).fetchall()
+    data = gzip.compress(encode_rows(rows, ALL_COLUMNS, args.format), 6)
+    await db.engine.dispose()
+    return {'rows': len(rows), 'bytes': len(data), 'seconds': round(time.perf_counter() - started, 1)}
+
+
+async def child(args):
+    """Одна выгрузка в этом процессе; печатает JSON с отчетом и ростом пикового RSS"""
+    # config и глобальный db читают окружение при импорте
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{args.path}"
+    os.environ.setdefault("BOT_TOKEN", "123456:benchmark")
+    logging.getLogger().setLevel(logging.WARNING)
+
+    import bot  # noqa: F401 - память уже работающего бота: aiogram, обработчики, кэши
+    from database.database import db
+    async with db.engine.connect() as conn:
+        await conn.exec_driver_sql("SELECT count(*) FROM users")
+    baseline, baseline_anon = peak_rss_mb(), anon_rss_mb()
+
+    sampler = AnonPeak()
+    sampler.start()
+    run = {'all': child_all, 'user': child_user, 'naive': child_naive}[args.child]
+    report = await run(args)
+    report['baseline_mb'] = round(baseline_anon, 1)
+    report['growth_mb'] = round(sampler.stop() - baseline_anon, 1)
+    # Пиковый RSS целиком: вместе со страницами БД, прочитанными через mmap (кэш страниц ОС)
+    report['total_growth_mb'] = round(peak_rss_mb() - baseline, 1)
+    print(json.dumps(report))
+
+
+def run_child(mode: str, path: str, args) -> dict:
+    command = [sys.executable, "-m", "benchmarks.export_memory", "--child", mode, "--path", path,
+               "--format", args.format, "--naive-rows", str(args.naive_rows)]
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Память выгрузки истории")
+    parser.add_argument("--rows", type=int, default=5_000_000, help="примерно строк habit_logs")
+    parser.add_argument("--history-days", type=int, default=400)
+    parser.add_argument("--format", choices=("csv", "json"), default="csv")
+    parser.add_argument("--budget-mb", type=float, default=96,
+                        help="допустимый рост анонимной памяти выгрузки (с кэшем страниц SQLite)")
+    parser.add_argument("--naive-rows", type=int, default=1_000_000, help="строк для выгрузки через fetchall (0 - не мерить)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--child", choices=("all", "user", "naive"), help=argparse.SUPPRESS)
+    parser.add_argument("--path", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        await child(args)
+        return
+
+    os.environ.setdefault("BOT_TOKEN", "123456:benchmark")
+    logging.getLogger().setLevel(logging.WARNING)
+    # Родитель только строит БД; выгрузки импортируют бота в своих процессах
+    from benchmarks.synthetic_db import HABIT_SHARE, build
+    users = round(args.rows / (args.history_days * ENGAGEMENT * HABIT_SHARE))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "export.db")
+        built = await build(path, users, args.seed, args.history_days)
+        print(f"Пользователей: {built['users']}, логов: {built['logs']}, БД {os.path.getsize(path) / 2**20:.0f} МБ, "
+              f"построена за {built['seconds']} с; формат {args.format}, бюджет роста RSS {args.budget_mb:g} МБ")
+
+        every = run_child("all", path, args)
+        print(f"Все пользователи: {every['rows']} строк за {every['seconds']} с "
+              f"({every['rows'] / max(every['seconds'], 1e-9) / 1000:.0f} тыс. строк/с), gzip {every['bytes'] / 2**20:.1f} МБ, "
+              f"строк в файле {every['lines']}; рост RSS {every['growth_mb']} МБ (полного, с mmap, "
+              f"{every['total_growth_mb']} МБ; бот после импорта {every['baseline_mb']} МБ); задержка цикла событий p99 {every['lag_p99'] * 1000:.1f} мс, "
+              f"max {every['lag_max'] * 1000:.1f} мс")
+
+        user = run_child("user", path, args)
+        print(f"Один пользователь: {user['rows']} из {user['expected']} строк за {user['seconds'] * 1000:.0f} мс, "
+              f"{user['bytes']} байт, в Bot API дошло {user['delivered']}; рост RSS {user['growth_mb']} МБ")
+
+        if args.naive_rows:
+            naive = run_child("naive", path, args)
+            print(f"fetchall: {naive['rows']} строк за {naive['seconds']} с, рост RSS {naive['growth_mb']} МБ "
+                  f"(~{naive['growth_mb'] / max(naive['rows'], 1) * built['logs']:.0f} МБ на все {built['logs']})")
+
+    ok = (every['growth_mb'] <= args.budget_mb and user['growth_mb'] <= args.budget_mb
+          and every['rows'] == built['logs'] and every['lines'] == built['logs'] + (args.format == "csv")
+          and user['rows'] == user['expected'] and user['delivered'] == user['bytes'])
+    print("✅ Выгрузки уложились в бюджет и выгрузили все строки" if ok else "❌ Бюджет памяти или полнота выгрузки нарушены")
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
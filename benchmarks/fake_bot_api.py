@@ -0,0 +1,282 @@
+"""
+Локальный поддельный Bot API для бенчмарков
+
+Принимает запросы aiogram по адресу /bot<token>/<method>, записывает каждое
+исходящее сообщение и, как настоящий Telegram, отвечает 429 с retry_after,
+если превышены общий или поканальный лимит. Входящие обновления, добавленные
+через push_update, отдаются боту long polling'ом getUpdates, а expect_message
+позволяет дождаться ответа бота в конкретный чат.
+
+Использование:
+
+    api = FakeBotAPI(global_rate=30, per_chat_rate=1)
+    await api.start()
+    bot = api.make_bot()
+    ...
+    await api.stop()
+"""
+import asyncio
+import time
+from collections import defaultdict, deque
+from typing import Callable, Dict, List, Optional
+
+from aiohttp import web
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+FAKE_TOKEN = "123456:fake-token"
+
+
+class FakeBotAPI:
+    """aiohttp-сервер, имитирующий методы Bot API и флуд-лимиты Telegram"""
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        global_rate: Optional[int] = 30,
+        per_chat_rate: Optional[int] = 1,
+        per_chat_burst: int = 3,
+        retry_after: int = 1,
+        latency: float = 0.0,
+    ):
+        self.host = host
+        self.port = port
+        self.global_rate = global_rate
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self.retry_after = retry_after
+        # Имитация сети: задержка в одну сторону (секунды) для запроса и для ответа
+        self.latency = latency
+
+        # Все успешно "доставленные" сообщения: (время, метод, chat_id, payload)
+        self.outbox: List[tuple] = []
+        self.rejected = 0
+        self._global_window = deque()
+        self._chat_windows: Dict[int, deque] = defaultdict(deque)
+        self._message_id = 0
+        # Входящие обновления для getUpdates
+        self._updates: List[dict] = []
+        self._update_id = 0
+        self._new_updates: Optional[asyncio.Event] = None
+        # Ожидающие ответа: chat_id -> [(условие, future)]
+        self._waiters: Dict[int, List[tuple]] = defaultdict(list)
+        self._runner: Optional[web.AppRunner] = None
+
+        # Документы до лимита Bot API на загрузку (50 МБ)
+        self.app = web.Application(client_max_size=50 * 1024 * 1024)
+        self.app.router.add_post("/bot{token}/{method}", self._handle)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # Порт 0 - значит, система выбрала свободный порт
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    def make_bot(self, token: str = FAKE_TOKEN, session_class=AiohttpSession) -> Bot:
+        """Бот aiogram, который ходит в этот сервер вместо api.telegram.org"""
+        session = session_class(api=TelegramAPIServer.from_base(self.base_url))
+        return Bot(token=token, session=session)
+
+    async def _payload(self, request: web.Request) -> dict:
+        if request.content_type == "application/json":
+            return await request.json()
+        data = await request.post()
+        payload = {}
+        for key, value in data.items():
+            payload[key] = value if isinstance(value, str) else value.file.read()
+        return payload
+
+    def _flooded(self, chat_id: Optional[int], now: float) -> bool:
+        """Проверить лимиты за последнюю секунду и учесть запрос"""
+        window = self._global_window
+        while window and window[0] <= now - 1:
+            window.popleft()
+        if self.global_rate is not None and len(window) >= self.global_rate:
+            return True
+
+        if chat_id is not None and self.per_chat_rate is not None:
+            chat_window = self._chat_windows[chat_id]
+            horizon = self.per_chat_burst / self.per_chat_rate
+            while chat_window and chat_window[0] <= now - horizon:
+                chat_window.popleft()
+            if len(chat_window) >= self.per_chat_burst:
+                return True
+            chat_window.append(now)
+
+        window.append(now)
+        return False
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        payload = await self._payload(request)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        handler = getattr(self, f"_method_{method.lower()}", None)
+        response = self._ok(True) if handler is None else await handler(payload)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return response
+
+    def _ok(self, result) -> web.Response:
+        return web.json_response({"ok": True, "result": result})
+
+    def _too_many_requests(self) -> web.Response:
+        self.rejected += 1
+        return web.json_response(
+            {
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            },
+            status=429,
+        )
+
+    def _message(self, chat_id: int, **fields) -> dict:
+        self._message_id += 1
+        message = {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+        }
+        message.update(fields)
+        return message
+
+    async def _method_getme(self, payload: dict) -> web.Response:
+        return self._ok({"id": 123456, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"})
+
+    def push_update(self, update: dict) -> int:
+        """Поставить обновление в очередь getUpdates; возвращает его update_id"""
+        self._update_id += 1
+        self._updates.append(dict(update, update_id=self._update_id))
+        if self._new_updates is not None:
+            self._new_updates.set()
+        return self._update_id
+
+    async def _method_getupdates(self, payload: dict) -> web.Response:
+        offset = int(payload.get("offset") or 0)
+        limit = int(payload.get("limit") or 100)
+        timeout = float(payload.get("timeout") or 0)
+        # Подтвержденные (update_id < offset) обновления больше не отдаются
+        self._updates = [update for update in self._updates if update["update_id"] >= offset]
+        if not self._updates and timeout > 0:
+            self._new_updates = asyncio.Event()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self._new_updates = None
+        return self._ok(self._updates[:limit])
+
+    async def _method_sendmessage(self, payload: dict) -> web.Response:
+        chat_id = int(payload["chat_id"])
+        now = time.monotonic()
+        if self._flooded(chat_id, now):
+            return self._too_many_requests()
+
+        self.outbox.append((now, "sendMessage", chat_id, payload))
+        self._notify(chat_id, payload)
+        return self._ok(self._message(chat_id, text=payload.get("text", "")))
+
+    async def _method_senddocument(self, payload: dict) -> web.Response:
+        chat_id = int(payload["chat_id"])
+        now = time.monotonic()
+        if self._flooded(chat_id, now):
+            return self._too_many_requests()
+
+        # aiogram передает файл отдельным полем, а в document - ссылку attach://<поле>
+        document = payload.get("document", "")
+        if isinstance(document, str) and document.startswith("attach://"):
+            payload["document"] = document = payload.pop(document[len("attach://"):], b"")
+        self.outbox.append((now, "sendDocument", chat_id, payload))
+        self._notify(chat_id, payload)
+        document = {"file_id": f"document-{self._message_id + 1}", "file_unique_id": str(self._message_id + 1),
+                    "file_size": len(document)}
+        return self._ok(self._message(chat_id, caption=payload.get("caption", ""), document=document))
+
+    async def _method_sendphoto(self, payload: dict) -> web.Response:
+        chat_id = int(payload["chat_id"])
+        now = time.monotonic()
+        if self._flooded(chat_id, now):
+            return self._too_many_requests()
+
+        photo = payload.get("photo", "")
+        if isinstance(photo, str) and photo.startswith("attach://"):
+            payload["photo"] = photo = payload.pop(photo[len("attach://"):], b"")
+        self.outbox.append((now, "sendPhoto", chat_id, payload))
+        self._notify(chat_id, payload)
+        sizes = [{"file_id": f"photo-{self._message_id + 1}", "file_unique_id": str(self._message_id + 1),
+                  "width": 800, "height": 420, "file_size": len(photo)}]
+        return self._ok(self._message(chat_id, caption=payload.get("caption", ""), photo=sizes))
+
+    def expect_message(self, chat_id: int, predicate: Optional[Callable[[dict], bool]] = None) -> asyncio.Future:
+        """Future с первым сообщением в чат chat_id после вызова (и подходящим под predicate)"""
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[chat_id].append((predicate, future))
+        return future
+
+    def _notify(self, chat_id: int, payload: dict):
+        waiters = self._waiters.get(chat_id)
+        if not waiters:
+            return
+        for entry in list(waiters):
+            predicate, future = entry
+            if future.done():
+                waiters.remove(entry)
+            elif predicate is None or predicate(payload):
+                future.set_result(payload)
+                waiters.remove(entry)
+                break
+        if not waiters:
+            del self._waiters[chat_id]
+
+    def max_rate(self, chat_id: Optional[int] = None) -> int:
+        """Наибольшее число доставленных сообщений за любое окно в 1 секунду"""
+        times = [entry[0] for entry in self.outbox if chat_id is None or entry[2] == chat_id]
+        best = 0
+        left = 0
+        for right, moment in enumerate(times):
+            while moment - times[left] >= 1:
+                left += 1
+            best = max(best, right - left + 1)
+        return best
+
+
+def message_update(chat_id: int, text: str) -> dict:
+    """Тело обновления с текстовым сообщением от пользователя chat_id (без update_id)"""
+    return {
+        "message": {
+            "message_id": 1,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": f"User {chat_id}"},
+            "text": text,
+        }
+    }
+
+
+async def _serve_forever(port: int):
+    api = FakeBotAPI(port=port)
+    await api.start()
+    print(f"Fake Bot API: {api.base_url}/bot{FAKE_TOKEN}/<method>")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await api.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(_serve_forever(8081))
@@ -0,0 +1,85 @@
+"""
+Накладные расходы хранилища FSM на одно обновление
+
+На каждое обновление aiogram читает состояние (FSMContextMiddleware), а
+обработчики выбора привычки еще и меняют его. Бенчмарк повторяет эту пару
+get_state + set_state для многих пользователей в MemoryStorage и в
+SQLiteStorage (с холодным и прогретым кэшем), затем пересоздает SQLiteStorage
+поверх той же БД и проверяет, что состояния пережили "перезапуск".
+
+Запуск: python -m benchmarks.fsm_storage [--users 2000 --rounds 20]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+os.environ.setdefault("BOT_TOKEN", "123456:benchmark")
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from database.database import SQLiteDatabase
+from database.fsm_storage import SQLiteStorage
+from utils.states import HabitStates
+
+STATES = [
+    HabitStates.choosing_habit_type,
+    HabitStates.choosing_negative_habit,
+    HabitStates.choosing_positive_habit,
+    HabitStates.confirming_change,
+]
+
+
+def keys(users: int) -> list:
+    return [StorageKey(bot_id=1, chat_id=user_id, user_id=user_id) for user_id in range(1, users + 1)]
+
+
+async def run_updates(storage, users: list, rounds: int) -> float:
+    """Микросекунд на обновление (get_state + set_state)"""
+    started = time.perf_counter()
+    for round_number in range(rounds):
+        state = STATES[round_number % len(STATES)]
+        for key in users:
+            await storage.get_state(key)
+            await storage.set_state(key, state)
+    return (time.perf_counter() - started) / (rounds * len(users)) * 1e6
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк хранилища FSM")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+    users = keys(args.users)
+
+    memory = await run_updates(MemoryStorage(), users, args.rounds)
+    print(f"MemoryStorage:              {memory:7.2f} мкс/обновление")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}"
+        database = SQLiteDatabase(url, profile="production")
+        await database.init_models()
+
+        storage = SQLiteStorage(database)
+        cold = await run_updates(storage, users, 1)
+        warm = await run_updates(storage, users, args.rounds)
+        await storage.close()
+        print(f"SQLiteStorage, холодный:    {cold:7.2f} мкс/обновление (чтение из БД при первом обращении)")
+        print(f"SQLiteStorage, прогретый:   {warm:7.2f} мкс/обновление")
+        print(f"  записей в БД: {storage.written} за {storage.flushes} транзакций, чтений из БД: {storage.loads}")
+        await database.engine.dispose()
+
+        # "Перезапуск": новый процесс с пустым кэшем видит последние состояния
+        database = SQLiteDatabase(url, profile="production")
+        restarted = SQLiteStorage(database)
+        expected = STATES[(args.rounds - 1) % len(STATES)].state
+        survived = sum([await restarted.get_state(key) == expected for key in users])
+        await restarted.close()
+        await database.engine.dispose()
+        print(f"После перезапуска состояние сохранилось у {survived}/{len(users)} пользователей")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
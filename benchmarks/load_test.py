@@ -0,0 +1,299 @@
+"""
+Нагрузочный прогон всего бота против поддельного Bot API
+
+Поднимается FakeBotAPI, а боевой Dispatcher из bot.py (те же обработчики,
+маршруты, хранилище FSM, писатель отметок и сервис напоминаний) опрашивает
+его через getUpdates. БД - настоящий SQLiteDatabase на временном файле.
+
+Драйвер запускает --users пользователей, приходящих пуассоновским потоком
+с интенсивностью --rate в секунду. Каждый проходит сценарий: /start, выбор
+типа и привычки, --checkins ежедневных отметок, статистика, смена привычки с
+повторным выбором и просмотр текущей привычки. Между шагами пользователь
+"думает" (--think-ms, экспоненциально). Задержка шага - от отправки
+обновления до ответа бота в этот чат; напоминания сервиса напоминаний
+ответом не считаются.
+
+Отчет: пропускная способность, p50/p95/p99 по обработчикам, время пишущих
+SQL-запросов и оценка ожидания блокировки SQLite (превышение над временем
+тех же запросов без конкуренции, замеренным на прогревочном пользователе),
+ошибки из логов, рост памяти процесса (RSS). --json сохраняет отчет для
+сравнения между прогонами.
+
+По умолчанию лимиты Telegram сняты (иначе пропускную способность задают
+30 сообщений/с, а не бот); --flood-limits включает их и в очереди отправки,
+и в FakeBotAPI.
+
+Запуск: python -m benchmarks.load_test [--users 300 --rate 30 --checkins 5 --json report.json]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+from benchmarks.fake_bot_api import FAKE_TOKEN, FakeBotAPI, message_update
+
+# Пишущие SQL-запросы: в WAL ожидание блокировки писателя попадает в их время
+WRITE_STATEMENTS = ("INSERT", "UPDATE", "DELETE")
+# Номер первого пользователя драйвера (прогревочный - на единицу меньше)
+FIRST_USER_ID = 5_000_000
+
+
+def rss_mb() -> float:
+    """Текущий RSS процесса (МБ)"""
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class ErrorCounter(logging.Handler):
+    """Считает записи ERROR и выше, в том числе про блокировку SQLite"""
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.errors = 0
+        self.locked = 0
+
+    def emit(self, record: logging.LogRecord):
+        self.errors += 1
+        if "locked" in record.getMessage():
+            self.locked += 1
+
+
+class Driver:
+    """Пользователи, которые ходят по сценарию и ждут ответа бота на каждый шаг"""
+
+    def __init__(self, api: FakeBotAPI, think: float, checkins: int, reply_timeout: float):
+        from keyboards.keyboards import (
+            BTN_QUIT_HABIT, BTN_GAIN_HABIT, BTN_DONE, BTN_NOT_DONE, BTN_RESISTED, BTN_NOT_RESISTED,
+            BTN_STATISTICS, BTN_CHANGE_HABIT, BTN_CONFIRM_CHANGE, BTN_CURRENT_HABIT,
+            NEGATIVE_HABITS, POSITIVE_HABITS
+        )
+        from utils.texts import TEXTS
+
+        self.api = api
+        self.think = think
+        self.checkins = checkins
+        self.reply_timeout = reply_timeout
+        self.buttons = {
+            'quit': BTN_QUIT_HABIT, 'gain': BTN_GAIN_HABIT, 'statistics': BTN_STATISTICS,
+            'change': BTN_CHANGE_HABIT, 'confirm': BTN_CONFIRM_CHANGE, 'current': BTN_CURRENT_HABIT,
+        }
+        self.checks = {'negative': (BTN_RESISTED, BTN_NOT_RESISTED), 'positive': (BTN_DONE, BTN_NOT_DONE)}
+        self.habits = {'negative': NEGATIVE_HABITS, 'positive': POSITIVE_HABITS}
+        # Напоминания приходят сами по себе и не являются ответом на шаг
+        self.reminder_prefixes = tuple(
+            template.split("{")[0] for name, template in TEXTS.items()
+            if name.startswith(("reminder_", "demo_", "morning_", "evening_"))
+        )
+
+        self.latencies = defaultdict(list)
+        self.timeouts = defaultdict(int)
+        self.completed_users = 0
+
+    def _is_reply(self, payload: dict) -> bool:
+        return not payload.get("text", "").startswith(self.reminder_prefixes)
+
+    async def step(self, user_id: int, handler: str, text: str):
+        reply = self.api.expect_message(user_id, self._is_reply)
+        started = time.perf_counter()
+        self.api.push_update(message_update(user_id, text))
+        try:
+            await asyncio.wait_for(reply, self.reply_timeout)
+        except asyncio.TimeoutError:
+            self.timeouts[handler] += 1
+            return
+        self.latencies[handler].append(time.perf_counter() - started)
+        if self.think:
+            await asyncio.sleep(random.expovariate(1 / self.think))
+
+    async def choose_habit(self, user_id: int) -> str:
+        habit_type = random.choice(("negative", "positive"))
+        await self.step(user_id, "process_habit_type", self.buttons['quit' if habit_type == "negative" else 'gain'])
+        await self.step(user_id, f"process_{habit_type}_habit", random.choice(self.habits[habit_type]))
+        return habit_type
+
+    async def user(self, user_id: int):
+        await self.step(user_id, "cmd_start", "/start")
+        habit_type = await self.choose_habit(user_id)
+        for _ in range(self.checkins):
+            await self.step(user_id, "process_daily_check", random.choice(self.checks[habit_type]))
+        await self.step(user_id, "show_statistics", self.buttons['statistics'])
+        await self.step(user_id, "change_habit_start", self.buttons['change'])
+        await self.step(user_id, "confirm_habit_change", self.buttons['confirm'])
+        habit_type = await self.choose_habit(user_id)
+        await self.step(user_id, "process_daily_check", random.choice(self.checks[habit_type]))
+        await self.step(user_id, "show_current_habit", self.buttons['current'])
+        self.completed_users += 1
+
+    async def run(self, users: int, rate: float):
+        tasks = []
+        for number in range(users):
+            tasks.append(asyncio.create_task(self.user(FIRST_USER_ID + number)))
+            await asyncio.sleep(random.expovariate(rate))
+        await asyncio.gather(*tasks)
+
+
+def write_snapshot(histogram) -> dict:
+    return {kind: (histogram.count(kind), histogram.total(kind)) for kind in WRITE_STATEMENTS}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон бота")
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--rate", type=float, default=30, help="новых пользователей в секунду")
+    parser.add_argument("--checkins", type=int, default=5)
+    parser.add_argument("--think-ms", type=float, default=50, help="средняя пауза между шагами")
+    parser.add_argument("--latency-ms", type=float, default=0, help="задержка сети в одну сторону")
+    parser.add_argument("--reply-timeout", type=float, default=30)
+    parser.add_argument("--flood-limits", action="store_true", help="включить лимиты Telegram")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="сохранить отчет в файл")
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    tmp = tempfile.mkdtemp(prefix="habit-load-")
+    # Окружение бота задается до импорта bot.py: config читает его при импорте
+    os.environ["BOT_TOKEN"] = FAKE_TOKEN
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(tmp, 'load.db')}"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    # Сценарные пользователи жмут быстрее людей: тот же антифлуд, но с лимитом, которого нагрузка не достигнет
+    os.environ.setdefault("THROTTLE_RATE", "1000000")
+
+    import bot as bot_module
+    from database.checkin_writer import checkin_writer
+    from database.database import db
+    from database.migrations import migrator
+    from services import reminder_service
+    from services.bot_session import PrebuiltMarkupSession
+    from services.send_queue import OutboundQueue, outbound_queue
+    from utils.metrics import DB_QUERY_SECONDS
+
+    errors = ErrorCounter()
+    logging.getLogger().addHandler(errors)
+
+    limits = {} if args.flood_limits else {"global_rate": None, "per_chat_rate": None}
+    api = FakeBotAPI(latency=args.latency_ms / 1000, **limits)
+    await api.start()
+    fake_bot = api.make_bot(session_class=PrebuiltMarkupSession)
+    if args.flood_limits:
+        fake_bot.session.middleware(outbound_queue)
+    else:
+        # Тот же код очереди, но с лимитами, которых нагрузка не достигнет
+        fake_bot.session.middleware(OutboundQueue(global_rate=1e6, global_burst=10**6,
+                                                  per_chat_rate=1e6, per_chat_burst=10**6))
+
+    # То же, что делает bot.main(), только с ботом, смотрящим в FakeBotAPI
+    reminder_service.set_bot(fake_bot)
+    await db.init_models()
+    await migrator.run_migrations()
+    await reminder_service.restore_reminders()
+    checkin_writer.start()
+    bot_module.register_handlers()
+    polling = asyncio.create_task(bot_module.dp.start_polling(fake_bot, handle_signals=False))
+
+    driver = Driver(api, args.think_ms / 1000, args.checkins, args.reply_timeout)
+    # Прогревочный пользователь: импорт, кэши и время пишущих запросов без конкуренции
+    await driver.user(FIRST_USER_ID - 1)
+    driver.latencies.clear()
+    driver.completed_users = 0
+    calibration = write_snapshot(DB_QUERY_SECONDS)
+    rss_before = rss_mb()
+
+    rss_samples = []
+
+    async def sample_memory():
+        while True:
+            rss_samples.append(rss_mb())
+            await asyncio.sleep(0.5)
+
+    sampler = asyncio.create_task(sample_memory())
+    started = time.perf_counter()
+    await driver.run(args.users, args.rate)
+    elapsed = time.perf_counter() - started
+    sampler.cancel()
+    after = write_snapshot(DB_QUERY_SECONDS)
+
+    await bot_module.dp.stop_polling()
+    await polling
+    await checkin_writer.stop()
+    if reminder_service._scheduler_task is not None:
+        reminder_service._scheduler_task.cancel()
+    await api.stop()
+    await db.engine.dispose()
+    shutil.rmtree(tmp, ignore_errors=True)
+
+    # Ожидание блокировки: пишущие запросы под нагрузкой минус их время без конкуренции
+    writes, write_seconds, lock_wait = 0, 0.0, 0.0
+    for kind in WRITE_STATEMENTS:
+        count = after[kind][0] - calibration[kind][0]
+        seconds = after[kind][1] - calibration[kind][1]
+        warm_count, warm_seconds = calibration[kind]
+        baseline = warm_seconds / warm_count if warm_count else 0.0
+        writes += count
+        write_seconds += seconds
+        lock_wait += max(0.0, seconds - count * baseline)
+
+    steps = sum(len(values) for values in driver.latencies.values())
+    report = {
+        "users": args.users,
+        "completed_users": driver.completed_users,
+        "seconds": round(elapsed, 2),
+        "steps": steps,
+        "steps_per_second": round(steps / elapsed, 1),
+        "messages_sent": len(api.outbox),
+        "timeouts": dict(driver.timeouts),
+        "handlers": {
+            handler: {
+                "count": len(values),
+                "p50_ms": round(percentile(values, 0.50) * 1000, 2),
+                "p95_ms": round(percentile(values, 0.95) * 1000, 2),
+                "p99_ms": round(percentile(values, 0.99) * 1000, 2),
+            }
+            for handler, values in sorted(driver.latencies.items())
+        },
+        "db_writes": writes,
+        "db_write_seconds": round(write_seconds, 3),
+        "db_write_p99_ms": round((max(
+            (DB_QUERY_SECONDS.quantile(0.99, kind) or 0) for kind in WRITE_STATEMENTS)) * 1000, 2),
+        "sqlite_lock_wait_seconds": round(lock_wait, 3),
+        "errors": errors.errors,
+        "locked_errors": errors.locked,
+        "rss_mb_before": round(rss_before, 1),
+        "rss_mb_peak": round(max(rss_samples + [rss_before]), 1),
+        "rss_mb_after": round(rss_mb(), 1),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+    print(f"Пользователей: {report['completed_users']}/{args.users} за {report['seconds']} с, "
+          f"шагов {steps} ({report['steps_per_second']}/с), сообщений отправлено {report['messages_sent']}")
+    print(f"{'обработчик':24} {'шагов':>6} {'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9}")
+    for handler, row in report["handlers"].items():
+        print(f"{handler:24} {row['count']:6} {row['p50_ms']:9.1f} {row['p95_ms']:9.1f} {row['p99_ms']:9.1f}")
+    if driver.timeouts:
+        print(f"Без ответа за {args.reply_timeout} с: {dict(driver.timeouts)}")
+    print(f"SQLite: пишущих запросов {writes}, {write_seconds:.2f} с (p99 <= {report['db_write_p99_ms']} мс), "
+          f"ожидание блокировки ~{lock_wait:.2f} с")
+    print(f"Ошибок в логах: {errors.errors} (database is locked: {errors.locked})")
+    print(f"Память (RSS): {report['rss_mb_before']} -> пик {report['rss_mb_peak']} -> {report['rss_mb_after']} МБ "
+          f"(в том числе {len(api.outbox)} записанных сообщений FakeBotAPI)")
+
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump(report, output, ensure_ascii=False, indent=2)
+    return 0 if not driver.timeouts and not errors.errors else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
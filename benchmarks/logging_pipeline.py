@@ -0,0 +1,135 @@
+"""
+Время цикла событий, которое съедает логирование
+
+Каждое "обновление" пишет столько же строк, сколько раньше писали cmd_start
+и add_habit_log_simple (четыре строки), а "напоминание" - строку
+"напоминание отправлено". Сравниваются:
+
+- print    - print() в stdout, как было в обработчиках;
+- stream   - синхронный StreamHandler, как в reminder_service;
+- очередь  - utils/log_pipeline: QueueHandler + QueueListener с политиками.
+
+Вывод идет в файл или в "медленный" приемник, который тратит --sink-delay-ms
+на каждую запись (заполненный канал docker/journald, медленный диск).
+Замеряется время, проведенное в потоке цикла событий, и его максимальная
+задержка (насколько опаздывает asyncio.sleep(0.001) соседней корутины).
+
+Запуск: python -m benchmarks.logging_pipeline [--updates 5000 --sink-delay-ms 0.2]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import logging
+import os
+import tempfile
+import time
+
+from utils.log_pipeline import setup_logging, stop_logging
+
+
+class SlowSink(io.TextIOBase):
+    """Файл, каждая запись в который занимает delay секунд"""
+
+    def __init__(self, target, delay: float):
+        self.target = target
+        self.delay = delay
+        self.lines = 0
+
+    def write(self, text: str) -> int:
+        if self.delay:
+            time.sleep(self.delay)
+        self.lines += text.count("\n")
+        return self.target.write(text)
+
+    def flush(self):
+        self.target.flush()
+
+
+async def lag_probe(stop: asyncio.Event, lags: list):
+    """Насколько позже положенного просыпается корутина, спящая 1 мс"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lags.append(time.perf_counter() - started - 0.001)
+
+
+async def workload(updates: int, write_update, write_reminder) -> float:
+    """Секунд в потоке цикла событий на логирование"""
+    spent = 0.0
+    for n in range(updates):
+        started = time.perf_counter()
+        write_update(n)
+        for reminder in range(4):
+            write_reminder(n * 4 + reminder)
+        spent += time.perf_counter() - started
+        await asyncio.sleep(0)
+    return spent
+
+
+async def run(name: str, updates: int, write_update, write_reminder):
+    stop, lags = asyncio.Event(), []
+    probe = asyncio.create_task(lag_probe(stop, lags))
+    spent = await workload(updates, write_update, write_reminder)
+    stop.set()
+    await probe
+    lags.sort()
+    print(f"{name:8} {spent / updates * 1e6:8.1f} мкс цикла событий/обновление, "
+          f"задержка цикла p99 {lags[int(len(lags) * 0.99)] * 1000:6.2f} мс, max {lags[-1] * 1000:6.2f} мс")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк конвейера логирования")
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--sink-delay-ms", type=float, default=0.2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for delay in (0.0, args.sink_delay_ms / 1000):
+            print(f"Приемник: {'файл' if not delay else f'файл + {delay * 1000:.1f} мс на запись'}")
+            with open(os.path.join(tmp, "print.log"), "w") as target:
+                sink = SlowSink(target, delay)
+
+                def print_update(n):
+                    print(f"✅ Пользователь создан/получен: {n} (изменен: False)", file=sink)
+                    print(f"✅ Привычка получена: {n}", file=sink)
+                    print(f"📝 Добавление лога для {n}: Курение, успех=True", file=sink)
+                    print(f"📊 Серия обновлена: {n % 40} дней", file=sink)
+
+                def print_reminder(n):
+                    print(f"✅ Напоминание отправлено пользователю {n} (negative), отправка №1", file=sink)
+
+                await run("print", args.updates, print_update, print_reminder)
+
+            with open(os.path.join(tmp, "stream.log"), "w") as target:
+                sink = SlowSink(target, delay)
+                root = logging.getLogger()
+                for old in root.handlers[:]:
+                    root.removeHandler(old)
+                root.addHandler(logging.StreamHandler(sink))
+                root.setLevel(logging.INFO)
+                updates_log = logging.getLogger("handlers.start_handlers")
+                sent_log = logging.getLogger("services.reminder_service.sent")
+
+                def log_update(n):
+                    for line in ("✅ Пользователь создан/получен", "✅ Привычка получена",
+                                 "📝 Добавление лога", "📊 Серия обновлена"):
+                        updates_log.info(line, extra={'user_id': n})
+
+                def log_reminder(n):
+                    sent_log.info("✅ Напоминание отправлено (negative)", extra={'user_id': n})
+
+                await run("stream", args.updates, log_update, log_reminder)
+
+            with open(os.path.join(tmp, "queue.log"), "w") as target:
+                sink = SlowSink(target, delay)
+                handler = setup_logging(logging.INFO, stream=sink)
+                await run("очередь", args.updates, log_update, log_reminder)
+                stop_logging()
+                print(f"         записано строк: {sink.lines} из {args.updates * 8}, "
+                      f"отброшено при полной очереди: {handler.dropped}")
+
+
+if __name__ == "__main__":
+    with contextlib.suppress(KeyboardInterrupt):
+        asyncio.run(main())
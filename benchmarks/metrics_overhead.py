@@ -0,0 +1,154 @@
+"""
+Накладные расходы метрик на обработку обновления
+
+Одни и те же обновления (нажатия кнопок) проходят через Dispatcher с
+ButtonRoute, а обработчики-заглушки делают по SQL-запросу к user_habits,
+как настоящие обработчики при промахе кэша. Сравниваются:
+
+- без метрик  - без MetricsMiddleware, движок без событий;
+- с метриками - MetricsMiddleware и instrument_engine, как в bot.py.
+
+Считается процессорное время процесса (вместе с потоком aiosqlite): время
+по часам на такой нагрузке плавает на +-5%. Варианты чередуются короткими
+раундами, накладные расходы - медиана отношений соседних замеров.
+
+Отдельно, почти без шума, замеряются сами добавки: MetricsMiddleware на
+обработчиках без работы и событие диалекта на синхронном движке SQLite в
+памяти. В конце выводится, что попало в /metrics.
+
+Запуск: python -m benchmarks.metrics_overhead [--updates 1000 --rounds 40]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import tempfile
+import time
+from types import SimpleNamespace
+
+os.environ.setdefault("BOT_TOKEN", "123456:benchmark")
+
+from aiogram import Bot, Dispatcher
+from sqlalchemy import create_engine, select, text
+
+from benchmarks.routing import make_update
+from database.engine import create_engine_for_profile
+from database.models import Base, UserHabit
+from handlers.routing import ButtonRoute, build_routes, dispatch_button
+from utils.metrics import HANDLER_SECONDS, MetricsMiddleware, instrument_engine, metrics
+
+TEXTS = ["✅ Сделал(а)"] * 6 + ["❌ Нет, не удалось"] * 2 + ["📊 Статистика", "📋 Текущая привычка"]
+
+
+def make_dispatcher(engine, with_metrics: bool) -> Dispatcher:
+    def stub(name):
+        async def handler(message, state=None):
+            if engine is None:
+                return
+            async with engine.connect() as conn:
+                await conn.execute(select(UserHabit).where(UserHabit.user_id == message.from_user.id))
+        handler.__name__ = name
+        return handler
+
+    dp = Dispatcher()
+    if with_metrics:
+        dp.message.middleware(MetricsMiddleware())
+    routes = {key: (stub(handler.__name__), True) for key, (handler, _) in build_routes().items()}
+    dp.message.register(dispatch_button, ButtonRoute(routes))
+    return dp
+
+
+async def measure(dp: Dispatcher, bot: Bot, updates: list) -> float:
+    """Микросекунд процессорного времени на обновление"""
+    started = time.process_time()
+    for update in updates:
+        await dp.feed_update(bot, update)
+    return (time.process_time() - started) / len(updates) * 1e6
+
+
+async def paired(variants: dict, bot: Bot, updates: list, rounds: int) -> dict:
+    results = {name: [] for name in variants}
+    for dp in variants.values():
+        await measure(dp, bot, updates[:500])
+    for round_number in range(rounds):
+        # Порядок меняется каждый раунд, чтобы не давать преимущества второму
+        order = list(variants.items()) if round_number % 2 else list(variants.items())[::-1]
+        for name, dp in order:
+            results[name].append(await measure(dp, bot, updates))
+    return results
+
+
+def overhead(results: dict) -> float:
+    plain, instrumented = results.values()
+    return statistics.median(after / before for before, after in zip(plain, instrumented)) - 1
+
+
+def query_hook_cost(queries: int = 20_000) -> float:
+    """Микросекунд, которые событие диалекта добавляет к одному запросу"""
+    costs = []
+    for instrumented in (False, True):
+        engine = create_engine("sqlite://")
+        if instrumented:
+            instrument_engine(SimpleNamespace(sync_engine=engine))
+        with engine.connect() as conn:
+            statement = text("SELECT 1")
+            conn.execute(statement)
+            started = time.process_time()
+            for _ in range(queries):
+                conn.execute(statement)
+            costs.append((time.process_time() - started) / queries * 1e6)
+        engine.dispose()
+    return costs[1] - costs[0]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Накладные расходы метрик")
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=40)
+    args = parser.parse_args()
+    logging.getLogger("aiogram.event").setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}"
+        plain = create_engine_for_profile(url, "production")
+        async with plain.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.execute(UserHabit.__table__.insert(), [
+                {"user_id": 1_000_000 + n, "current_habit": "Курение", "habit_type": "negative"}
+                for n in range(500)
+            ])
+        instrumented = create_engine_for_profile(url, "production")
+        instrument_engine(instrumented)
+
+        bot = Bot(token="123456:benchmark")
+        updates = [make_update(bot, n, 1_000_000 + n % 500, TEXTS[n % len(TEXTS)]) for n in range(args.updates)]
+        results = await paired({
+            "без метрик": make_dispatcher(plain, False),
+            "с метриками": make_dispatcher(instrumented, True),
+        }, bot, updates, args.rounds)
+        for name, values in results.items():
+            print(f"{name:12} {statistics.median(values):7.1f} мкс CPU/обновление")
+        baseline = statistics.median(results["без метрик"])
+        print(f"Накладные расходы: {overhead(results) * 100:+.1f}% (медиана по {args.rounds} раундам)")
+
+        # Добавки по отдельности: обработчики без работы и синхронный SQLite
+        empty = await paired({
+            "без метрик": make_dispatcher(None, False),
+            "с метриками": make_dispatcher(None, True),
+        }, bot, updates, args.rounds)
+        middleware = statistics.median(empty["с метриками"]) - statistics.median(empty["без метрик"])
+        hook = query_hook_cost()
+        print(f"MetricsMiddleware: {middleware:.1f} мкс/обновление, событие SQL: {hook:.1f} мкс/запрос "
+              f"-> {(middleware + hook) / baseline * 100:.1f}% от обновления с одним запросом")
+        observed = sum(HANDLER_SECONDS.count(name) for name in {h.__name__ for h, _ in build_routes().values()})
+        print(f"Обработчиков учтено в гистограмме: {observed}")
+        print("\n".join(line for line in metrics.render().splitlines() if line.endswith("_count") or "_count{" in line))
+
+        await bot.session.close()
+        await plain.dispose()
+        await instrumented.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
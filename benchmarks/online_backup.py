@@ -0,0 +1,183 @@
+"""
+Онлайн-резервная копия под нагрузкой отметок: backup API против копирования файла
+
+Синтетическая БД (benchmarks/synthetic_db.py) работает в профиле production
+(WAL), половина пользователей отмечается через CheckinWriter с частотой --rate
+в секунду. Под этой нагрузкой сравниваются:
+
+- BackupService.run_once (database/backup.py): время, страниц в секунду,
+  integrity_check копии и задержка отметок против той же нагрузки без копии;
+- shutil.copy2 файла БД, как делал прежний backup_database: время и сколько
+  строк habit_logs в копии против БД - закоммиченное, но еще лежащее в -wal,
+  в копию не попадает;
+- backup API без удерживаемого снимка (соединение-источник в автокоммите):
+  каждая запись между шагами начинает копию заново, считается число
+  перезапусков за --restart-limit секунд.
+
+В конце три копии подряд с BACKUP_KEEP=2 проверяют ротацию.
+
+Запуск: python -m benchmarks.online_backup [--users 20000 --history-days 400 --rate 200]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("BOT_TOKEN", "123456:benchmark")
+
+from benchmarks.synthetic_db import build, user_ids
+from database.backup import BackupService, BACKUP_PAGES, STEP_PAUSE
+from database.checkin_writer import CheckinWriter
+from database.database import SQLiteDatabase
+
+# user_id -> текущая привычка, заполняется после построения БД
+habit_names = {}
+
+
+async def check_ins(writer: CheckinWriter, users, rate: float, stop: asyncio.Event) -> list:
+    """Отмечать users по очереди с частотой rate в секунду, пока не выставлен stop; задержки отметок"""
+    latencies, tasks = [], []
+
+    async def one(user_id: int):
+        started = time.perf_counter()
+        await writer.submit(user_id, habit_names[user_id], True)
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for n, user_id in enumerate(users):
+        if stop.is_set():
+            break
+        tasks.append(asyncio.create_task(one(user_id)))
+        await asyncio.sleep(max(0.0, started + (n + 1) / rate - time.perf_counter()))
+    await asyncio.gather(*tasks)
+    return latencies
+
+
+async def under_load(writer: CheckinWriter, users, rate: float, work) -> tuple:
+    """Выполнить work() под нагрузкой отметок; (результат work, задержки отметок)"""
+    stop = asyncio.Event()
+    load = asyncio.create_task(check_ins(writer, users, rate, stop))
+    try:
+        result = await work()
+    finally:
+        stop.set()
+    return result, await load
+
+
+def describe(latencies: list) -> str:
+    if not latencies:
+        return "отметок не было"
+    latencies = sorted(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    return (f"{len(latencies)} отметок, p50 {statistics.median(latencies) * 1000:.1f} мс, "
+            f"p99 {p99 * 1000:.1f} мс, max {latencies[-1] * 1000:.1f} мс")
+
+
+def count_logs(path: str) -> int:
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT count(*) FROM habit_logs").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def backup_without_snapshot(path: str, target_path: str, limit: float) -> dict:
+    """backup API с автокоммитного соединения: перезапуски копии при записях между шагами"""
+    source = sqlite3.connect(path)
+    target = sqlite3.connect(target_path)
+    state = {'steps': 0, 'restarts': 0, 'last': None, 'finished': False}
+    deadline = time.perf_counter() + limit
+
+    def on_step(status, remaining, total):
+        state['steps'] += 1
+        if state['last'] is not None and remaining > state['last']:
+            state['restarts'] += 1
+        state['last'] = remaining
+        if time.perf_counter() > deadline:
+            raise TimeoutError
+        time.sleep(STEP_PAUSE)
+
+    started = time.perf_counter()
+    try:
+        source.backup(target, pages=BACKUP_PAGES, progress=on_step)
+        state['finished'] = True
+    except TimeoutError:
+        pass
+    finally:
+        target.close()
+        source.close()
+    state['seconds'] = time.perf_counter() - started
+    return state
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Онлайн-резервная копия под нагрузкой отметок")
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--history-days", type=int, default=400)
+    parser.add_argument("--rate", type=float, default=200, help="отметок в секунду во время копий")
+    parser.add_argument("--restart-limit", type=float, default=20, help="секунд на копию без снимка")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        built = await build(path, args.users, args.seed, args.history_days)
+        conn = sqlite3.connect(path)
+        habit_names.update(conn.execute("SELECT user_id, current_habit FROM user_habits"))
+        conn.close()
+        print(f"Пользователей: {built['users']}, логов: {built['logs']}, БД {os.path.getsize(path) / 2**20:.0f} МБ; "
+              f"шаг копии {BACKUP_PAGES} страниц, пауза {STEP_PAUSE * 1000:g} мс")
+
+        database = SQLiteDatabase(f"sqlite+aiosqlite:///{path}", profile="production")
+        writer = CheckinWriter(database)
+        writer.start()
+        # Каждый пользователь отмечается один раз: итератор общий для всех этапов
+        users = iter([user_id for user_id in user_ids(args.users).tolist() if user_id in habit_names][1::2])
+        backup_dir = os.path.join(tmp, "backups")
+        service = BackupService(path, backup_dir, keep=2)
+
+        _, baseline = await under_load(writer, users, args.rate, lambda: asyncio.sleep(3))
+        report, during = await under_load(writer, users, args.rate, service.run_once)
+
+        async def copy_file():
+            started = time.perf_counter()
+            target = os.path.join(tmp, "copy.db")
+            await asyncio.to_thread(shutil.copy2, path, target)
+            seconds = time.perf_counter() - started
+            # Сразу после копии: все, что закоммичено к этому моменту
+            return seconds, await asyncio.to_thread(count_logs, path), await asyncio.to_thread(count_logs, target)
+        (copy_seconds, source_logs, copied_logs), _ = await under_load(writer, users, args.rate, copy_file)
+
+        no_snapshot, _ = await under_load(
+            writer, users, args.rate,
+            lambda: asyncio.to_thread(backup_without_snapshot, path, os.path.join(tmp, "nosnap.db"), args.restart_limit)
+        )
+
+        for _ in range(2):
+            await asyncio.sleep(1.1)  # имена копий с точностью до секунды
+            await service.run_once()
+        kept = sorted(os.listdir(backup_dir))
+        await writer.stop()
+        await database.engine.dispose()
+
+    print(f"Без копии:            {describe(baseline)}")
+    print(f"backup API: {report['pages']} страниц ({report['bytes'] / 2**20:.0f} МБ) за {report['copy_seconds']} с, "
+          f"{report['pages_per_second']} стр/с, {report['steps']} шагов; с integrity_check {report['seconds']} с, "
+          f"проверка: ok")
+    print(f"Отметки во время нее: {describe(during)}")
+    print(f"shutil.copy2: {copy_seconds:.2f} с, в копии логов {copied_logs} из {source_logs} "
+          f"(потеряно {source_logs - copied_logs} из -wal)")
+    state = "закончилась" if no_snapshot['finished'] else "не закончилась"
+    print(f"Без удерживаемого снимка: {no_snapshot['steps']} шагов, {no_snapshot['restarts']} перезапусков, "
+          f"копия {state} за {no_snapshot['seconds']:.1f} с")
+    print(f"Ротация с BACKUP_KEEP=2 после трех копий: {len(kept)} файла {'✅' if len(kept) == 2 else '❌'}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,187 @@
+"""
+Бенчмарк ежедневной рассылки напоминаний по минутным когортам
+
+Синтетическая БД (benchmarks/synthetic_db.py): пользователи равномерно по
+24 часовым поясам, время напоминания - на целый час, поэтому за сутки все
+напоминания приходятся на 24 минуты по UTC, и каждая когорта - около
+1/24 всех привычек. Это худший случай для планировщика.
+
+Сутки прогоняются по виртуальным часам: для каждой минуты с напоминаниями
+вызывается reminder_service.fire_due, как это делает планировщик в ее
+начале, бот-заглушка ничего не отправляет. Замеряется время когорты,
+сколько из него ушло на чтение расписания, его сдвиг и отправку, и
+насколько задерживается цикл событий. После прогона проверяется, что все
+напоминания ушли ровно по разу и перенесены ровно на сутки.
+
+Для сравнения - прежняя схема "задача asyncio на пользователя": память и
+пробуждения за сутки (--legacy-max пользователей).
+
+Запуск: python -m benchmarks.reminder_scheduler [--users 1000000 --legacy-max 100000]
+"""
+import argparse
+import asyncio
+import gc
+import logging
+import os
+import resource
+import sqlite3
+import statistics
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+os.environ.setdefault("BOT_TOKEN", "123456:benchmark")
+
+from benchmarks.synthetic_db import build
+from database.database import SQLiteDatabase
+from services import reminder_service
+
+
+class _NullBot:
+    """Бот-заглушка: ничего не отправляет, только считает вызовы"""
+
+    def __init__(self):
+        self.sent = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent += 1
+
+
+class _Timed:
+    """Обертка метода БД, суммирующая время его вызовов"""
+
+    def __init__(self, method):
+        self.method = method
+        self.seconds = 0.0
+
+    async def __call__(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await self.method(*args, **kwargs)
+        finally:
+            self.seconds += time.perf_counter() - started
+
+
+async def lag_probe(stop: asyncio.Event, lags: list):
+    """Насколько позже положенного просыпается корутина, спящая 1 мс"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lags.append(time.perf_counter() - started - 0.001)
+
+
+def cohorts(path: str) -> list:
+    """(минута UTC в unix time, размер когорты) по возрастанию"""
+    conn = sqlite3.connect(path)
+    rows = conn.execute(
+        "SELECT next_fire_at, count(*) FROM user_habits WHERE next_fire_at IS NOT NULL "
+        "GROUP BY next_fire_at ORDER BY next_fire_at"
+    ).fetchall()
+    conn.close()
+    return [(datetime.fromisoformat(value).replace(tzinfo=timezone.utc).timestamp(), size) for value, size in rows]
+
+
+async def bench_cohorts(path: str) -> dict:
+    db = SQLiteDatabase(f"sqlite+aiosqlite:///{path}", profile="production")
+    # fire_due работает с глобальным db сервиса - подменяем его БД бенчмарка
+    reminder_service.db = db
+    bot = _NullBot()
+    reminder_service.set_bot(bot)
+    read = db.get_due_reminders = _Timed(db.get_due_reminders)
+    write = db.bulk_set_next_fire_at = _Timed(db.bulk_set_next_fire_at)
+
+    schedule = cohorts(path)
+    stop, lags = asyncio.Event(), []
+    probe = asyncio.create_task(lag_probe(stop, lags))
+    durations = []
+    started = time.perf_counter()
+    for minute, size in schedule:
+        cohort_started = time.perf_counter()
+        sent = await reminder_service.fire_due(minute + reminder_service.COHORT_SECONDS, now=minute)
+        durations.append((size, sent, time.perf_counter() - cohort_started))
+    total = time.perf_counter() - started
+    stop.set()
+    await probe
+    await db.engine.dispose()
+
+    lags.sort()
+    moved = cohorts(path)
+    return {
+        'habits': sum(size for _, size in schedule),
+        'sent': bot.sent,
+        'cohorts': durations,
+        'seconds': total,
+        'read': read.seconds,
+        'write': write.seconds,
+        'lag_p99': lags[int(len(lags) * 0.99)] if lags else 0.0,
+        'lag_max': lags[-1] if lags else 0.0,
+        # Все перенесены ровно на сутки: пояса фиксированные, переходов на летнее время нет
+        'exact': [(minute + 86400, size) for minute, size in schedule] == moved,
+    }
+
+
+async def bench_tasks(n: int) -> tuple:
+    """Прежняя схема: отдельная задача с asyncio.sleep до напоминания на каждого пользователя"""
+    async def wait_for_reminder(delay: float):
+        await asyncio.sleep(delay)
+
+    gc.collect()
+    tracemalloc.start()
+    start_mem = tracemalloc.get_traced_memory()[0]
+    tasks = [asyncio.create_task(wait_for_reminder(86400 * user_id / n)) for user_id in range(n)]
+    await asyncio.sleep(0)
+    memory = tracemalloc.get_traced_memory()[0] - start_mem
+    tracemalloc.stop()
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return memory
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк рассылки напоминаний по когортам")
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--legacy-max", type=int, default=100_000,
+                        help="пользователей для схемы с задачей на пользователя (0 - не замерять)")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        built = await build(path, args.users, args.seed, history_days=0)
+        print(f"Пользователей: {built['users']}, БД построена за {built['seconds']} с")
+
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        report = await bench_cohorts(path)
+        rss_growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before
+
+    sizes = [size for size, _, _ in report['cohorts']]
+    seconds = [elapsed for _, _, elapsed in report['cohorts']]
+    biggest = max(report['cohorts'])
+    per_reminder = report['seconds'] / max(report['sent'], 1) * 1e6
+    print(f"Привычек с напоминаниями: {report['habits']}, отправлено за сутки: {report['sent']}, "
+          f"перенесены ровно на сутки: {'да' if report['exact'] else 'НЕТ'}")
+    print(f"Когорт за сутки: {len(sizes)} (из 1440 пробуждений планировщика), "
+          f"размер: медиана {statistics.median(sizes):.0f}, максимум {max(sizes)}")
+    print(f"Самая большая когорта: {biggest[0]} напоминаний за {biggest[2]:.2f} с, "
+          f"медиана по когортам {statistics.median(seconds):.2f} с")
+    print(f"Всего {report['seconds']:.1f} с, {per_reminder:.1f} мкс на напоминание: "
+          f"чтение расписания {report['read'] / report['seconds'] * 100:.0f}%, "
+          f"сдвиг расписания {report['write'] / report['seconds'] * 100:.0f}%, "
+          f"остальное (отправка, расчет времени) "
+          f"{(1 - (report['read'] + report['write']) / report['seconds']) * 100:.0f}%")
+    print(f"Задержка цикла событий: p99 {report['lag_p99'] * 1000:.1f} мс, max {report['lag_max'] * 1000:.1f} мс; "
+          f"рост пикового RSS {rss_growth / 1024:.0f} МБ (вместе с mmap и кэшем страниц SQLite)")
+
+    if args.legacy_max:
+        n = min(args.users, args.legacy_max)
+        memory = await bench_tasks(n)
+        print(f"Задача на пользователя: {n} задач, {memory / 2**20:.1f} МБ "
+              f"(~{memory / n * args.users / 2**20:.0f} МБ на {args.users}), {n} пробуждений в сутки")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
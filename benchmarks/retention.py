@@ -0,0 +1,167 @@
+"""
+Срок хранения habit_logs: архивация старых месяцев под нагрузкой отметок
+
+Синтетическая БД (benchmarks/synthetic_db.py) с --history-days днями истории
+переводится на auto_vacuum=INCREMENTAL (как
+DatabaseMigrator.enable_incremental_vacuum), затем RetentionJob сворачивает все месяцы старше --retention-days. Все это время
+половина пользователей отмечается через CheckinWriter с частотой --rate в
+секунду; задержка отметок сравнивается с такой же нагрузкой без архивации.
+
+Отчет: размер файла до и после, сколько логов ушло в архив и сколько он
+занимает, время пачки. Проверки: статистика (всего успехов и календарь) у
+пользователей, которые не отмечались, не изменилась, а repair_streaks после
+обнуления счетчиков восстанавливает серии всех пользователей ровно такими,
+какими они были, - по месячным итогам и оставшимся логам.
+
+Запуск: python -m benchmarks.retention [--users 20000 --history-days 400 --retention-days 180]
+"""
+import argparse
+import asyncio
+import gzip
+import logging
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("BOT_TOKEN", "123456:benchmark")
+
+from benchmarks.synthetic_db import build, user_ids
+from database.checkin_writer import CheckinWriter
+from database.database import SQLiteDatabase
+from database.retention import RetentionJob, BATCH_ROWS
+from database.streak_repair import repair_streaks
+
+STREAKS = "SELECT user_id, current_streak, best_streak, total_days FROM user_habits ORDER BY user_id"
+# user_id -> текущая привычка, заполняется после построения БД
+habit_names = {}
+
+
+async def check_ins(writer: CheckinWriter, users: list, rate: float, stop: asyncio.Event) -> list:
+    """Отмечать users по очереди с частотой rate в секунду, пока не выставлен stop; задержки отметок"""
+    latencies, tasks = [], []
+
+    async def one(user_id: int):
+        started = time.perf_counter()
+        await writer.submit(user_id, habit_names[user_id], True)
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for n, user_id in enumerate(users):
+        if stop.is_set():
+            break
+        tasks.append(asyncio.create_task(one(user_id)))
+        await asyncio.sleep(max(0.0, started + (n + 1) / rate - time.perf_counter()))
+    await asyncio.gather(*tasks)
+    return latencies
+
+
+def describe(latencies: list) -> str:
+    latencies = sorted(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    return (f"{len(latencies)} отметок, p50 {statistics.median(latencies) * 1000:.1f} мс, "
+            f"p99 {p99 * 1000:.1f} мс, max {latencies[-1] * 1000:.1f} мс")
+
+
+def file_size(path: str) -> float:
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+    return os.path.getsize(path) / 2**20
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Архивация старых логов под нагрузкой отметок")
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--history-days", type=int, default=400)
+    parser.add_argument("--retention-days", type=int, default=180)
+    parser.add_argument("--rate", type=float, default=200, help="отметок в секунду во время архивации")
+    parser.add_argument("--batch-rows", type=int, default=BATCH_ROWS)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        built = await build(path, args.users, args.seed, args.history_days)
+
+        # То же, что пункт 9 меню миграций для существующей БД
+        started = time.perf_counter()
+        conn = sqlite3.connect(path, isolation_level=None)
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        habit_names.update(conn.execute("SELECT user_id, current_habit FROM user_habits"))
+        conn.close()
+        size_before = file_size(path)
+        print(f"Пользователей: {built['users']}, логов: {built['logs']} за {args.history_days} дней, "
+              f"{size_before:.0f} МБ; перевод на auto_vacuum=INCREMENTAL {time.perf_counter() - started:.1f} с")
+
+        database = SQLiteDatabase(f"sqlite+aiosqlite:///{path}", profile="production")
+        writer = CheckinWriter(database)
+        writer.start()
+        job = RetentionJob(database, args.retention_days, os.path.join(tmp, "archive"), args.batch_rows)
+
+        # Отмечаются нечетные пользователи с привычкой, статистика проверяется у четных
+        ids = [user_id for user_id in user_ids(args.users).tolist() if user_id in habit_names]
+        active, quiet = ids[1::2], ids[::2][:1000]
+        stats_before = {user_id: await database.get_habit_stats(user_id) for user_id in quiet}
+
+        # Без архивации - 3 секунды той же нагрузки
+        stop = asyncio.Event()
+        baseline_task = asyncio.create_task(check_ins(writer, active[:len(active) // 2], args.rate, stop))
+        await asyncio.sleep(3)
+        stop.set()
+        baseline = await baseline_task
+
+        stop = asyncio.Event()
+        load = asyncio.create_task(check_ins(writer, active[len(active) // 2:], args.rate, stop))
+        report = await job.run_once()
+        stop.set()
+        during = await load
+        await writer.stop()
+
+        stats_after = {user_id: await database.get_habit_stats(user_id) for user_id in quiet}
+        same_stats = all(
+            (before['total_success'], before['calendar']) == (after['total_success'], after['calendar'])
+            for before, after in ((stats_before[u], stats_after[u]) for u in quiet)
+        )
+
+        conn = sqlite3.connect(path)
+        expected = conn.execute(STREAKS).fetchall()
+        conn.execute("UPDATE user_habits SET current_streak = 0, best_streak = 0, total_days = 0, updated_at = NULL")
+        conn.commit()
+        (logs_left,) = conn.execute("SELECT count(*) FROM habit_logs").fetchone()
+        conn.close()
+        repaired = await repair_streaks(database.engine)
+        conn = sqlite3.connect(path)
+        same_streaks = conn.execute(STREAKS).fetchall() == expected
+        conn.close()
+        await database.engine.dispose()
+        size_after = file_size(path)
+
+        archive_dir = os.path.join(tmp, "archive")
+        files = sorted(os.listdir(archive_dir)) if os.path.isdir(archive_dir) else []
+        archive_bytes = sum(os.path.getsize(os.path.join(archive_dir, name)) for name in files)
+        archived = 0
+        for name in files:
+            with gzip.open(os.path.join(archive_dir, name), "rt", encoding="utf-8") as archive:
+                archived += sum(1 for _ in archive)
+
+    batches = max(report['batches'], 1)
+    print(f"Архивация до {report['cutoff']}: {report['logs']} логов -> {report['summaries']} месячных итогов "
+          f"за {report['seconds']:.1f} с ({report['batches']} пачек, {report['seconds'] / batches * 1000:.0f} мс "
+          f"на пачку вместе с паузой), осталось логов {logs_left}")
+    print(f"Архив: {len(files)} файлов, {archived} строк, {archive_bytes / 2**20:.1f} МБ "
+          f"({archive_bytes / max(archived, 1):.1f} байт на лог)")
+    print(f"Файл БД: {size_before:.0f} МБ -> {size_after:.0f} МБ, incremental_vacuum вернул "
+          f"{report['freed_pages']} страниц")
+    print(f"Отметки без архивации: {describe(baseline)}")
+    print(f"Отметки во время нее:  {describe(during)}")
+    print(f"Статистика {len(quiet)} пользователей не изменилась: {'да' if same_stats else 'НЕТ'}; "
+          f"серии по итогам и логам совпали у всех {len(expected)}: {'да' if same_streaks else 'НЕТ'} "
+          f"(исправлено {repaired['corrected']} после обнуления)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,172 @@
+"""
+Стоимость маршрутизации одного сообщения: цепочка F.text против словаря
+
+"цепочка" - прежний bot.register_handlers: обработчики с фильтрами
+F.text == ... и F.text.in_([...]) плюс фильтры состояний, которые aiogram
+проверяет по очереди (с кнопками настройки напоминаний). "словарь" -
+handlers.routing: один фильтр ButtonRoute. В обеих схемах последними стоят
+обработчики пояса и времени, присланных текстом, как в bot.py.
+Обработчики в обоих случаях заменены заглушками, поэтому измеряется только
+путь Dispatcher.feed_update до обработчика.
+
+Перед замером проверяется, что обе схемы выбирают один и тот же обработчик
+для каждой пары (состояние, текст).
+
+Запуск: python -m benchmarks.routing [--updates 20000]
+"""
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import time
+
+os.environ.setdefault("BOT_TOKEN", "123456:benchmark")
+
+from aiogram import Bot, Dispatcher, F
+from aiogram.filters import Command
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.types import Update
+
+from handlers.routing import ButtonRoute, build_routes, dispatch_button
+from keyboards.keyboards import (
+    MAIN_MENU_LAYOUT, HABIT_TYPE_LAYOUT, NEGATIVE_HABITS_LAYOUT, POSITIVE_HABITS_LAYOUT,
+    DAILY_CHECK_LAYOUT, NEGATIVE_CHECK_LAYOUT, CONFIRMATION_LAYOUT, TIMEZONE_LAYOUT, REMINDER_TIME_LAYOUT,
+    BTN_REMINDERS, layout_buttons
+)
+from utils.states import HabitStates
+
+HANDLERS = [
+    "cmd_start", "cmd_menu", "show_current_habit", "show_statistics", "change_habit_start",
+    "confirm_habit_change", "cancel_habit_change", "go_back", "process_habit_type",
+    "process_negative_habit", "process_positive_habit", "process_daily_check",
+    "reminder_settings_start", "process_timezone", "process_reminder_time",
+]
+STATES = [None, HabitStates.choosing_habit_type, HabitStates.choosing_negative_habit,
+          HabitStates.choosing_positive_habit, HabitStates.confirming_change,
+          HabitStates.choosing_timezone, HabitStates.choosing_reminder_time]
+
+
+def register_typed_settings(dp: Dispatcher, h: dict):
+    """Пояс и время, присланные текстом, - после кнопок, как в bot.py"""
+    dp.message.register(h["process_timezone"], HabitStates.choosing_timezone, F.text)
+    dp.message.register(h["process_reminder_time"], HabitStates.choosing_reminder_time, F.text)
+
+
+def stubs(calls: list) -> dict:
+    def stub(name):
+        async def handler(message, state=None):
+            calls.append(name)
+        handler.__name__ = name
+        return handler
+    return {name: stub(name) for name in HANDLERS}
+
+
+def legacy_dispatcher(h: dict) -> Dispatcher:
+    """Регистрация обработчиков в том виде, в каком она была в bot.py"""
+    dp = Dispatcher()
+    dp.message.register(h["cmd_start"], Command("start"))
+    dp.message.register(h["cmd_menu"], Command("menu"))
+    dp.message.register(h["show_current_habit"], F.text == "📋 Текущая привычка")
+    dp.message.register(h["show_statistics"], F.text == "📊 Статистика")
+    dp.message.register(h["change_habit_start"], F.text == "🔄 Сменить привычку")
+    dp.message.register(h["reminder_settings_start"], F.text == BTN_REMINDERS)
+    dp.message.register(h["confirm_habit_change"], HabitStates.confirming_change, F.text == "✅ Да, сменить")
+    dp.message.register(h["cancel_habit_change"], HabitStates.confirming_change, F.text == "❌ Нет, остаться")
+    dp.message.register(h["go_back"], F.text == "🔙 Назад")
+    dp.message.register(h["process_habit_type"], HabitStates.choosing_habit_type,
+                        F.text.in_(["❌ Отказаться от", "✅ Приобрести"]))
+    dp.message.register(h["process_negative_habit"], HabitStates.choosing_negative_habit,
+                        F.text.in_(["Курение", "Алкоголь", "Телефон допоздна", "Прокрастинация", "Недостаток сна"]))
+    dp.message.register(h["process_positive_habit"], HabitStates.choosing_positive_habit,
+                        F.text.in_(["Зарядка утром", "Медитация", "Пить воду", "Чтение книг", "Режим питания"]))
+    dp.message.register(h["process_daily_check"],
+                        F.text.in_(["✅ Сделал(а)", "❌ Не сделал(а)", "✅ Да, удалось!", "❌ Нет, не удалось"]))
+    register_typed_settings(dp, h)
+    return dp
+
+
+def routed_dispatcher(h: dict) -> Dispatcher:
+    """Текущая регистрация: команды и один ButtonRoute, обработчики - заглушки"""
+    dp = Dispatcher()
+    dp.message.register(h["cmd_start"], Command("start"))
+    dp.message.register(h["cmd_menu"], Command("menu"))
+    routes = {key: (h[handler.__name__], True) for key, (handler, _) in build_routes().items()}
+    dp.message.register(dispatch_button, ButtonRoute(routes))
+    register_typed_settings(dp, h)
+    return dp
+
+
+def make_update(bot: Bot, update_id: int, user_id: int, text: str) -> Update:
+    # Обновление привязано к боту, иначе feed_update пересоздает его на каждом вызове
+    return Update.model_validate({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": 0, "text": text,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Bench"},
+        },
+    }, context={"bot": bot})
+
+
+async def set_state(dp: Dispatcher, bot: Bot, user_id: int, state):
+    key = StorageKey(bot_id=bot.id, chat_id=user_id, user_id=user_id)
+    await dp.storage.set_state(key, state)
+
+
+async def check_equivalence(bot: Bot) -> int:
+    """Обе схемы вызывают один и тот же обработчик (или никакой) для каждой пары"""
+    texts = set()
+    for layout in (MAIN_MENU_LAYOUT, HABIT_TYPE_LAYOUT, NEGATIVE_HABITS_LAYOUT, POSITIVE_HABITS_LAYOUT,
+                   DAILY_CHECK_LAYOUT, NEGATIVE_CHECK_LAYOUT, CONFIRMATION_LAYOUT, TIMEZONE_LAYOUT,
+                   REMINDER_TIME_LAYOUT):
+        texts.update(layout_buttons(layout))
+    texts.update(["/start", "/menu", "привет"])
+
+    legacy_calls, routed_calls = [], []
+    legacy, routed = legacy_dispatcher(stubs(legacy_calls)), routed_dispatcher(stubs(routed_calls))
+    checked = 0
+    for user_id, (state, text) in enumerate(itertools.product(STATES, sorted(texts)), start=1):
+        for dp, calls in ((legacy, legacy_calls), (routed, routed_calls)):
+            await set_state(dp, bot, user_id, state)
+            calls.append(None)
+            await dp.feed_update(bot, make_update(bot, user_id, user_id, text))
+        assert legacy_calls[-2:] == routed_calls[-2:], (state, text, legacy_calls[-2:], routed_calls[-2:])
+        checked += 1
+    return checked
+
+
+async def measure(dp: Dispatcher, bot: Bot, updates: list) -> float:
+    """Микросекунд на обновление"""
+    started = time.perf_counter()
+    for update in updates:
+        await dp.feed_update(bot, update)
+    return (time.perf_counter() - started) / len(updates) * 1e6
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк маршрутизации сообщений")
+    parser.add_argument("--updates", type=int, default=20_000)
+    args = parser.parse_args()
+    # feed_update пишет строку лога на каждое обновление - в замер она не входит
+    logging.getLogger("aiogram.event").setLevel(logging.WARNING)
+
+    bot = Bot(token="123456:benchmark")
+    print(f"Эквивалентность: проверено {await check_equivalence(bot)} пар (состояние, текст)")
+
+    # Самые частые нажатия - ежедневные проверки, они стоят последними в цепочке
+    texts = ["✅ Сделал(а)"] * 6 + ["❌ Нет, не удалось"] * 2 + ["📊 Статистика", "📋 Текущая привычка"]
+    updates = [make_update(bot, n, 1_000_000 + n % 500, texts[n % len(texts)]) for n in range(args.updates)]
+    daily = [make_update(bot, n, 1_000_000 + n % 500, "✅ Да, удалось!") for n in range(args.updates)]
+
+    for name, factory in (("цепочка F.text", legacy_dispatcher), ("словарь", routed_dispatcher)):
+        dp = factory(stubs([]))
+        await measure(dp, bot, updates[:1000])
+        mixed = await measure(dp, bot, updates)
+        last = await measure(dp, bot, daily)
+        print(f"{name:15} смесь нажатий {mixed:6.1f} мкс/обновление, ежедневная проверка {last:6.1f} мкс/обновление")
+    await bot.session.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,129 @@
+"""
+Стоимость подготовки одного исходящего сообщения: процессорное время на send
+
+"по месту" - как раньше: на каждую отправку клавиатура собирается заново
+(ReplyKeyboardMarkup + KeyboardButton с валидацией pydantic), текст - f-строка,
+а AiohttpSession сериализует reply_markup в JSON.
+"готовое" - клавиатура из реестра KEYBOARDS, текст из utils.texts,
+PrebuiltMarkupSession подставляет JSON клавиатуры, посчитанный при импорте.
+
+Замеряется путь без сети: SendMessage(...) + build_form_data, затем то же
+самое целиком через bot.send_message к локальному FakeBotAPI. Перед замером
+проверяется, что поля запроса в обоих вариантах совпадают байт в байт.
+
+Запуск: python -m benchmarks.send_profile [--sends 20000 --profile]
+"""
+import argparse
+import asyncio
+import cProfile
+import os
+import pstats
+import time
+
+os.environ.setdefault("BOT_TOKEN", "123456:benchmark")
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.methods import SendMessage
+from aiogram.types import KeyboardButton, ReplyKeyboardMarkup
+
+from benchmarks.fake_bot_api import FakeBotAPI
+from keyboards.keyboards import DAILY_CHECK_LAYOUT, MAIN_MENU_LAYOUT, get_daily_check_keyboard, get_main_menu_keyboard
+from services.bot_session import PrebuiltMarkupSession
+from utils.texts import render
+
+
+def legacy_keyboard(layout) -> ReplyKeyboardMarkup:
+    """Клавиатура, собираемая при каждом вызове, как до реестра"""
+    return ReplyKeyboardMarkup(
+        keyboard=[[KeyboardButton(text=text) for text in row] for row in layout],
+        resize_keyboard=True
+    )
+
+
+def legacy_message(n: int) -> dict:
+    if n % 2:
+        return {"text": f"Отлично! Ты молодец. Твоя серия: {n % 40} дней подряд!",
+                "reply_markup": legacy_keyboard(MAIN_MENU_LAYOUT)}
+    return {"text": (f"🔔 Напоминание: сегодня ваша цель - день без 'Курение'! Ты справишься! 💪\n"
+                     "⏰ Время: 09:00"),
+            "reply_markup": legacy_keyboard(DAILY_CHECK_LAYOUT)}
+
+
+def prebuilt_message(n: int) -> dict:
+    if n % 2:
+        return {"text": render('check_success', streak=n % 40), "reply_markup": get_main_menu_keyboard()}
+    return {"text": render('reminder_negative', habit="Курение", time="09:00"),
+            "reply_markup": get_daily_check_keyboard()}
+
+
+def form_fields(session, bot: Bot, message: dict) -> list:
+    form = session.build_form_data(bot, SendMessage(chat_id=42, **message))
+    return sorted((options["name"], value) for options, _, value in form._fields)
+
+
+def check_payloads(bot: Bot) -> int:
+    legacy_session, prebuilt_session = AiohttpSession(), PrebuiltMarkupSession()
+    for n in range(4):
+        legacy = form_fields(legacy_session, bot, legacy_message(n))
+        prebuilt = form_fields(prebuilt_session, bot, prebuilt_message(n))
+        assert legacy == prebuilt, (legacy, prebuilt)
+    return 4
+
+
+def measure_build(session, bot: Bot, factory, sends: int) -> float:
+    """Микросекунд процессорного времени на подготовку запроса"""
+    started = time.process_time()
+    for n in range(sends):
+        session.build_form_data(bot, SendMessage(chat_id=42, **factory(n)))
+    return (time.process_time() - started) / sends * 1e6
+
+
+async def measure_send(api: FakeBotAPI, session_class, factory, sends: int) -> float:
+    """Микросекунд процессорного времени на bot.send_message целиком"""
+    bot = api.make_bot(session_class=session_class)
+    try:
+        for n in range(50):
+            await bot.send_message(n, **factory(n))
+        started = time.process_time()
+        for n in range(sends):
+            await bot.send_message(n, **factory(n))
+        return (time.process_time() - started) / sends * 1e6
+    finally:
+        await bot.session.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Профиль подготовки исходящих сообщений")
+    parser.add_argument("--sends", type=int, default=20_000)
+    parser.add_argument("--profile", action="store_true", help="показать горячие функции cProfile")
+    args = parser.parse_args()
+
+    bot = Bot(token="123456:benchmark")
+    print(f"Поля запроса совпадают: проверено {check_payloads(bot)} сообщений")
+
+    variants = (("по месту", AiohttpSession, legacy_message), ("готовое", PrebuiltMarkupSession, prebuilt_message))
+    for name, session_class, factory in variants:
+        session = session_class()
+        measure_build(session, bot, factory, 1000)
+        build = measure_build(session, bot, factory, args.sends)
+        print(f"{name:9} SendMessage + build_form_data: {build:6.1f} мкс CPU/сообщение")
+        if args.profile:
+            profiler = cProfile.Profile()
+            profiler.runcall(measure_build, session, bot, factory, args.sends)
+            pstats.Stats(profiler).sort_stats("tottime").print_stats(8)
+    await bot.session.close()
+
+    api = FakeBotAPI(global_rate=None, per_chat_rate=None)
+    await api.start()
+    try:
+        sends = min(args.sends, 5000)
+        for name, session_class, factory in variants:
+            cpu = await measure_send(api, session_class, factory, sends)
+            print(f"{name:9} bot.send_message целиком:      {cpu:6.1f} мкс CPU/сообщение (вместе с сервером)")
+    finally:
+        await api.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
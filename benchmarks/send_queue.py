@@ -0,0 +1,81 @@
+"""
+Проверка очереди исходящих сообщений против поддельного Bot API с 429
+
+Сценарий: N сообщений разом в несколько чатов. Без очереди часть сообщений
+теряется на 429. С OutboundQueue все доставляются, а наблюдаемая скорость
+не превышает лимитов. Поддельный сервер настроен немного строже очереди,
+чтобы 429 все равно случались и проверялась обработка retry_after.
+
+Запуск: python -m benchmarks.send_queue [--messages 300 --chats 50]
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+from aiogram.exceptions import TelegramRetryAfter
+
+from benchmarks.fake_bot_api import FakeBotAPI
+from services.send_queue import OutboundQueue
+
+
+async def run(messages: int, chats: int, with_queue: bool, server_rate: int):
+    api = FakeBotAPI(global_rate=server_rate, per_chat_rate=1, per_chat_burst=3, retry_after=1)
+    await api.start()
+    bot = api.make_bot()
+    queue = OutboundQueue()
+    if with_queue:
+        bot.session.middleware(queue)
+
+    lost = 0
+
+    async def send(i: int):
+        nonlocal lost
+        try:
+            await bot.send_message(1000 + i % chats, f"Напоминание №{i}")
+        except TelegramRetryAfter:
+            lost += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(send(i) for i in range(messages)))
+    elapsed = time.perf_counter() - started
+
+    stats = queue.stats()
+    result = {
+        'delivered': len(api.outbox),
+        'lost': lost,
+        'server_429': api.rejected,
+        'retried': stats['retried'],
+        'max_global_rate': api.max_rate(),
+        'max_chat_rate': max(api.max_rate(1000 + c) for c in range(chats)),
+        'elapsed': elapsed,
+    }
+    await bot.session.close()
+    await api.stop()
+    return result
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=300)
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--server-rate", type=int, default=25, help="общий лимит поддельного сервера, сообщений/с")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    for with_queue in (False, True):
+        result = await run(args.messages, args.chats, with_queue, args.server_rate)
+        title = "с очередью" if with_queue else "без очереди"
+        print(
+            f"{title:<12} доставлено {result['delivered']}/{args.messages}, потеряно {result['lost']}, "
+            f"429 от сервера {result['server_429']}, повторов {result['retried']}, "
+            f"макс. {result['max_global_rate']} сообщ/с всего и {result['max_chat_rate']} в чат, "
+            f"{result['elapsed']:.1f} с"
+        )
+        if with_queue:
+            assert result['delivered'] == args.messages, "очередь потеряла сообщения"
+            assert result['lost'] == 0
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
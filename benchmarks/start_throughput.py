@@ -0,0 +1,91 @@
+"""
+Пропускная способность /start (get_or_create_user) на базе с 1M пользователей
+
+- "SELECT + commit": прежняя реализация (чтение, затем коммит даже без изменений)
+- "холодный путь": пользователя нет в known_users - чтение без блокировки,
+  UPSERT только если пользователь новый или сменил данные
+- "known_users": повторный /start без изменений - в БД не ходим
+
+Запуск: python -m benchmarks.start_throughput [--users 1000000 --calls 5000]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+os.environ.setdefault("BOT_TOKEN", "123456:benchmark")
+
+from sqlalchemy import select
+
+from database.database import SQLiteDatabase, User
+
+
+def populate(path: str, users: int):
+    """Быстро заполнить таблицу users через синхронный sqlite3"""
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.executemany(
+        "INSERT INTO users (user_id, username, first_name, created_at) VALUES (?, ?, ?, CURRENT_TIMESTAMP)",
+        ((user_id, f"user{user_id}", f"Имя{user_id}") for user_id in range(users))
+    )
+    conn.commit()
+    conn.close()
+
+
+async def legacy_get_or_create(database: SQLiteDatabase, user_id: int, username: str, first_name: str):
+    """Прежняя реализация: SELECT и коммит на каждый /start"""
+    async with database.async_session() as session:
+        user = (await session.execute(select(User).where(User.user_id == user_id))).scalar_one_or_none()
+        if user:
+            if username and user.username != username:
+                user.username = username
+            if first_name and user.first_name != first_name:
+                user.first_name = first_name
+        else:
+            session.add(User(user_id=user_id, username=username, first_name=first_name))
+        await session.commit()
+
+
+async def measure(call, user_ids) -> float:
+    started = time.perf_counter()
+    for user_id in user_ids:
+        await call(user_id, f"user{user_id}", f"Имя{user_id}")
+    return len(user_ids) / (time.perf_counter() - started)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--calls", type=int, default=5000)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "users.db")
+        database = SQLiteDatabase(f"sqlite+aiosqlite:///{path}", profile="production")
+        await database.init_models()
+        # Пул держит соединения открытыми - отпускаем их на время массовой вставки
+        await database.engine.dispose()
+
+        started = time.perf_counter()
+        populate(path, args.users)
+        print(f"{args.users} пользователей созданы за {time.perf_counter() - started:.1f} с")
+
+        rng = random.Random(42)
+        user_ids = [rng.randrange(args.users) for _ in range(args.calls)]
+
+        rate = await measure(lambda *a: legacy_get_or_create(database, *a), user_ids)
+        print(f"SELECT + commit: {rate:8.0f} /start в секунду")
+        rate = await measure(database.get_or_create_user, user_ids)
+        print(f"холодный путь:   {rate:8.0f} /start в секунду")
+        rate = await measure(database.get_or_create_user, user_ids)
+        print(f"known_users:     {rate:8.0f} /start в секунду")
+        await database.engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
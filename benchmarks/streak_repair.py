@@ -0,0 +1,115 @@
+"""
+Пересчет серий из habit_logs: скорость и корректность
+
+Заполняет БД случайной историей отметок, портит счетчики у части
+пользователей и запускает database.streak_repair.repair_streaks. Затем
+сверяет user_habits с эталоном, посчитанным обычным циклом Python, и
+печатает скорость в логах/с и оценку времени на 50M логов.
+
+Запуск: python -m benchmarks.streak_repair [--users 20000 --logs-per-user 100 --chunk-rows 200000]
+"""
+import argparse
+import asyncio
+import os
+import random
+import resource
+import sqlite3
+import tempfile
+from datetime import datetime, timedelta
+
+os.environ.setdefault("BOT_TOKEN", "123456:benchmark")
+
+from database.database import SQLiteDatabase
+from database.streak_repair import repair_streaks
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+def reference(outcomes) -> tuple:
+    """Серии по отметкам одного пользователя обычным циклом: (current, best, total)"""
+    current = best = total = 0
+    for success in outcomes:
+        if success:
+            current += 1
+            total += 1
+            best = max(best, current)
+        else:
+            current = 0
+    return current, best, total
+
+
+def fill(path: str, users: int, logs_per_user: int, corrupt: float, seed: int = 1) -> dict:
+    """История отметок и счетчики: верные у большинства, испорченные у доли corrupt"""
+    rng = random.Random(seed)
+    created = datetime(2024, 1, 1)
+    expected = {}
+    conn = sqlite3.connect(path)
+    habits, logs = [], []
+
+    for user_id in range(1, users + 1):
+        count = rng.randint(0, 2 * logs_per_user)
+        outcomes = [rng.random() < 0.8 for _ in range(count)]
+        expected[user_id] = reference(outcomes)
+        stored = expected[user_id]
+        if rng.random() < corrupt:
+            stored = (rng.randint(0, 50), rng.randint(0, 50), rng.randint(0, 50))
+        habits.append((user_id, "Медитация", "positive", *stored, created.strftime(TIME_FORMAT)))
+        # Старая привычка до created_at не должна влиять на серию
+        logs.append((user_id, "Медитация", True, (created - timedelta(days=1)).strftime(TIME_FORMAT)))
+        for day, success in enumerate(outcomes):
+            logs.append((user_id, "Медитация", success, (created + timedelta(days=day, hours=9)).strftime(TIME_FORMAT)))
+        if len(logs) >= 500_000:
+            conn.executemany("INSERT INTO habit_logs (user_id, habit_name, success, log_date) VALUES (?, ?, ?, ?)", logs)
+            logs.clear()
+
+    conn.executemany("INSERT INTO habit_logs (user_id, habit_name, success, log_date) VALUES (?, ?, ?, ?)", logs)
+    conn.executemany(
+        "INSERT INTO user_habits (user_id, current_habit, habit_type, current_streak, best_streak, total_days, "
+        "created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        [row + (row[-1],) for row in habits]
+    )
+    conn.commit()
+    conn.close()
+    return expected
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк пересчета серий")
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--logs-per-user", type=int, default=100)
+    parser.add_argument("--chunk-rows", type=int, default=200_000)
+    parser.add_argument("--corrupt", type=float, default=0.05)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        database = SQLiteDatabase(f"sqlite+aiosqlite:///{path}", profile="production")
+        await database.init_models()
+        expected = fill(path, args.users, args.logs_per_user, args.corrupt)
+        filled_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+        report = await repair_streaks(database.engine, chunk_rows=args.chunk_rows)
+        await database.engine.dispose()
+
+        conn = sqlite3.connect(path)
+        actual = {
+            user_id: (current, best, total)
+            for user_id, current, best, total in conn.execute(
+                "SELECT user_id, current_streak, best_streak, total_days FROM user_habits"
+            )
+        }
+        conn.close()
+
+    mismatches = sum(1 for user_id, values in expected.items() if actual[user_id] != values)
+    rate = report['logs'] / report['seconds'] if report['seconds'] else 0
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"Пользователей: {len(expected)}, логов: {report['logs']}, кусок: {args.chunk_rows} строк")
+    print(f"Исправлено: {report['corrected']}, расхождений с эталоном после пересчета: {mismatches}")
+    print(f"Время: {report['seconds']} с, {rate:,.0f} логов/с")
+    print(f"Пик памяти: {filled_mb:.0f} МБ после заполнения, {peak_mb:.0f} МБ после пересчета")
+    if rate:
+        print(f"Оценка для 50M логов: {50_000_000 / rate / 60:.1f} мин")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,107 @@
+"""
+Задержка одной отметки и корректность при двойных нажатиях
+
+"read-modify-write" - прежняя схема: коммит лога, затем отдельная сессия
+читает UserHabit, меняет серию в Python и коммитит. "UPDATE RETURNING" -
+SQLiteDatabase.add_habit_log_simple: вставка лога и одно UPDATE ... RETURNING
+в одной транзакции, причем засчитывается только первая отметка за день -
+после двойных нажатий серия должна быть 1.
+
+Запуск: python -m benchmarks.streak_update [--check-ins 500 --taps 50]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import logging
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime
+
+os.environ.setdefault("BOT_TOKEN", "123456:benchmark")
+
+from sqlalchemy import select
+
+from database.database import SQLiteDatabase, UserHabit, HabitLog
+
+
+async def legacy_check_in(database: SQLiteDatabase, user_id: int, success: bool):
+    """Прежняя реализация: три сессии и два коммита на отметку"""
+    async with database.async_session() as session:
+        session.add(HabitLog(user_id=user_id, habit_name="Медитация", success=success, log_date=datetime.now()))
+        await session.commit()
+    async with database.async_session() as session:
+        habit = (await session.execute(select(UserHabit).where(UserHabit.user_id == user_id))).scalar_one()
+        if success:
+            habit.current_streak += 1
+            habit.total_days += 1
+            habit.best_streak = max(habit.best_streak, habit.current_streak)
+        else:
+            habit.current_streak = 0
+        habit.last_log_date = datetime.now()
+        await session.commit()
+        return habit
+
+
+async def new_check_in(database: SQLiteDatabase, user_id: int, success: bool):
+    return await database.add_habit_log_simple(user_id, "Медитация", success)
+
+
+async def make_database(path: str, users: int) -> SQLiteDatabase:
+    database = SQLiteDatabase(f"sqlite+aiosqlite:///{path}", profile="production")
+    await database.init_models()
+    async with database.engine.begin() as conn:
+        await conn.execute(
+            UserHabit.__table__.insert(),
+            [
+                {"user_id": user_id, "current_habit": "Медитация", "habit_type": "positive",
+                 "current_streak": 0, "best_streak": 0, "total_days": 0}
+                for user_id in range(users)
+            ]
+        )
+    return database
+
+
+async def latency(database, check_in, count: int):
+    samples = []
+    for i in range(count):
+        started = time.perf_counter()
+        # Каждая отметка - новый пользователь: повторная за день ничего не пишет
+        await check_in(database, i % 999, True)
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+
+async def double_taps(database, check_in, taps: int):
+    """taps одновременных успешных нажатий одного пользователя -> итоговая серия"""
+    await asyncio.gather(*(check_in(database, 999, True) for _ in range(taps)), return_exceptions=True)
+    async with database.async_session() as session:
+        habit = (await session.execute(select(UserHabit).where(UserHabit.user_id == 999))).scalar_one()
+        return habit.current_streak
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--check-ins", type=int, default=500)
+    parser.add_argument("--taps", type=int, default=50)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()) as quiet:
+        lines = []
+        for title, check_in in (("read-modify-write", legacy_check_in), ("UPDATE RETURNING", new_check_in)):
+            database = await make_database(os.path.join(tmp, f"{check_in.__name__}.db"), 1000)
+            p50, p99 = await latency(database, check_in, args.check_ins)
+            streak = await double_taps(database, check_in, args.taps)
+            await database.engine.dispose()
+            lines.append(f"{title:<18} p50 {p50:6.2f} мс, p99 {p99:6.2f} мс; "
+                         f"{args.taps} одновременных нажатий -> серия {streak}")
+    for line in lines:
+        print(line)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,208 @@
+"""
+Детерминированная синтетическая БД бота для бенчмарков
+
+users, user_habits, habit_logs и habit_daily_rollups за последние
+history_days дней, по умолчанию HISTORY_DAYS (последний день - вчера, чтобы
+отметки во время замеров попадали в новый день). У каждого пользователя своя вовлеченность (доля
+дней с отметкой) и своя успешность; привычка есть у HABIT_SHARE
+пользователей, и история пишется только им. Серии в user_habits посчитаны
+по той же истории.
+
+Часовые пояса пользователей равномерно распределены по ZONES (24 смещения
+UTC), у половины выбрано свое время напоминания из REMINDER_TIMES, у
+остальных - время по умолчанию. next_fire_at у всех привычек - ближайшее
+напоминание по этим настройкам. Настройки берутся из отдельного потока
+случайных чисел, поэтому остальные данные от них не зависят.
+
+Схему создает SQLiteDatabase.init_models, данные пишутся прямым sqlite3
+кусками по CHUNK_USERS пользователей: строки собирает NumPy, вторичные
+индексы habit_logs строятся один раз после загрузки, дневные итоги
+копируются из только что записанных логов внутри SQLite. Одинаковые users
+и seed дают одинаковые строки (даты отсчитываются от сегодняшнего дня).
+
+Отдельно: python -m benchmarks.synthetic_db --users 1000000 --path big.db
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import time
+from datetime import date, datetime, timedelta, timezone
+
+import numpy as np
+
+os.environ.setdefault("BOT_TOKEN", "123456:benchmark")
+
+from database.database import SQLiteDatabase
+from keyboards.keyboards import NEGATIVE_HABITS, POSITIVE_HABITS, REMINDER_TIMES
+from utils.timezones import next_fire_at, parse_reminder_time
+
+# Первый user_id синтетических пользователей (похоже на настоящие id Telegram)
+BASE_USER_ID = 100_000_000
+HISTORY_DAYS = 30
+HABIT_SHARE = 0.8
+CHUNK_USERS = 100_000
+
+HABITS = [(name, "negative") for name in NEGATIVE_HABITS] + [(name, "positive") for name in POSITIVE_HABITS]
+# Часовые пояса пользователей: UTC-11 ... UTC+12
+ZONES = [f"UTC{offset:+03d}:00" for offset in range(-11, 13)]
+# Время напоминания: None - DEFAULT_REMINDER_TIME
+TIMES = [None] * len(REMINDER_TIMES) + [parse_reminder_time(value) for value in REMINDER_TIMES]
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+def user_ids(users: int) -> np.ndarray:
+    return np.arange(BASE_USER_ID, BASE_USER_ID + users, dtype=np.int64)
+
+
+def _streaks(success: np.ndarray, starts: np.ndarray, counts: np.ndarray):
+    """(current, best, total) по отметкам, идущим подряд кусками starts/counts"""
+    index = np.arange(len(success))
+    first = np.zeros(len(success), dtype=bool)
+    first[starts] = True
+    # Позиция перед текущей серией успехов: неудача или начало истории пользователя
+    boundary = np.where(~success, index, np.where(first, index - 1, -1))
+    run = index - np.maximum.accumulate(boundary)
+    current = run[starts + counts - 1]
+    best = np.maximum.reduceat(run, starts)
+    total = np.add.reduceat(success.astype(np.int64), starts)
+    return current, best, total
+
+
+def _drop_log_indexes(conn: sqlite3.Connection) -> list:
+    """Удалить вторичные индексы habit_logs; возвращает их CREATE INDEX"""
+    indexes = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'habit_logs' AND sql IS NOT NULL"
+    ).fetchall()
+    for name, _ in indexes:
+        conn.execute(f"DROP INDEX {name}")
+    return [sql for _, sql in indexes]
+
+
+def _fill_chunk(conn: sqlite3.Connection, rng: np.random.Generator, settings_rng: np.random.Generator,
+                ids: np.ndarray, days: list, created: str, fire_times: dict):
+    count = len(ids)
+    habit = rng.integers(0, len(HABITS), count)
+    has_habit = rng.random(count) < HABIT_SHARE
+    engagement = rng.beta(1.0, 3.0, count).astype(np.float32)
+    skill = rng.beta(5.0, 2.0, count).astype(np.float32)
+    hour = rng.integers(7, 23, count)
+
+    zone = settings_rng.integers(0, len(ZONES), count)
+    reminder = settings_rng.integers(0, len(TIMES), count)
+
+    conn.executemany(
+        "INSERT INTO users (user_id, username, first_name, created_at, timezone, reminder_time) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (
+            (user_id, f"user{user_id}", "Тест", created, ZONES[z], TIMES[t] and TIMES[t].strftime("%H:%M:%S.%f"))
+            for user_id, z, t in zip(ids.tolist(), zone.tolist(), reminder.tolist())
+        )
+    )
+
+    # Матрица пользователь x день: была ли отметка и успешна ли она
+    active = (rng.random((count, len(days)), dtype=np.float32) < engagement[:, None]) & has_habit[:, None]
+    success_all = rng.random((count, len(days)), dtype=np.float32) < skill[:, None]
+    rows, cols = np.nonzero(active)
+    success = success_all[rows, cols]
+
+    names = [name for name, _ in HABITS]
+    log_dates = [f"{day} {h:02d}:00:00.000000" for day in days for h in range(24)]
+    (first_log,) = conn.execute("SELECT coalesce(max(id), 0) FROM habit_logs").fetchone()
+    conn.executemany(
+        "INSERT INTO habit_logs (user_id, habit_name, success, log_date, log_day) VALUES (?, ?, ?, ?, ?)",
+        zip(ids[rows].tolist(), (names[h] for h in habit[rows].tolist()), success.tolist(),
+            (log_dates[c * 24 + h] for c, h in zip(cols.tolist(), hour[rows].tolist())),
+            (days[c] for c in cols.tolist()))
+    )
+    # Одна отметка в день - итог дня совпадает с самой отметкой
+    conn.execute(
+        "INSERT INTO habit_daily_rollups (user_id, habit_name, day, successes, failures) "
+        "SELECT user_id, habit_name, substr(log_date, 1, 10), success, 1 - success FROM habit_logs WHERE id > ?",
+        (first_log,)
+    )
+
+    logged = np.bincount(rows, minlength=count)
+    current = np.zeros(count, dtype=np.int64)
+    best = np.zeros(count, dtype=np.int64)
+    total = np.zeros(count, dtype=np.int64)
+    last_day = np.full(count, -1)
+    with_logs = np.flatnonzero(logged)
+    if len(with_logs):
+        starts = np.concatenate(([0], np.cumsum(logged[with_logs])[:-1]))
+        current[with_logs], best[with_logs], total[with_logs] = _streaks(success, starts, logged[with_logs])
+        last_day[with_logs] = cols[starts + logged[with_logs] - 1]
+
+    conn.executemany(
+        "INSERT INTO user_habits (user_id, current_habit, habit_type, current_streak, best_streak, total_days, "
+        "created_at, updated_at, last_log_date, next_fire_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            (user_id, *HABITS[h], c, b, t, created, created,
+             log_dates[d * 24 + hr] if d >= 0 else None, fire_times[z, r])
+            for user_id, h, c, b, t, d, hr, z, r in zip(
+                ids[has_habit].tolist(), habit[has_habit].tolist(), current[has_habit].tolist(),
+                best[has_habit].tolist(), total[has_habit].tolist(), last_day[has_habit].tolist(),
+                hour[has_habit].tolist(), zone[has_habit].tolist(), reminder[has_habit].tolist()
+            )
+        )
+    )
+    return len(rows)
+
+
+async def build(path: str, users: int, seed: int = 1, history_days: int = HISTORY_DAYS) -> dict:
+    """Создать БД path с users пользователями; возвращает число строк и время"""
+    started = time.perf_counter()
+    database = SQLiteDatabase(f"sqlite+aiosqlite:///{path}", profile="default")
+    await database.init_models()
+    await database.engine.dispose()
+
+    first_day = date.today() - timedelta(days=history_days)
+    days = [(first_day + timedelta(days=n)).isoformat() for n in range(history_days)]
+    created = (datetime.combine(first_day, datetime.min.time()) - timedelta(days=1)).strftime(TIME_FORMAT)
+    # Ближайшее напоминание одинаково у всех с теми же поясом и временем
+    now = time.time()
+    fire_times = {
+        (z, t): datetime.fromtimestamp(next_fire_at(zone, reminder_time, now), timezone.utc).strftime(TIME_FORMAT)
+        for z, zone in enumerate(ZONES) for t, reminder_time in enumerate(TIMES)
+    }
+
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA cache_size=-262144")
+    indexes = _drop_log_indexes(conn)
+
+    rng = np.random.default_rng(seed)
+    settings_rng = np.random.default_rng([seed, 1])
+    ids = user_ids(users)
+    logs = 0
+    for offset in range(0, users, CHUNK_USERS):
+        logs += _fill_chunk(conn, rng, settings_rng, ids[offset:offset + CHUNK_USERS], days, created, fire_times)
+    conn.commit()
+    for sql in indexes:
+        conn.execute(sql)
+    conn.execute("PRAGMA analysis_limit=1000")
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+    return {'users': users, 'logs': logs, 'seconds': round(time.perf_counter() - started, 1)}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Синтетическая БД для бенчмарков")
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--history-days", type=int, default=HISTORY_DAYS)
+    parser.add_argument("--path", default="synthetic.db")
+    args = parser.parse_args()
+    if os.path.exists(args.path):
+        parser.error(f"{args.path} уже существует")
+
+    report = await build(args.path, args.users, args.seed, args.history_days)
+    size_mb = os.path.getsize(args.path) / 1024 / 1024
+    print(f"Пользователей: {report['users']}, логов: {report['logs']}, "
+          f"{report['seconds']} с, {size_mb:.0f} МБ -> {args.path}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
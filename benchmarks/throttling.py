@@ -0,0 +1,207 @@
+"""
+Антифлуд и идемпотентные отметки под нажатиями 100 раз в секунду
+
+Настоящие обработчики, ButtonRoute, писатель отметок и SQLite на временном
+файле; ответы уходят в FakeBotAPI без лимитов. --abusers пользователей
+жмут "✅ Сделал(а)" с частотой --tap-rate в секунду в течение --seconds
+секунд, а --users обычных пользователей за это время по разу отмечаются и
+смотрят статистику. Прогоны:
+
+- без антифлуда - все нажатия доходят до обработчиков, повторы гасит только
+  уникальный индекс (user_id, habit_name, log_day);
+- с антифлудом  - ThrottlingMiddleware (--rate, --burst), как в bot.py.
+
+Флудеры жмут по расписанию, не дожидаясь ответов: если цикл событий не
+успевает, пропущенные нажатия досылаются пачкой, и нагрузка в обоих прогонах
+одна. Для каждого прогона: сколько нажатий дошло до обработчиков, сколько
+отметок и транзакций прошло через писателя, строк habit_logs и ответов,
+серия после флуда (должна быть 1) и задержка обычных пользователей.
+Отдельно - стоимость проверки корзины, память на пользователя и то, что
+записи исчезают сами через два окна.
+
+Запуск: python -m benchmarks.throttling [--abusers 20 --tap-rate 100 --seconds 10 --users 200]
+"""
+import argparse
+import asyncio
+import gc
+import logging
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.fake_bot_api import FAKE_TOKEN, FakeBotAPI
+
+# Первый user_id обычных пользователей каждого прогона (флудеры - следом за ними)
+FIRST_USER_ID = 7_000_000
+
+
+async def run(dp, bot, args, first_user: int) -> dict:
+    from benchmarks.routing import make_update
+    from database.checkin_writer import checkin_writer
+    from keyboards.keyboards import BTN_DONE, BTN_STATISTICS
+    from utils.metrics import HANDLER_SECONDS
+
+    normal = list(range(first_user, first_user + args.users))
+    abusers = list(range(first_user + args.users, first_user + args.users + args.abusers))
+    update_ids = iter(range(first_user * 10, first_user * 11))
+    latencies, tasks = [], []
+    reached_before = HANDLER_SECONDS.count("process_daily_check")
+    written_before, batches_before = checkin_writer.written, checkin_writer.batches
+
+    async def feed(user_id: int, text: str, timed: bool):
+        started = time.perf_counter()
+        await dp.feed_update(bot, make_update(bot, next(update_ids), user_id, text))
+        if timed:
+            latencies.append(time.perf_counter() - started)
+
+    async def abuser(user_id: int, started: float):
+        # Как polling: каждое обновление - отдельная задача, клиент не ждет ответа
+        sent = 0
+        total = int(args.seconds * args.tap_rate)
+        while sent < total:
+            due = min(total, int((time.perf_counter() - started) * args.tap_rate) + 1)
+            for _ in range(due - sent):
+                tasks.append(asyncio.create_task(feed(user_id, BTN_DONE, False)))
+            sent = due
+            await asyncio.sleep(1 / args.tap_rate)
+
+    async def person(user_id: int):
+        await asyncio.sleep(random.uniform(0, args.seconds - 1))
+        await feed(user_id, BTN_DONE, True)
+        await asyncio.sleep(0.5)
+        await feed(user_id, BTN_STATISTICS, True)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(abuser(user_id, started) for user_id in abusers), *(person(user_id) for user_id in normal))
+    await asyncio.gather(*tasks)
+    return {
+        'taps': len(tasks),
+        'reached': HANDLER_SECONDS.count("process_daily_check") - reached_before - len(normal),
+        'written': checkin_writer.written - written_before - len(normal),
+        'batches': checkin_writer.batches - batches_before,
+        'seconds': time.perf_counter() - started,
+        'latencies': latencies,
+        'abusers': abusers,
+    }
+
+
+def report(path: str, title: str, result: dict, api: FakeBotAPI):
+    abusers = result['abusers']
+    first, last = abusers[0], abusers[-1]
+    conn = sqlite3.connect(path)
+    logs = conn.execute("SELECT count(*) FROM habit_logs WHERE user_id BETWEEN ? AND ?", (first, last)).fetchone()[0]
+    streaks = {row[0] for row in conn.execute(
+        "SELECT current_streak FROM user_habits WHERE user_id BETWEEN ? AND ?", (first, last))}
+    conn.close()
+    replies = sum(1 for _, _, chat_id, _ in api.outbox if first <= chat_id <= last)
+    latencies = sorted(result['latencies'])
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{title}: нажатий {result['taps']} за {result['seconds']:.1f} с, "
+          f"дошло до обработчика {result['reached']}, отметок флудеров в писателе {result['written']} "
+          f"(транзакций {result['batches']}), строк habit_logs {logs}, ответов флудерам {replies}, "
+          f"серии флудеров {sorted(streaks)}")
+    print(f"{'':15} обычные пользователи: p50 {statistics.median(latencies) * 1000:.1f} мс, "
+          f"p99 {p99 * 1000:.1f} мс")
+
+
+def bucket_costs(rate: float, burst: int, users: int) -> tuple:
+    """(мкс на проверку, байт на пользователя, пользователей после двух окон)"""
+    from utils.throttling import ThrottlingMiddleware
+
+    throttle = ThrottlingMiddleware(rate, burst)
+    now = time.monotonic()
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for user_id in range(users):
+        throttle.allow(user_id, now)
+    memory = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    # Флуд одного пользователя: проверка и отказ
+    started = time.perf_counter()
+    for _ in range(users):
+        throttle.allow(0, now)
+    per_check = (time.perf_counter() - started) / users * 1e6
+
+    throttle.allow(1, now + throttle.window)
+    throttle.allow(1, now + 2 * throttle.window)
+    return per_check, memory / users, throttle.tracked_users()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Антифлуд и идемпотентные отметки")
+    parser.add_argument("--abusers", type=int, default=20)
+    parser.add_argument("--tap-rate", type=float, default=100, help="нажатий в секунду от одного флудера")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--users", type=int, default=200, help="обычных пользователей")
+    parser.add_argument("--rate", type=float, help="лимит антифлуда (по умолчанию THROTTLE_RATE)")
+    parser.add_argument("--burst", type=int, help="емкость корзины (по умолчанию THROTTLE_BURST)")
+    parser.add_argument("--memory-users", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    tmp = tempfile.mkdtemp(prefix="habit-throttle-")
+    path = os.path.join(tmp, "throttle.db")
+    # config и глобальный db читают окружение при импорте
+    os.environ["BOT_TOKEN"] = FAKE_TOKEN
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{path}"
+    logging.getLogger().setLevel(logging.WARNING)
+
+    from aiogram import Dispatcher
+    from config import THROTTLE_RATE, THROTTLE_BURST
+    from database.checkin_writer import checkin_writer
+    from database.database import db
+    from database.models import UserHabit
+    from handlers.routing import ButtonRoute, build_routes, dispatch_button
+    from services.bot_session import PrebuiltMarkupSession
+    from utils.metrics import MetricsMiddleware
+    from utils.throttling import ThrottlingMiddleware
+
+    rate = args.rate or THROTTLE_RATE
+    burst = args.burst or THROTTLE_BURST
+    await db.init_models()
+    population = args.users + args.abusers
+    async with db.engine.begin() as conn:
+        await conn.execute(UserHabit.__table__.insert(), [
+            {"user_id": FIRST_USER_ID * variant + n, "current_habit": "Медитация", "habit_type": "positive",
+             "current_streak": 0, "best_streak": 0, "total_days": 0}
+            for variant in (1, 2) for n in range(population)
+        ])
+    checkin_writer.start()
+
+    api = FakeBotAPI(global_rate=None, per_chat_rate=None)
+    await api.start()
+    bot = api.make_bot(session_class=PrebuiltMarkupSession)
+    print(f"Флудеров {args.abusers} x {args.tap_rate:.0f} нажатий/с, {args.seconds:.0f} с; "
+          f"обычных пользователей {args.users}; антифлуд {rate:g}/с, подряд {burst}")
+
+    for variant, (title, throttled) in enumerate((("без антифлуда", False), ("с антифлудом", True)), start=1):
+        dp = Dispatcher()
+        if throttled:
+            dp.message.outer_middleware(ThrottlingMiddleware(rate, burst))
+        dp.message.middleware(MetricsMiddleware())
+        dp.message.register(dispatch_button, ButtonRoute(build_routes()))
+        api.outbox.clear()
+        result = await run(dp, bot, args, FIRST_USER_ID * variant)
+        report(path, f"{title:15}", result, api)
+
+    await checkin_writer.stop()
+    await bot.session.close()
+    await api.stop()
+    await db.engine.dispose()
+    shutil.rmtree(tmp, ignore_errors=True)
+
+    per_check, per_user, left = bucket_costs(rate, burst, args.memory_users)
+    print(f"Корзина: {per_check:.2f} мкс на проверку, {per_user:.0f} байт на пользователя "
+          f"({args.memory_users} пользователей), через два окна осталось записей: {left}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,143 @@
+"""
+Задержка обработки обновлений: webhook против long polling
+
+Обе схемы работают против локального FakeBotAPI с одним и тем же
+Dispatcher (обработчик отвечает тем же текстом). Задержка "от края до края" -
+от момента, когда обновление появилось у Telegram (POST на webhook или
+постановка в очередь getUpdates), до получения Bot API ответа sendMessage.
+
+--latency-ms имитирует сеть до Telegram: столько же занимает каждый путь
+запроса или ответа Bot API и доставка POST на webhook. Без нее разница
+показывает только накладные расходы схем; с ней видно, что обновление,
+пришедшее, пока ответ getUpdates в пути, ждет следующего цикла polling.
+
+Запуск: python -m benchmarks.webhook_latency [--updates 2000 --rate 500 --work-ms 2 --latency-ms 20]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+os.environ.setdefault("BOT_TOKEN", "123456:benchmark")
+
+import aiohttp
+from aiogram import Dispatcher, types
+
+from benchmarks.fake_bot_api import FakeBotAPI, message_update
+from services.webhook import WebhookServer, SECRET_HEADER
+
+SECRET = "benchmark-secret"
+
+
+def make_dispatcher(work_ms: float) -> Dispatcher:
+    dp = Dispatcher()
+
+    async def echo(message: types.Message):
+        if work_ms:
+            await asyncio.sleep(work_ms / 1000)
+        await message.answer(message.text)
+
+    dp.message.register(echo)
+    return dp
+
+
+async def wait_delivered(api: FakeBotAPI, count: int, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while len(api.outbox) < count and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+    # Ответы на последние sendMessage еще в пути к боту
+    await asyncio.sleep(api.latency + 0.1)
+
+
+def latencies(api: FakeBotAPI, sent_at: dict) -> list:
+    return [(moment - sent_at[payload["text"]]) * 1000 for moment, _, _, payload in api.outbox if payload["text"] in sent_at]
+
+
+async def run_webhook(args) -> list:
+    api = FakeBotAPI(global_rate=None, per_chat_rate=None, latency=args.latency_ms / 1000)
+    await api.start()
+    bot = api.make_bot()
+    server = WebhookServer(make_dispatcher(args.work_ms), bot, "/webhook", SECRET)
+    await server.start("127.0.0.1", 0)
+    url = f"http://127.0.0.1:{server.port}/webhook"
+    sent_at = {}
+
+    async with aiohttp.ClientSession() as client:
+        async with client.post(url, json=dict(message_update(1, "x"), update_id=0)) as response:
+            assert response.status == 401, "запрос без секрета должен отклоняться"
+
+        async def post(n: int):
+            text = f"ping {n}"
+            update = dict(message_update(1000 + n, text), update_id=n + 1)
+            sent_at[text] = time.monotonic()
+            await asyncio.sleep(args.latency_ms / 1000)
+            async with client.post(url, json=update, headers={SECRET_HEADER: SECRET}) as response:
+                assert response.status == 200, response.status
+
+        posts = []
+        for n in range(args.updates):
+            posts.append(asyncio.create_task(post(n)))
+            await asyncio.sleep(1 / args.rate)
+        await asyncio.gather(*posts)
+
+        await wait_delivered(api, args.updates)
+        async with client.get(f"http://127.0.0.1:{server.port}/health") as response:
+            health = await response.json()
+
+    await server.stop()
+    await bot.session.close()
+    await api.stop()
+    print(f"  /health: {health}")
+    return latencies(api, sent_at)
+
+
+async def run_polling(args) -> list:
+    api = FakeBotAPI(global_rate=None, per_chat_rate=None, latency=args.latency_ms / 1000)
+    await api.start()
+    bot = api.make_bot()
+    dp = make_dispatcher(args.work_ms)
+    polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False, close_bot_session=False))
+    await asyncio.sleep(0.2)
+    sent_at = {}
+
+    for n in range(args.updates):
+        text = f"ping {n}"
+        sent_at[text] = time.monotonic()
+        api.push_update(message_update(1000 + n, text))
+        await asyncio.sleep(1 / args.rate)
+
+    await wait_delivered(api, args.updates)
+    await dp.stop_polling()
+    await polling
+    await bot.session.close()
+    await api.stop()
+    return latencies(api, sent_at)
+
+
+def report(name: str, values: list, expected: int):
+    values.sort()
+    p99 = values[min(len(values) - 1, int(len(values) * 0.99))]
+    print(
+        f"{name:8} доставлено {len(values)}/{expected}  p50 {statistics.median(values):6.1f} мс  "
+        f"p99 {p99:6.1f} мс  max {values[-1]:6.1f} мс"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Webhook против long polling")
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=500, help="обновлений в секунду")
+    parser.add_argument("--work-ms", type=float, default=2, help="время работы обработчика")
+    parser.add_argument("--latency-ms", type=float, default=20, help="задержка сети до Telegram в одну сторону")
+    args = parser.parse_args()
+
+    print(f"{args.updates} обновлений, {args.rate:.0f}/с, обработчик {args.work_ms} мс, сеть {args.latency_ms} мс в одну сторону")
+    webhook = await run_webhook(args)
+    polling = await run_polling(args)
+    report("webhook", webhook, args.updates)
+    report("polling", polling, args.updates)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
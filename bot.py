@@ -3,29 +3,39 @@ import logging
 
 from aiogram import Bot, Dispatcher, F
 from aiogram.filters import Command
-from aiogram.fsm.storage.memory import MemoryStorage
 
-from config import BOT_TOKEN
+from config import BOT_TOKEN, LOG_LEVEL, THROTTLE_RATE, THROTTLE_BURST, RETENTION_DAYS, BACKUP_INTERVAL_HOURS, ADMIN_IDS, METRICS_HOST, METRICS_PORT, BOT_MODE, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_HOST, WEBHOOK_PORT
 from database.database import db
+from database.fsm_storage import SQLiteStorage
 from handlers.start_handlers import cmd_start, cmd_menu
-from handlers.menu_handlers import (
-    show_current_habit, show_statistics, change_habit_start,
-    confirm_habit_change, cancel_habit_change
-)
-from handlers.habit_handlers import (
-    go_back, process_habit_type, process_negative_habit,
-    process_positive_habit, process_daily_check
-)
+from handlers.routing import ButtonRoute, build_routes, dispatch_button
+from handlers.reminder_handlers import process_timezone, process_reminder_time
+from handlers.export_handlers import cmd_export, cmd_export_all
 from utils.states import HabitStates
 
-from services.reminder_service import set_bot
+from database.migrations import migrator
+from database.checkin_writer import checkin_writer
+from database.retention import retention_job
+from database.backup import backup_service
+from services.reminder_service import set_bot, restore_reminders
+from services.charts import chart_renderer
+from services.send_queue import outbound_queue
+from services.webhook import WebhookServer
+from services.bot_session import PrebuiltMarkupSession
+from utils.log_pipeline import setup_logging
+from utils.metrics import MetricsMiddleware, start_metrics_server
+from utils.throttling import ThrottlingMiddleware
 # Настройка логирования
-logging.basicConfig(level=logging.INFO)
+# Вывод логов - в отдельном потоке, цикл событий только кладет записи в очередь
+setup_logging(LOG_LEVEL)
 logger = logging.getLogger(__name__)
 
 # Инициализация бота и диспетчера
-bot = Bot(token=BOT_TOKEN)
-storage = MemoryStorage()
+bot = Bot(token=BOT_TOKEN, session=PrebuiltMarkupSession())
+# Все исходящие запросы идут через общую очередь с лимитами Telegram
+bot.session.middleware(outbound_queue)
+# Состояния FSM переживают перезапуск: хранятся в той же SQLite
+storage = SQLiteStorage(db)
 dp = Dispatcher(storage=storage)
 
 # Устанавливаем бота в сервис напоминаний
@@ -33,33 +43,25 @@ set_bot(bot)
 
 # Регистрация обработчиков
 def register_handlers():
+    # Флуд одного пользователя отбрасывается до фильтров и обработчиков
+    if THROTTLE_RATE > 0:
+        dp.message.outer_middleware(ThrottlingMiddleware(THROTTLE_RATE, THROTTLE_BURST))
+    # Время и ошибки каждого обработчика сообщений
+    dp.message.middleware(MetricsMiddleware())
+
     # Команды
     dp.message.register(cmd_start, Command("start"))
     dp.message.register(cmd_menu, Command("menu"))
+    dp.message.register(cmd_export, Command("export"))
+    # Выгрузка всех пользователей - только админам, у остальных команда молча не срабатывает
+    dp.message.register(cmd_export_all, Command("export_all"), F.from_user.id.in_(ADMIN_IDS))
 
-    # Главное меню
-    dp.message.register(show_current_habit, F.text == "📋 Текущая привычка")
-    dp.message.register(show_statistics, F.text == "📊 Статистика")
-    dp.message.register(change_habit_start, F.text == "🔄 Сменить привычку")
-
-    # Смена привычки
-    dp.message.register(confirm_habit_change, HabitStates.confirming_change, F.text == "✅ Да, сменить")
-    dp.message.register(cancel_habit_change, HabitStates.confirming_change, F.text == "❌ Нет, остаться")
-
-    # Навигация
-    dp.message.register(go_back, F.text == "🔙 Назад")
+    # Все кнопки: один фильтр со словарем (состояние, текст) -> обработчик
+    dp.message.register(dispatch_button, ButtonRoute(build_routes()))
 
-    # Выбор привычек
-    dp.message.register(process_habit_type, HabitStates.choosing_habit_type,
-                        F.text.in_(["❌ Отказаться от", "✅ Приобрести"]))
-    dp.message.register(process_negative_habit, HabitStates.choosing_negative_habit,
-                        F.text.in_(["Курение", "Алкоголь", "Телефон допоздна", "Прокрастинация", "Недостаток сна"]))
-    dp.message.register(process_positive_habit, HabitStates.choosing_positive_habit,
-                        F.text.in_(["Зарядка утром", "Медитация", "Пить воду", "Чтение книг", "Режим питания"]))
-
-    # Ежедневные проверки
-    dp.message.register(process_daily_check,
-                        F.text.in_(["✅ Сделал(а)", "❌ Не сделал(а)", "✅ Да, удалось!", "❌ Нет, не удалось"]))
+    # Часовой пояс и время, присланные текстом, а не кнопкой
+    dp.message.register(process_timezone, HabitStates.choosing_timezone, F.text)
+    dp.message.register(process_reminder_time, HabitStates.choosing_reminder_time, F.text)
 
 
 async def main():
@@ -68,13 +70,50 @@ async def main():
     set_bot(bot)
     # Инициализация БД
     await db.init_models()
+    await migrator.run_migrations()
     logger.info("Database initialized")
 
+    # Восстанавливаем расписание напоминаний из БД
+    await restore_reminders()
+
+    # Запускаем писателя ежедневных отметок
+    checkin_writer.start()
+
+    # Раз в сутки сворачиваем логи старше срока хранения
+    if RETENTION_DAYS > 0:
+        retention_job.start()
+
+    # Процессы отрисовки графиков запускаются заранее
+    chart_renderer.start()
+
+    # Онлайн-резервные копии БД по расписанию
+    if BACKUP_INTERVAL_HOURS > 0:
+        backup_service.start()
+
     # Регистрация обработчиков
     register_handlers()
 
+    metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+
     # Запуск бота
-    await dp.start_polling(bot)
+    try:
+        if BOT_MODE == "webhook":
+            server = WebhookServer(dp, bot, WEBHOOK_PATH, WEBHOOK_SECRET)
+            try:
+                await server.serve(WEBHOOK_HOST, WEBHOOK_PORT, f"{WEBHOOK_URL}{WEBHOOK_PATH}" if WEBHOOK_URL else None)
+            finally:
+                await bot.session.close()
+        else:
+            # getUpdates не работает, пока установлен webhook
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
+    finally:
+        await backup_service.stop()
+        await asyncio.to_thread(chart_renderer.stop)
+        await retention_job.stop()
+        await checkin_writer.stop()
+        if metrics_runner:
+            await metrics_runner.cleanup()
 
 
 if __name__ == "__main__":
@@ -6,7 +6,53 @@ load_dotenv()
 # Токен бота
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 
-DATABASE_URL = "sqlite+aiosqlite:///habits.db"
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///habits.db")
+# Профиль движка БД: production, debug (эхо SQL) или default (см. database/engine.py)
+DB_PROFILE = os.getenv("DB_PROFILE", "production")
+
+# Часовой пояс и местное время напоминаний для пользователей, которые их не выбрали
+DEFAULT_TIMEZONE = os.getenv("DEFAULT_TIMEZONE", "Europe/Moscow")
+DEFAULT_REMINDER_TIME = os.getenv("DEFAULT_REMINDER_TIME", "20:00")
+
+# Антифлуд: сообщений в секунду от одного пользователя и сколько можно прислать подряд (THROTTLE_RATE=0 - выключить)
+THROTTLE_RATE = float(os.getenv("THROTTLE_RATE", "2"))
+THROTTLE_BURST = int(os.getenv("THROTTLE_BURST", "10"))
+
+# Срок хранения habit_logs (дни, по умолчанию 0 - хранить все): более старые месяцы
+# сворачиваются в месячные итоги, а сами логи уходят в сжатые архивы ARCHIVE_DIR
+# (см. database/retention.py). Включается только явно: архивация удаляет логи из БД
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "0"))
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+
+# Админы (user_id через запятую): им доступна выгрузка всех логов /export_all в EXPORT_DIR
+ADMIN_IDS = {int(user_id) for user_id in os.getenv("ADMIN_IDS", "").replace(" ", "").split(",") if user_id}
+EXPORT_DIR = os.getenv("EXPORT_DIR", "exports")
+
+# Онлайн-резервные копии БД (см. database/backup.py): каталог, сколько последних копий хранить
+# и как часто снимать (часы, 0 - только вручную)
+BACKUP_DIR = os.getenv("BACKUP_DIR", "backups")
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "7"))
+BACKUP_INTERVAL_HOURS = float(os.getenv("BACKUP_INTERVAL_HOURS", "24"))
+
+# Графики прогресса (см. services/charts.py): процессов отрисовки (0 - по числу ядер) и каталог кэша PNG
+CHART_WORKERS = int(os.getenv("CHART_WORKERS", "0"))
+CHART_DIR = os.getenv("CHART_DIR", "charts")
+
+# Уровень логирования (DEBUG, INFO, WARNING, ...), вывод идет через utils/log_pipeline.py
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+# Локальный адрес GET /metrics (формат Prometheus); METRICS_PORT=0 - не публиковать
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+
+# Режим получения обновлений: polling (по умолчанию) или webhook (см. services/webhook.py)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# Публичный адрес, на который Telegram шлет обновления (без пути); пустой - webhook уже настроен снаружи
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
 
 # Проверка токена
 if not BOT_TOKEN:
@@ -18,4 +64,12 @@ if not BOT_TOKEN:
    BOT_TOKEN=ваш_токен_бота_здесь
 
 3. Получите токен у @BotFather в Telegram
-""")
\ No newline at end of file
+""")
+
+if BOT_MODE == "webhook" and not WEBHOOK_SECRET:
+    raise ValueError("""
+❌ Для BOT_MODE=webhook нужен WEBHOOK_SECRET!
+
+Добавьте в .env строку WEBHOOK_SECRET=случайная_строка (1-256 символов A-Z, a-z, 0-9, _ и -).
+Telegram передает ее в заголовке каждого запроса, и сервер отклоняет чужие запросы.
+""")
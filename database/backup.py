@@ -0,0 +1,223 @@
+"""
+Онлайн-резервные копии БД через backup API SQLite
+
+Копирование файла БД на ходу может захватить страницы разных транзакций и
+не видит того, что еще лежит в -wal. BackupService копирует базу средствами
+самой SQLite (sqlite3_backup) с отдельного соединения aiosqlite: по
+BACKUP_PAGES страниц за шаг, с паузой STEP_PAUSE между шагами. Шаги идут в
+потоке этого соединения, поэтому цикл событий бота в это время свободен.
+
+Перед копированием соединение-источник открывает читающую транзакцию и
+держит ее до конца: все шаги читают один снимок. Без этого любая запись
+между шагами (отметка, напоминание) заставляет SQLite начинать копию заново,
+и под нагрузкой она не заканчивается никогда. В режиме WAL снимок не мешает
+писателям, только откладывает контрольную точку до конца копии.
+
+Копия пишется во временный файл *.<pid>.part, проверяется PRAGMA
+integrity_check, переводится в journal_mode=DELETE (один самодостаточный
+файл) и только потом получает свое имя. Хранятся BACKUP_KEEP последних копий,
+более старые удаляются; самая новая копия остается и при BACKUP_KEEP=0. *.part удаляются, только если не менялись дольше
+STALE_PART_SECONDS: копию в это время может снимать другой процесс (меню
+migrations.py рядом с расписанием бота). Время, страницы и скорость
+копирования пишутся в лог и в метрики.
+
+Отдельно: python -m database.backup
+"""
+import asyncio
+import glob
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+import aiosqlite
+
+from config import BACKUP_DIR, BACKUP_KEEP, BACKUP_INTERVAL_HOURS
+from utils.metrics import BACKUP_SECONDS, BACKUP_PAGES_COPIED, BACKUP_ERRORS
+from .database import db
+
+logger = logging.getLogger(__name__)
+
+# Страниц за шаг sqlite3_backup_step (по 4 КБ) и пауза между шагами (секунды)
+BACKUP_PAGES = 1024
+STEP_PAUSE = 0.005
+# Первая копия через 5 минут после старта бота
+INITIAL_DELAY = 300
+# *.part, не менявшийся столько секунд, брошен упавшим процессом: идущая копия
+# пишет файл на каждом шаге
+STALE_PART_SECONDS = 3600
+
+
+def verify_backup(path: str) -> str:
+    """PRAGMA integrity_check копии ("ok" - копия цела); исправная копия переводится в journal_mode=DELETE"""
+    conn = sqlite3.connect(path)
+    try:
+        result = "\n".join(row[0] for row in conn.execute("PRAGMA integrity_check").fetchall())
+        if result == "ok":
+            conn.execute("PRAGMA journal_mode=DELETE").fetchall()
+        return result
+    finally:
+        conn.close()
+
+
+class BackupService:
+    """Резервные копии по расписанию с проверкой и ротацией"""
+
+    def __init__(self, database_path: str, backup_dir: str = BACKUP_DIR, keep: int = BACKUP_KEEP,
+                 interval_hours: float = BACKUP_INTERVAL_HOURS, pages: int = BACKUP_PAGES,
+                 pause: float = STEP_PAUSE):
+        if keep < 0:
+            raise ValueError(f"Число хранимых копий не может быть отрицательным: {keep}")
+        self.database_path = database_path
+        self.backup_dir = backup_dir
+        self.keep = keep
+        self.interval = interval_hours * 3600
+        self.pages = pages
+        self.pause = pause
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Запустить копирование по расписанию, если оно еще не работает"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановить расписание; прерванная копия удаляется"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        await asyncio.sleep(INITIAL_DELAY)
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                BACKUP_ERRORS.inc()
+                logger.error(f"❌ Ошибка резервного копирования: {e}")
+            await asyncio.sleep(self.interval)
+
+    def _prefix(self) -> str:
+        return os.path.splitext(os.path.basename(self.database_path))[0]
+
+    async def _copy(self, target_path: str) -> dict:
+        """Скопировать БД в target_path по шагам с одного снимка; возвращает шаги и страницы"""
+        progress = {'steps': 0, 'pages': 0}
+        abort = threading.Event()
+
+        def on_step(status, remaining, total):
+            # Вызывается в потоке соединения-источника после каждого шага; исключение прерывает копию
+            if abort.is_set():
+                raise InterruptedError("копирование прервано")
+            progress['steps'] += 1
+            progress['pages'] = total
+            if remaining:
+                time.sleep(self.pause)
+
+        source = await aiosqlite.connect(self.database_path)
+        target = sqlite3.connect(target_path, check_same_thread=False)
+        try:
+            await source.execute("BEGIN")
+            await (await source.execute("SELECT count(*) FROM sqlite_master")).fetchall()
+            copy = asyncio.ensure_future(source.backup(target, pages=self.pages, progress=on_step))
+            try:
+                await asyncio.shield(copy)
+            except asyncio.CancelledError:
+                # Закрывать target можно только после того, как поток закончит шаг
+                abort.set()
+                await asyncio.gather(copy, return_exceptions=True)
+                raise
+        finally:
+            target.close()
+            await source.rollback()
+            await source.close()
+        return progress
+
+    def rotate(self) -> list:
+        """Удалить копии сверх keep последних (но не новейшую) и брошенные *.part; возвращает удаленные файлы"""
+        pattern = os.path.join(self.backup_dir, f"{self._prefix()}-*.db")
+        # Имена с меткой времени сортируются по времени
+        copies = sorted(glob.glob(pattern))
+        stale = copies[:max(len(copies) - max(self.keep, 1), 0)]
+        abandoned_before = time.time() - STALE_PART_SECONDS
+        for part in glob.glob(pattern + ".*.part"):
+            try:
+                if os.path.getmtime(part) < abandoned_before:
+                    stale.append(part)
+            except FileNotFoundError:
+                pass  # другой процесс закончил копию
+        removed = []
+        for path in stale:
+            try:
+                os.remove(path)
+                removed.append(path)
+            except FileNotFoundError:
+                pass  # удалил другой процесс
+        return removed
+
+    async def run_once(self) -> Optional[dict]:
+        """Снять и проверить копию, затем ротация; возвращает отчет или None, если БД еще нет"""
+        if not os.path.exists(self.database_path):
+            logger.warning(f"⚠️ Файл базы данных {self.database_path} не найден для резервного копирования")
+            return None
+
+        os.makedirs(self.backup_dir, exist_ok=True)
+        await asyncio.to_thread(self.rotate)
+        path = os.path.join(self.backup_dir, f"{self._prefix()}-{datetime.now():%Y%m%d-%H%M%S}.db")
+        # pid в имени: копии двух процессов в одну секунду не пишут в один файл
+        part = f"{path}.{os.getpid()}.part"
+
+        started = time.perf_counter()
+        try:
+            progress = await self._copy(part)
+            copied = time.perf_counter() - started
+            result = await asyncio.to_thread(verify_backup, part)
+        except BaseException:
+            if os.path.exists(part):
+                os.remove(part)
+            raise
+        if result != "ok":
+            os.remove(part)
+            raise RuntimeError(f"копия не прошла integrity_check: {result[:200]}")
+        os.replace(part, path)
+        report = {
+            'path': path,
+            'pages': progress['pages'],
+            'steps': progress['steps'],
+            'bytes': os.path.getsize(path),
+            'copy_seconds': round(copied, 2),
+            'pages_per_second': round(progress['pages'] / copied) if copied > 0 else 0,
+        }
+        report['removed'] = len(await asyncio.to_thread(self.rotate))
+        report['seconds'] = round(time.perf_counter() - started, 2)
+        BACKUP_SECONDS.observe(report['seconds'])
+        BACKUP_PAGES_COPIED.inc(amount=progress['pages'])
+        logger.info(
+            f"💾 Резервная копия {path}: {report['pages']} страниц за {report['copy_seconds']} с "
+            f"({report['pages_per_second']} стр/с, {report['steps']} шагов), проверка и ротация - "
+            f"всего {report['seconds']} с, удалено старых копий: {report['removed']}"
+        )
+        return report
+
+
+# Общая служба копий для bot.py и python -m database.backup
+backup_service = BackupService(db.engine.url.database or "")
+
+
+async def main():
+    logging.basicConfig(level=logging.INFO)
+    report = await backup_service.run_once()
+    if report:
+        print(f"Копия: {report['path']} ({report['pages_per_second']} стр/с)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,135 @@
+"""
+Кэш привычек пользователей
+
+Почти каждый обработчик начинается с db.get_user_habit(user_id). HabitCache -
+ограниченный по размеру LRU-кэш с TTL перед SQLiteDatabase: он хранит строку
+user_habits (или ее отсутствие) и отрисованные по ней тексты меню и
+статистики. Записи в SQLiteDatabase сразу кладут в кэш новую строку, а
+вместе с ней сбрасывают тексты пользователя. TTL ограничивает устаревание,
+если БД меняет кто-то еще (другой процесс, ручные правки).
+"""
+import time
+from array import array
+from collections import OrderedDict
+from typing import Callable, Optional
+
+# Максимум пользователей в кэше и время жизни записи (секунды)
+CACHE_MAX_SIZE = 100_000
+CACHE_TTL = 300
+# Число ячеек таблицы известных пользователей (8 байт на ячейку)
+KNOWN_USERS_SLOTS = 1 << 21
+
+# Маркер промаха: None в кэше означает "у пользователя нет привычки"
+MISSING = object()
+
+
+class HabitCache:
+    """LRU+TTL кэш строк user_habits и отрисованных текстов по user_id"""
+
+    def __init__(self, max_size: int = CACHE_MAX_SIZE, ttl: float = CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        # user_id -> [истекает_в, строка привычки или None, {вид_текста: текст}]
+        self._entries: "OrderedDict[int, list]" = OrderedDict()
+
+        # Строки привычек и тексты считаются отдельно: нажатие "Статистика" с промахом
+        # по тексту читает и строку привычки, и это не два запроса к кэшу одного вида
+        self.hits = 0
+        self.misses = 0
+        self.text_hits = 0
+        self.text_misses = 0
+        self.evictions = 0
+
+    def _entry(self, user_id: int) -> Optional[list]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._entries[user_id]
+            return None
+        self._entries.move_to_end(user_id)
+        return entry
+
+    def get_habit(self, user_id: int):
+        """Строка привычки, None (привычки нет) или MISSING при промахе"""
+        entry = self._entry(user_id)
+        if entry is None:
+            self.misses += 1
+            return MISSING
+        self.hits += 1
+        return entry[1]
+
+    def put_habit(self, user_id: int, habit):
+        """Положить свежую строку привычки; тексты пользователя сбрасываются"""
+        self._entries[user_id] = [time.monotonic() + self.ttl, habit, {}]
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, user_id: int):
+        self._entries.pop(user_id, None)
+
+    def get_text(self, user_id: int, kind: str):
+        """Отрисованный текст вида kind или MISSING при промахе"""
+        entry = self._entry(user_id)
+        if entry is not None and kind in entry[2]:
+            self.text_hits += 1
+            return entry[2][kind]
+        self.text_misses += 1
+        return MISSING
+
+    def put_text(self, user_id: int, kind: str, text: str):
+        """Запомнить текст, если строка привычки пользователя сейчас в кэше"""
+        entry = self._entry(user_id)
+        if entry is not None:
+            entry[2][kind] = text
+
+    def cached_text(self, user_id: int, kind: str, render: Callable[[], str]) -> str:
+        """Отрисованный текст вида kind; render() вызывается только при промахе"""
+        text = self.get_text(user_id, kind)
+        if text is MISSING:
+            text = render()
+            self.put_text(user_id, kind, text)
+        return text
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'text_hits': self.text_hits,
+            'text_misses': self.text_misses,
+            'evictions': self.evictions,
+        }
+
+
+class KnownUsers:
+    """Компактная таблица "пользователь уже записан в БД с такими данными"
+
+    Ячейка user_id % slots хранит 64-битный отпечаток (user_id, username,
+    first_name). Совпадение отпечатка - пользователь есть в БД и его данные не
+    менялись. Коллизия ячеек просто вытесняет старую запись: промах лишь
+    отправляет запрос в БД, поэтому ответ всегда корректен, а память
+    фиксирована (16 МБ на 2M ячеек).
+    """
+
+    def __init__(self, slots: int = KNOWN_USERS_SLOTS):
+        self._slots = array('q', bytes(8 * slots))
+
+    @staticmethod
+    def _fingerprint(user_id: int, username: Optional[str], first_name: Optional[str]) -> int:
+        # 0 означает пустую ячейку
+        return hash((user_id, username, first_name)) or 1
+
+    def contains(self, user_id: int, username: Optional[str], first_name: Optional[str]) -> bool:
+        return self._slots[user_id % len(self._slots)] == self._fingerprint(user_id, username, first_name)
+
+    def add(self, user_id: int, username: Optional[str], first_name: Optional[str]):
+        self._slots[user_id % len(self._slots)] = self._fingerprint(user_id, username, first_name)
+
+    def discard(self, user_id: int):
+        self._slots[user_id % len(self._slots)] = 0
@@ -0,0 +1,120 @@
+"""
+Групповая запись ежедневных отметок
+
+SQLite допускает только одного писателя, поэтому утренний всплеск отметок
+"✅ Сделал(а)" из отдельных коммитов выстраивается в очередь и ловит
+"database is locked". CheckinWriter - единственный писатель отметок: он
+собирает отметки многих пользователей из очереди и сохраняет логи вместе с
+обновлением серий одной транзакцией. Пачка закрывается, когда набралось
+max_batch отметок или первая отметка ждет дольше max_latency секунд.
+Обработчик ждет future со своим результатом. Повторная за день отметка
+привычки не засчитывается (см. SQLiteDatabase.apply_check_ins).
+"""
+import asyncio
+import logging
+from typing import Optional
+
+from .database import db, SQLiteDatabase
+
+logger = logging.getLogger(__name__)
+
+# Максимальный размер пачки и максимальная задержка отметки в очереди (секунды)
+MAX_BATCH = 256
+MAX_LATENCY = 0.02
+
+
+class CheckinWriter:
+    """Единственный писатель отметок с групповым коммитом"""
+
+    def __init__(self, database: SQLiteDatabase, max_batch: int = MAX_BATCH, max_latency: float = MAX_LATENCY):
+        self.database = database
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # Метрики: число транзакций и записанных отметок
+        self.batches = 0
+        self.written = 0
+
+    def start(self):
+        """Запустить корутину писателя, если она еще не работает"""
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Дописать все, что уже в очереди, и остановить писателя"""
+        if self._task is None:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def submit(self, user_id: int, habit_name: str, success: bool):
+        """Поставить отметку в очередь и дождаться пары (обновленная привычка, засчитана ли отметка)"""
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((user_id, habit_name, success, future))
+        return await future
+
+    async def _collect(self) -> list:
+        """Дождаться первой отметки и добрать пачку в пределах max_latency"""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_latency
+
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            try:
+                await self._write(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _write(self, batch: list):
+        check_ins = [(user_id, habit_name, success) for user_id, habit_name, success, _ in batch]
+        try:
+            results = await self.database.apply_check_ins(check_ins)
+        except Exception:
+            # Одна неудачная отметка не должна ронять всю пачку - пишем по одной
+            results = []
+            for check_in in check_ins:
+                try:
+                    results.extend(await self.database.apply_check_ins([check_in]))
+                except Exception as e:
+                    results.append(e)
+
+        self.batches += 1
+        self.written += len(batch)
+        for (_, _, _, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+# Общий писатель отметок для обработчиков
+checkin_writer = CheckinWriter(db)
@@ -1,60 +1,181 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy import Column, Integer, String, BigInteger, DateTime, Boolean, Text, func, and_, or_
-from datetime import datetime, date, timedelta
-from config import DATABASE_URL
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy import Integer, Boolean, Date, Float, String, event, func, and_, or_, update, insert, select, case, bindparam, text
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from config import DATABASE_URL, DB_PROFILE
+from .engine import create_engine_for_profile
+from .cache import HabitCache, KnownUsers, MISSING
+from utils.metrics import instrument_engine
+from utils.timezones import local_time, local_today
+from .models import Base, User, UserHabit, HabitLog, HabitDailyRollup, HabitMonthlySummary
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
-# Базовый класс для моделей
-Base = declarative_base()
-
-class User(Base):
-    """Модель пользователя"""
-    __tablename__ = "users"
-
-    id = Column(Integer, primary_key=True, autoincrement=True)
-    user_id = Column(BigInteger, unique=True, nullable=False)
-    username = Column(String(100))
-    first_name = Column(String(100))
-    created_at = Column(DateTime, default=datetime.utcnow)
-
-class UserHabit(Base):
-    """Модель привычек пользователя"""
-    __tablename__ = "user_habits"
-
-    id = Column(Integer, primary_key=True, autoincrement=True)
-    user_id = Column(BigInteger, nullable=False)
-    current_habit = Column(String(100), nullable=False)
-    habit_type = Column(String(20), nullable=False)  # 'positive' или 'negative'
-    current_streak = Column(Integer, default=0)
-    best_streak = Column(Integer, default=0)
-    total_days = Column(Integer, default=0)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    last_log_date = Column(DateTime)  # Добавляем поле для отслеживания последней записи
-
-class HabitLog(Base):
-    """Модель логов привычек"""
-    __tablename__ = "habit_logs"
-
-    id = Column(Integer, primary_key=True, autoincrement=True)
-    user_id = Column(BigInteger, nullable=False)
-    habit_name = Column(String(100), nullable=False)
-    success = Column(Boolean, nullable=False)
-    log_date = Column(DateTime, default=datetime.utcnow)
+# Сколько последних дней показывать в календаре статистики
+STATS_CALENDAR_DAYS = 30
+
+
+def fold_check_ins(outcomes) -> dict:
+    """Свернуть последовательность отметок одного пользователя в параметры UPDATE
+
+    leading - успехи до первой неудачи, trailing - успехи после последней,
+    run_best - самая длинная серия успехов после первой неудачи.
+    """
+    outcomes = [bool(success) for success in outcomes]
+    successes = sum(outcomes)
+    if all(outcomes):
+        return {'reset': False, 'successes': successes, 'leading': successes, 'run_best': 0, 'trailing': 0}
+
+    leading = outcomes.index(False)
+    run = run_best = 0
+    for success in outcomes[leading:]:
+        run = run + 1 if success else 0
+        run_best = max(run_best, run)
+    return {'reset': True, 'successes': successes, 'leading': leading, 'run_best': run_best, 'trailing': run}
+
+
+# Операторы горячего пути строятся один раз: SQLAlchemy запоминает ключ кэша
+# компиляции в самом объекте, а новый объект на каждой отметке считает его заново
+
+@lru_cache(maxsize=None)
+def streak_update_statement(returning: bool = False):
+    """UPDATE серии с параметрами из fold_check_ins: вся арифметика считается внутри SQLite
+
+    В SET все выражения видят старые значения строки, поэтому одновременные
+    нажатия не теряют обновлений. Параметры: b_user_id, b_log_date, b_updated_at
+    и ключи fold_check_ins с префиксом b_. returning=True - с RETURNING всей строки.
+    """
+    habits = UserHabit.__table__
+    reset = bindparam('b_reset', type_=Boolean)
+    successes = bindparam('b_successes', type_=Integer)
+    stmt = (
+        update(habits)
+        .where(habits.c.user_id == bindparam('b_user_id'))
+        .values(
+            current_streak=case(
+                (reset, bindparam('b_trailing', type_=Integer)),
+                else_=habits.c.current_streak + successes
+            ),
+            total_days=habits.c.total_days + successes,
+            best_streak=func.max(
+                habits.c.best_streak,
+                habits.c.current_streak + bindparam('b_leading', type_=Integer),
+                bindparam('b_run_best', type_=Integer)
+            ),
+            last_log_date=bindparam('b_log_date'),
+            updated_at=bindparam('b_updated_at'),
+        )
+    )
+    return stmt.returning(*habits.c) if returning else stmt
+
+
+def streak_update_params(user_id: int, outcomes, log_date: datetime) -> dict:
+    """Параметры streak_update_statement для отметок одного пользователя"""
+    params = {f'b_{key}': value for key, value in fold_check_ins(outcomes).items()}
+    params.update(b_user_id=user_id, b_log_date=log_date, b_updated_at=datetime.utcnow())
+    return params
+
+
+def local_day(zone_name, timestamp) -> str:
+    """SQL-функция local_day(пояс, unix time): дата ГГГГ-ММ-ДД в поясе пользователя (NULL - пояс по умолчанию)"""
+    return local_time(zone_name, timestamp).date().isoformat()
+
+
+@lru_cache(maxsize=None)
+def check_in_insert_statement():
+    """INSERT лога отметки, который ничего не пишет, если привычка за этот день уже отмечена
+
+    log_day считается в самом INSERT из users.timezone функцией local_day, по
+    параметру b_timestamp: пояс не читается отдельным запросом, а транзакция
+    начинается с записи (в WAL транзакция, начатая с чтения, не может писать,
+    если другой писатель успел закоммитить - SQLITE_BUSY_SNAPSHOT).
+
+    Повтор по уникальному (user_id, habit_name, log_day) пропускается INSERT OR
+    IGNORE; RETURNING отдает только вставленные строки, то есть засчитанные
+    отметки, с их log_day. Не sqlite_insert().on_conflict_do_nothing(): такой
+    оператор SQLAlchemy не кэширует и компилирует заново на каждой отметке.
+    """
+    logs = HabitLog.__table__
+    users = User.__table__.c
+    return (
+        insert(logs)
+        .prefix_with("OR IGNORE")
+        .values(
+            log_day=func.local_day(
+                select(users.timezone).where(users.user_id == bindparam('b_user_id')).scalar_subquery(),
+                bindparam('b_timestamp', type_=Float),
+                type_=String,
+            )
+        )
+        .returning(logs.c.user_id, logs.c.habit_name, logs.c.log_day)
+    )
+
+
+# text(), а не sqlite_insert().on_conflict_do_update(): тот SQLAlchemy не кэширует
+ROLLUP_UPSERT = text(
+    "INSERT INTO habit_daily_rollups (user_id, habit_name, day, successes, failures) "
+    "VALUES (:user_id, :habit_name, :day, :successes, :failures) "
+    "ON CONFLICT (user_id, habit_name, day) DO UPDATE SET "
+    "successes = successes + excluded.successes, failures = failures + excluded.failures"
+).bindparams(bindparam('day', type_=Date))
+
+
+def rollup_upsert_statement():
+    """INSERT ... ON CONFLICT для habit_daily_rollups: прибавляет счетчики к итогам дня"""
+    return ROLLUP_UPSERT
+
+
+def rollup_rows(check_ins) -> list:
+    """Свернуть отметки (user_id, habit_name, success, день) в строки итогов дня"""
+    totals = {}
+    for user_id, habit_name, success, day in check_ins:
+        counts = totals.setdefault((user_id, habit_name, day), [0, 0])
+        counts[0 if success else 1] += 1
+    return [
+        {'user_id': user_id, 'habit_name': habit_name, 'day': day, 'successes': successes, 'failures': failures}
+        for (user_id, habit_name, day), (successes, failures) in totals.items()
+    ]
+
+
+def rollup_backfill_statement(by_log_day: bool = True):
+    """INSERT ... SELECT дневных итогов из habit_logs (для пустой habit_daily_rollups)
+
+    День берется из log_day - дня отметки, как его видел пользователь; log_date
+    хранится в UTC и может приходиться на соседнюю дату. by_log_day=False - для
+    схем до v8, где log_day еще нет, а log_date было местным временем сервера.
+    """
+    logs = HabitLog.__table__.c
+    day = logs.log_day if by_log_day else func.date(logs.log_date)
+    return insert(HabitDailyRollup.__table__).from_select(
+        ['user_id', 'habit_name', 'day', 'successes', 'failures'],
+        select(
+            logs.user_id, logs.habit_name, day,
+            func.sum(case((logs.success == True, 1), else_=0)),
+            func.sum(case((logs.success == True, 0), else_=1)),
+        )
+        .where(day.is_not(None))
+        .group_by(logs.user_id, logs.habit_name, day)
+    )
+
+
+def _register_functions(dbapi_connection, connection_record):
+    dbapi_connection.create_function("local_day", 2, local_day)
+
 
 class SQLiteDatabase:
     """Класс для работы с SQLite"""
 
-    def __init__(self):
-        # Создаем асинхронный движок для SQLite
-        self.engine = create_async_engine(
-            DATABASE_URL,
-            echo=True,  # ВКЛЮЧАЕМ логи SQL запросов для отладки
-            connect_args={"check_same_thread": False}  # Для SQLite
-        )
+    def __init__(self, database_url: str = DATABASE_URL, profile: str = DB_PROFILE):
+        # Создаем асинхронный движок для SQLite с настройками профиля
+        self.engine = create_engine_for_profile(database_url, profile)
+        # Время каждого SQL-запроса по типу оператора (utils/metrics.py)
+        instrument_engine(self.engine)
+        # local_day для check_in_insert_statement - в каждом соединении
+        event.listen(self.engine.sync_engine, "connect", _register_functions)
 
         # Создаем фабрику сессий
         self.async_session = sessionmaker(
@@ -63,6 +184,11 @@ class SQLiteDatabase:
             expire_on_commit=False
         )
 
+        # Кэш строк user_habits и текстов меню/статистики
+        self.cache = HabitCache()
+        # Пользователи, уже записанные в БД с текущими username/first_name
+        self.known_users = KnownUsers()
+
     async def init_models(self):
         """Создание всех таблиц в базе данных"""
         try:
@@ -76,39 +202,57 @@ class SQLiteDatabase:
             return False
 
     async def get_or_create_user(self, user_id: int, username: str = None, first_name: str = None):
-        """Получить или создать пользователя"""
-        async with self.async_session() as session:
-            try:
-                from sqlalchemy import select
-                result = await session.execute(
-                    select(User).where(User.user_id == user_id)
+        """Создать пользователя или обновить его данные одним UPSERT
+
+        Пишет в БД только при появлении пользователя или смене username/first_name.
+        Повторный /start с теми же данными обслуживается из known_users без
+        обращения к БД. Возвращает True, если строка была создана или изменена.
+        """
+        if self.known_users.contains(user_id, username, first_name):
+            return False
+
+        users = User.__table__
+        try:
+            # Дешевое чтение без блокировки на запись: у известного пользователя
+            # с прежними данными UPSERT и коммит не нужны
+            async with self.engine.connect() as conn:
+                result = await conn.execute(
+                    select(users.c.username, users.c.first_name).where(users.c.user_id == user_id)
                 )
-                user = result.scalar_one_or_none()
-
-                if user:
-                    # Обновляем данные если они изменились
-                    if username and user.username != username:
-                        user.username = username
-                    if first_name and user.first_name != first_name:
-                        user.first_name = first_name
-                    await session.commit()
-                    return user
-                else:
-                    # Создаем нового пользователя
-                    user = User(
-                        user_id=user_id,
-                        username=username,
-                        first_name=first_name
-                    )
-                    session.add(user)
-                    await session.commit()
-                    logger.info(f"✅ Новый пользователь создан: {user_id}")
-                    return user
+                row = result.first()
+            if row is not None and (username or row.username) == row.username \
+                    and (first_name or row.first_name) == row.first_name:
+                self.known_users.add(user_id, username, first_name)
+                return False
+        except Exception as e:
+            logger.error(f"❌ Ошибка при работе с пользователем {user_id}: {e}")
+            raise
+
+        stmt = sqlite_insert(users).values(user_id=user_id, username=username, first_name=first_name)
+        # Пустые значения не затирают сохраненные - как и раньше
+        new_username = func.coalesce(stmt.excluded.username, users.c.username)
+        new_first_name = func.coalesce(stmt.excluded.first_name, users.c.first_name)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[users.c.user_id],
+            set_={'username': new_username, 'first_name': new_first_name},
+            where=or_(
+                users.c.username.is_distinct_from(new_username),
+                users.c.first_name.is_distinct_from(new_first_name)
+            )
+        ).returning(users.c.id)
 
-            except Exception as e:
-                await session.rollback()
-                logger.error(f"❌ Ошибка при работе с пользователем {user_id}: {e}")
-                raise
+        try:
+            async with self.engine.begin() as conn:
+                result = await conn.execute(stmt)
+                changed = result.first() is not None
+        except Exception as e:
+            logger.error(f"❌ Ошибка при работе с пользователем {user_id}: {e}")
+            raise
+
+        self.known_users.add(user_id, username, first_name)
+        if changed:
+            logger.info(f"✅ Пользователь создан/обновлен: {user_id}")
+        return changed
 
     async def get_user(self, user_id: int):
         """Получить пользователя по ID"""
@@ -125,154 +269,361 @@ class SQLiteDatabase:
 
 
     async def get_user_habit(self, user_id: int):
-        """Получить привычку пользователя"""
-        async with self.async_session() as session:
+        """Получить привычку пользователя (строку user_habits) через кэш"""
+        habit = self.cache.get_habit(user_id)
+        if habit is not MISSING:
+            return habit
+
+        async with self.engine.connect() as conn:
             try:
-                from sqlalchemy import select
-                result = await session.execute(
-                    select(UserHabit).where(UserHabit.user_id == user_id)
+                result = await conn.execute(
+                    select(UserHabit.__table__).where(UserHabit.__table__.c.user_id == user_id)
                 )
-                return result.scalar_one_or_none()
+                habit = result.first()
+                self.cache.put_habit(user_id, habit)
+                return habit
             except Exception as e:
                 logger.error(f"❌ Ошибка получения привычки пользователя {user_id}: {e}")
                 return None
 
-    async def create_user_habit(self, user_id: int, habit_name: str, habit_type: str):
-        """Создать или обновить привычку пользователя"""
-        async with self.async_session() as session:
-            try:
+    async def create_user_habit(self, user_id: int, habit_name: str, habit_type: str, next_fire_at: datetime = None):
+        """Создать или обновить привычку пользователя (next_fire_at - первое напоминание, UTC)"""
+        habits = UserHabit.__table__
+        try:
+            async with self.engine.begin() as conn:
                 # Удаляем старую привычку если есть
-                existing_habit = await self.get_user_habit(user_id)
-                if existing_habit:
-                    await session.delete(existing_habit)
+                await conn.execute(habits.delete().where(habits.c.user_id == user_id))
 
                 # Создаем новую привычку
-                habit = UserHabit(
-                    user_id=user_id,
-                    current_habit=habit_name,
-                    habit_type=habit_type,
-                    current_streak=0,
-                    best_streak=0,
-                    total_days=0,
-                    last_log_date=None
+                result = await conn.execute(
+                    insert(habits)
+                    .values(
+                        user_id=user_id,
+                        current_habit=habit_name,
+                        habit_type=habit_type,
+                        current_streak=0,
+                        best_streak=0,
+                        total_days=0,
+                        last_log_date=None,
+                        next_fire_at=next_fire_at
+                    )
+                    .returning(*habits.c)
                 )
-                session.add(habit)
-                await session.commit()
-                logger.info(f"✅ Привычка создана: {user_id} - {habit_name}")
-                return habit
-            except Exception as e:
-                await session.rollback()
-                logger.error(f"❌ Ошибка создания привычки для {user_id}: {e}")
-                raise
+                habit = result.one()
+
+            self.cache.put_habit(user_id, habit)
+            logger.info(f"✅ Привычка создана: {user_id} - {habit_name}")
+            return habit
+        except Exception as e:
+            self.cache.invalidate(user_id)
+            logger.error(f"❌ Ошибка создания привычки для {user_id}: {e}")
+            raise
 
     async def update_habit_streak_simple(self, user_id: int, success: bool):
-        """Упрощенная версия обновления серии - для отладки"""
-        async with self.async_session() as session:
-            try:
-                # Получаем привычку
-                from sqlalchemy import select
-                result = await session.execute(
-                    select(UserHabit).where(UserHabit.user_id == user_id)
+        """Обновить серию одним UPDATE ... RETURNING
+
+        Возвращает строку user_habits после обновления или None, если привычки нет.
+        """
+        try:
+            async with self.engine.begin() as conn:
+                result = await conn.execute(
+                    streak_update_statement(returning=True),
+                    streak_update_params(user_id, [success], datetime.utcnow())
                 )
-                habit = result.scalar_one_or_none()
+                habit = result.one_or_none()
 
-                if not habit:
-                    logger.warning(f"⚠️ Привычка не найдена для пользователя {user_id}")
-                    return None
+            self.cache.put_habit(user_id, habit)
+            if not habit:
+                logger.warning(f"⚠️ Привычка не найдена для пользователя {user_id}")
+                return None
 
-                print(f"🔄 Обновление серии для {user_id}: текущая серия={habit.current_streak}, успех={success}")
+            logger.debug(f"🔄 Серия: {habit.current_streak} дней, успех={success}", extra={'user_id': user_id})
+            return habit
 
-                if success:
-                    # Увеличиваем серию
-                    habit.current_streak += 1
-                    habit.total_days += 1
+        except Exception as e:
+            logger.error(f"❌ Ошибка обновления серии для {user_id}: {e}")
+            return None
 
-                    # Обновляем лучшую серию
-                    if habit.current_streak > habit.best_streak:
-                        habit.best_streak = habit.current_streak
+    async def add_habit_log_simple(self, user_id: int, habit_name: str, success: bool):
+        """Добавить лог и обновить серию в одной транзакции
 
-                    print(f"✅ Серия увеличена: {habit.current_streak} дней")
-                else:
-                    # Сброс серии
-                    habit.current_streak = 0
-                    print(f"🔄 Серия сброшена")
+        Повторная отметка привычки за день ничего не пишет и возвращает текущую строку.
+        """
+        try:
+            logger.debug(f"📝 Добавление лога: {habit_name}, успех={success}", extra={'user_id': user_id})
 
-                # Обновляем дату последнего лога
-                habit.last_log_date = datetime.now()
+            # log_date - в UTC, как created_at и остальные метки времени в models.py;
+            # log_day - дата в часовом поясе пользователя (считает сам INSERT)
+            timestamp = time.time()
+            now = datetime.utcfromtimestamp(timestamp)
+            habits = UserHabit.__table__
+            async with self.engine.begin() as conn:
+                inserted = (await conn.execute(
+                    check_in_insert_statement(),
+                    {'user_id': user_id, 'habit_name': habit_name, 'success': success,
+                     'log_date': now, 'b_user_id': user_id, 'b_timestamp': timestamp}
+                )).first()
+                if inserted:
+                    await conn.execute(
+                        rollup_upsert_statement(), rollup_rows([(user_id, habit_name, success, inserted.log_day)])
+                    )
+                    result = await conn.execute(
+                        streak_update_statement(returning=True),
+                        streak_update_params(user_id, [success], now)
+                    )
+                else:
+                    logger.debug("🔁 Привычка сегодня уже отмечена", extra={'user_id': user_id})
+                    result = await conn.execute(select(habits).where(habits.c.user_id == user_id))
+                updated_habit = result.one_or_none()
+
+            self.cache.put_habit(user_id, updated_habit)
+            if updated_habit:
+                logger.debug(f"📊 Серия обновлена: {updated_habit.current_streak} дней", extra={'user_id': user_id})
+                return updated_habit
+            else:
+                logger.warning("⚠️ Не удалось обновить серию", extra={'user_id': user_id})
+                return None
 
-                await session.commit()
-                return habit
+        except Exception as e:
+            logger.error(f"❌ Ошибка добавления лога для {user_id}: {e}")
+            return None
+
+    async def apply_check_ins(self, check_ins):
+        """Записать пачку отметок одной транзакцией (групповой коммит)
+
+        check_ins - список (user_id, habit_name, success). В счет идет только
+        первая отметка привычки за день: лог вставляется с ON CONFLICT DO
+        NOTHING, а серии и дневные итоги меняются только по вставленным строкам,
+        поэтому повторные нажатия ничего не пишут. UPDATE серий уходят одним
+        executemany. Возвращает пары (строка user_habits после пачки или None,
+        если привычки нет; засчитана ли отметка) в порядке check_ins.
+        """
+        # log_date - в UTC, как created_at и остальные метки времени в models.py;
+        # log_day - дата в часовом поясе пользователя (считает сам INSERT)
+        timestamp = time.time()
+        now = datetime.utcfromtimestamp(timestamp)
+        # Из нескольких отметок одной привычки в пачке засчитать можно только первую
+        first = {}
+        for user_id, habit_name, success in check_ins:
+            first.setdefault((user_id, habit_name), success)
+        users = {user_id for user_id, _ in first}
 
-            except Exception as e:
-                await session.rollback()
-                logger.error(f"❌ Ошибка обновления серии для {user_id}: {e}")
-                return None
+        try:
+            async with self.engine.begin() as conn:
+                result = await conn.execute(
+                    check_in_insert_statement(),
+                    [
+                        {'user_id': user_id, 'habit_name': habit_name, 'success': success,
+                         'log_date': now, 'b_user_id': user_id, 'b_timestamp': timestamp}
+                        for (user_id, habit_name), success in first.items()
+                    ]
+                )
+                inserted = result.all()
+                counted = [(row.user_id, row.habit_name, first[row.user_id, row.habit_name]) for row in inserted]
+                if counted:
+                    outcomes = {}
+                    for user_id, _, success in counted:
+                        outcomes.setdefault(user_id, []).append(success)
+                    await conn.execute(rollup_upsert_statement(), rollup_rows(
+                        (row.user_id, row.habit_name, first[row.user_id, row.habit_name], row.log_day)
+                        for row in inserted
+                    ))
+                    await conn.execute(
+                        streak_update_statement(),
+                        [streak_update_params(user_id, user_outcomes, now) for user_id, user_outcomes in outcomes.items()]
+                    )
+                result = await conn.execute(
+                    select(UserHabit.__table__).where(UserHabit.__table__.c.user_id.in_(users))
+                )
+                habits = {habit.user_id: habit for habit in result}
+
+            for user_id in users:
+                self.cache.put_habit(user_id, habits.get(user_id))
+            pending = {(user_id, habit_name) for user_id, habit_name, _ in counted}
+            results = []
+            for user_id, habit_name, _ in check_ins:
+                key = (user_id, habit_name)
+                results.append((habits.get(user_id), key in pending))
+                pending.discard(key)
+            return results
+        except Exception as e:
+            for user_id in users:
+                self.cache.invalidate(user_id)
+            logger.error(f"❌ Ошибка группового сохранения {len(check_ins)} отметок: {e}")
+            raise
 
+    async def set_next_fire_at(self, user_id: int, next_fire_at: datetime = None):
+        """Записать время следующего напоминания (None - выключить напоминания)
 
-    async def add_habit_log_simple(self, user_id: int, habit_name: str, success: bool):
-        """Упрощенная версия добавления лога - для отладки"""
+        Возвращает id строки привычки или None, если привычки нет.
+        """
         async with self.async_session() as session:
             try:
-                print(f"📝 Добавление лога для {user_id}: {habit_name}, успех={success}")
-
-                # Создаем новый лог
-                log = HabitLog(
-                    user_id=user_id,
-                    habit_name=habit_name,
-                    success=success,
-                    log_date=datetime.now()
+                from sqlalchemy import update
+                result = await session.execute(
+                    update(UserHabit)
+                    .where(UserHabit.user_id == user_id)
+                    .values(next_fire_at=next_fire_at)
+                    .returning(UserHabit.id)
                 )
-                session.add(log)
+                habit_id = result.scalar_one_or_none()
                 await session.commit()
-                print(f"✅ Лог добавлен: {user_id} - {habit_name} - успех={success}")
-
-                # Обновляем серию
-                updated_habit = await self.update_habit_streak_simple(user_id, success)
-
-                if updated_habit:
-                    print(f"📊 Серия обновлена: {updated_habit.current_streak} дней")
-                    return updated_habit
-                else:
-                    print(f"⚠️ Не удалось обновить серию")
-                    return None
-
+                # В кэше строка привычки со старым next_fire_at
+                self.cache.invalidate(user_id)
+                return habit_id
             except Exception as e:
                 await session.rollback()
-                logger.error(f"❌ Ошибка добавления лога для {user_id}: {e}")
+                logger.error(f"❌ Ошибка сохранения расписания для {user_id}: {e}")
                 return None
 
-    async def get_habit_stats(self, user_id: int):
-        """Получить статистику привычки"""
-        async with self.async_session() as session:
-            try:
-                from sqlalchemy import select, func, and_
+    async def bulk_set_next_fire_at(self, items):
+        """Пакетно сдвинуть расписание: items - список пар (id привычки, next_fire_at)"""
+        if not items:
+            return 0
+        try:
+            from sqlalchemy import update, bindparam
+            stmt = (
+                update(UserHabit.__table__)
+                .where(UserHabit.__table__.c.id == bindparam("habit_id"))
+                .values(next_fire_at=bindparam("fire_at"))
+            )
+            async with self.engine.begin() as conn:
+                await conn.execute(
+                    stmt,
+                    [{"habit_id": habit_id, "fire_at": fire_at} for habit_id, fire_at in items]
+                )
+            return len(items)
+        except Exception as e:
+            logger.error(f"❌ Ошибка пакетного сохранения расписания: {e}")
+            return 0
+
+    async def get_due_reminders(self, until: datetime, limit: int = 1000):
+        """Порция напоминаний с next_fire_at < until в порядке (next_fire_at, id)
+
+        Диапазонное чтение по индексу next_fire_at вместе с настройками
+        пользователя из users. Планировщик сдвигает next_fire_at выбранных строк
+        на следующий день, поэтому повторный вызов отдает следующую порцию.
+        """
+        habits = UserHabit.__table__.c
+        users = User.__table__.c
+        try:
+            async with self.engine.connect() as conn:
+                result = await conn.execute(
+                    select(
+                        habits.id, habits.user_id, habits.current_habit, habits.habit_type,
+                        habits.next_fire_at, users.timezone, users.reminder_time
+                    )
+                    .select_from(UserHabit.__table__.outerjoin(User.__table__, users.user_id == habits.user_id))
+                    .where(habits.next_fire_at < until)
+                    .order_by(habits.next_fire_at, habits.id)
+                    .limit(limit)
+                )
+                return result.all()
+        except Exception as e:
+            logger.error(f"❌ Ошибка чтения расписания напоминаний: {e}")
+            return []
+
+    async def count_scheduled_reminders(self) -> int:
+        """Число привычек с включенными напоминаниями"""
+        async with self.engine.connect() as conn:
+            result = await conn.execute(
+                select(func.count()).where(UserHabit.__table__.c.next_fire_at.is_not(None))
+            )
+            return result.scalar()
+
+    async def get_scheduled_user_ids(self) -> list:
+        """user_id всех привычек с включенными напоминаниями"""
+        habits = UserHabit.__table__.c
+        async with self.engine.connect() as conn:
+            result = await conn.execute(select(habits.user_id).where(habits.next_fire_at.is_not(None)))
+            return list(result.scalars())
+
+    async def get_reminder_settings(self, user_id: int):
+        """Строка (timezone, reminder_time) пользователя или None"""
+        users = User.__table__.c
+        async with self.engine.connect() as conn:
+            result = await conn.execute(
+                select(users.timezone, users.reminder_time).where(users.user_id == user_id)
+            )
+            return result.first()
+
+    async def set_reminder_settings(self, user_id: int, **settings):
+        """Сохранить timezone и/или reminder_time пользователя; True, если строка есть"""
+        users = User.__table__
+        try:
+            async with self.engine.begin() as conn:
+                result = await conn.execute(
+                    update(users).where(users.c.user_id == user_id).values(**settings)
+                )
+            return result.rowcount > 0
+        except Exception as e:
+            logger.error(f"❌ Ошибка сохранения настроек напоминаний для {user_id}: {e}")
+            return False
 
-                # Получаем привычку
-                habit = await self.get_user_habit(user_id)
-                if not habit:
-                    return None
+    async def get_habit_stats(self, user_id: int, days: int = STATS_CALENDAR_DAYS):
+        """Получить статистику привычки по дневным итогам
 
-                print(f"📊 Получение статистики для {user_id}: текущая серия={habit.current_streak}")
+        Читает по строке на день: всего успехов, успешность за 7 и 30 дней и
+        календарь последних days дней {день: (успехов, неудач)}. Успехи за
+        месяцы старше срока хранения берутся из месячных итогов. Сегодня - по
+        часовому поясу пользователя, как log_day отметок.
+        """
+        try:
+            habit = await self.get_user_habit(user_id)
+            if not habit:
+                return None
 
-                # Получаем общее количество успешных дней
-                result = await session.execute(
-                    select(func.count(HabitLog.id))
-                    .where(and_(
-                        HabitLog.user_id == user_id,
-                        HabitLog.habit_name == habit.current_habit,
-                        HabitLog.success == True
-                    ))
+            rollups = HabitDailyRollup.__table__.c
+            summaries = HabitMonthlySummary.__table__.c
+            owner = and_(rollups.user_id == user_id, rollups.habit_name == habit.current_habit)
+            archived = (
+                select(func.coalesce(func.sum(summaries.successes), 0))
+                .where(summaries.user_id == user_id, summaries.habit_name == habit.current_habit)
+                .scalar_subquery()
+            )
+
+            async with self.engine.connect() as conn:
+                zone_name = (await conn.execute(
+                    select(User.__table__.c.timezone).where(User.__table__.c.user_id == user_id)
+                )).scalar()
+                today = local_today(zone_name)
+                since = today - timedelta(days=days - 1)
+                total_success = (await conn.execute(
+                    select(func.coalesce(func.sum(rollups.successes), 0) + archived).where(owner)
+                )).scalar()
+                result = await conn.execute(
+                    select(rollups.day, rollups.successes, rollups.failures)
+                    .where(owner, rollups.day >= since)
                 )
-                total_success = result.scalar() or 0
-
-                return {
-                    'habit': habit,
-                    'total_success': total_success,
-                    'success_rate': (total_success / habit.total_days * 100) if habit.total_days > 0 else 0
-                }
-            except Exception as e:
-                logger.error(f"❌ Ошибка получения статистики для {user_id}: {e}")
-                return None
+                calendar = {row.day: (row.successes, row.failures) for row in result}
+
+            # Окно не начинается раньше дня, когда привычка выбрана
+            started = (
+                local_time(zone_name, habit.created_at.replace(tzinfo=timezone.utc).timestamp()).date()
+                if habit.created_at else since
+            )
+
+            def rate(window: int) -> float:
+                first = max(today - timedelta(days=window - 1), started)
+                span = (today - first).days + 1
+                if span <= 0:
+                    return 0
+                done = sum(1 for day, (successes, _) in calendar.items() if day >= first and successes)
+                return done / span * 100
+
+            return {
+                'habit': habit,
+                'total_success': total_success,
+                'success_rate': (total_success / habit.total_days * 100) if habit.total_days > 0 else 0,
+                'weekly_rate': rate(7),
+                'monthly_rate': rate(30),
+                'calendar': calendar,
+                'calendar_start': since,
+                'calendar_days': days,
+            }
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения статистики для {user_id}: {e}")
+            return None
 
 # Глобальный экземпляр БД
 db = SQLiteDatabase()
\ No newline at end of file
@@ -0,0 +1,77 @@
+"""
+Профили движка SQLite
+
+Профиль выбирается переменной окружения DB_PROFILE (см. config.py):
+
+- production - WAL, synchronous=NORMAL, busy_timeout, mmap, большой кэш
+  страниц, auto_vacuum=INCREMENTAL, пул соединений; SQL не логируется;
+- debug - настройки SQLite по умолчанию, но с логом всех SQL-запросов;
+- default - SQLite и SQLAlchemy как есть (для сравнения в бенчмарках).
+
+PRAGMA применяются к каждому новому соединению через событие connect.
+SQL логируется не через echo (он вешает на логгер свой синхронный
+StreamHandler), а уровнем INFO логгера sqlalchemy.engine - записи идут в
+общую очередь логов (utils/log_pipeline.py).
+"""
+import logging
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+logger = logging.getLogger(__name__)
+
+ENGINE_PROFILES = {
+    "production": {
+        "echo": False,
+        "pragmas": {
+            # До journal_mode: включение WAL записывает заголовок новой БД, и auto_vacuum уже не меняется
+            "auto_vacuum": "INCREMENTAL",  # Для новой БД; существующую переводит python -m database.migrations, пункт 9
+            "journal_mode": "WAL",
+            "synchronous": "NORMAL",
+            "busy_timeout": 5000,         # мс ожидания блокировки вместо "database is locked"
+            "mmap_size": 268435456,       # 256 МБ чтения через mmap
+            "cache_size": -65536,         # 64 МБ кэша страниц на соединение
+            "temp_store": "MEMORY",
+        },
+        "pool": {"poolclass": AsyncAdaptedQueuePool, "pool_size": 5, "max_overflow": 10},
+    },
+    "debug": {
+        "echo": True,
+        "pragmas": {"busy_timeout": 5000},
+        "pool": {},
+    },
+    "default": {
+        "echo": False,
+        "pragmas": {},
+        "pool": {},
+    },
+}
+
+
+def create_engine_for_profile(database_url: str, profile: str = "production") -> AsyncEngine:
+    """Создать асинхронный движок SQLite с настройками профиля"""
+    if profile not in ENGINE_PROFILES:
+        raise ValueError(f"Неизвестный профиль БД: {profile} (доступны: {', '.join(ENGINE_PROFILES)})")
+    settings = ENGINE_PROFILES[profile]
+
+    engine = create_async_engine(
+        database_url,
+        connect_args={"check_same_thread": False},  # Для SQLite
+        **settings["pool"]
+    )
+
+    if settings["echo"]:
+        logging.getLogger("sqlalchemy.engine").setLevel(logging.INFO)
+
+    pragmas = settings["pragmas"]
+    if pragmas:
+        @event.listens_for(engine.sync_engine, "connect")
+        def apply_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            cursor.close()
+
+    logger.info(f"⚙️ Движок БД создан с профилем {profile}")
+    return engine
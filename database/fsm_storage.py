@@ -0,0 +1,221 @@
+"""
+Хранилище FSM aiogram в SQLite
+
+MemoryStorage теряет состояние выбора привычки при перезапуске и не видно
+другим процессам. SQLiteStorage хранит состояние и данные в таблице
+fsm_states той же БД.
+
+- Чтения обслуживает кэш в памяти процесса: после первого обращения к ключу
+  get_state/get_data не ходят в БД, пока запись кэша свежа (cache_ttl).
+- Записи сразу меняют кэш, а в БД уходят пачкой: фоновая корутина раз в
+  flush_interval секунд пишет все изменившиеся ключи одной транзакцией.
+  При остановке (close) несохраненное дописывается.
+- Диалог, в котором ничего не менялось ttl секунд, считается брошенным:
+  он читается как пустой, а строки периодически удаляются из БД.
+
+Если бот запущен в нескольких процессах, cache_ttl стоит уменьшить: другой
+процесс увидит изменение не позже чем через flush_interval + cache_ttl.
+"""
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from .database import SQLiteDatabase
+from .models import FsmRecord
+
+logger = logging.getLogger(__name__)
+
+# Через сколько секунд без изменений диалог считается брошенным
+FSM_TTL = 24 * 60 * 60
+# Сколько секунд запись кэша считается свежей без перечитывания из БД
+FSM_CACHE_TTL = 300
+# Окно накопления записей перед сбросом в БД (секунды)
+FSM_FLUSH_INTERVAL = 0.1
+# Как часто удалять брошенные диалоги и устаревшие записи кэша (секунды)
+FSM_SWEEP_INTERVAL = 60
+
+
+class SQLiteStorage(BaseStorage):
+    """BaseStorage поверх fsm_states с кэшем в памяти и пакетной записью"""
+
+    def __init__(
+        self,
+        database: SQLiteDatabase,
+        ttl: float = FSM_TTL,
+        cache_ttl: float = FSM_CACHE_TTL,
+        flush_interval: float = FSM_FLUSH_INTERVAL,
+    ):
+        self.engine = database.engine
+        self.ttl = timedelta(seconds=ttl)
+        self.cache_ttl = cache_ttl
+        self.flush_interval = flush_interval
+
+        # ключ -> [состояние, данные, истекает_в (UTC), свежа_до (monotonic)]
+        self._cache: Dict[str, list] = {}
+        # Ключи, измененные после последнего сброса в БД
+        self._dirty: Dict[str, list] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._next_sweep = time.monotonic() + FSM_SWEEP_INTERVAL
+
+        # Метрики
+        self.loads = 0
+        self.flushes = 0
+        self.written = 0
+
+    @staticmethod
+    def _name(key: StorageKey) -> str:
+        return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.destiny}"
+
+    async def _record(self, key: StorageKey) -> list:
+        """Запись кэша для ключа; при промахе или устаревании читается из БД"""
+        name = self._name(key)
+        record = self._cache.get(name)
+        if record is None or (record[3] < time.monotonic() and name not in self._dirty):
+            record = await self._load(name, record)
+        if record[2] is not None and record[2] < datetime.utcnow():
+            # Брошенный диалог: начинаем с чистого листа
+            record[0], record[1], record[2] = None, {}, None
+        return record
+
+    async def _load(self, name: str, stale: Optional[list]) -> list:
+        self.loads += 1
+        async with self.engine.connect() as conn:
+            row = (await conn.execute(
+                select(FsmRecord.state, FsmRecord.data, FsmRecord.expires_at).where(FsmRecord.key == name)
+            )).one_or_none()
+
+        current = self._cache.get(name)
+        if current is not stale:
+            # Пока шло чтение, ключ уже изменили - кэш новее БД
+            return current
+        if row is None:
+            record = [None, {}, None, 0.0]
+        else:
+            record = [row.state, json.loads(row.data) if row.data else {}, row.expires_at, 0.0]
+        record[3] = time.monotonic() + self.cache_ttl
+        self._cache[name] = record
+        return record
+
+    def _touch(self, key: StorageKey, record: list):
+        """Продлить диалог и поставить ключ в очередь на запись"""
+        name = self._name(key)
+        record[2] = datetime.utcnow() + self.ttl
+        record[3] = time.monotonic() + self.cache_ttl
+        self._cache[name] = record
+        self._dirty[name] = record
+        self._ensure_flusher()
+        self._wakeup.set()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._record(key)
+        record[0] = state.state if isinstance(state, State) else state
+        self._touch(key, record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._record(key))[0]
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        record = await self._record(key)
+        record[1] = data.copy()
+        self._touch(key, record)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._record(key))[1].copy()
+
+    def _ensure_flusher(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._flusher())
+
+    async def _flusher(self):
+        while True:
+            await self._wakeup.wait()
+            # Собираем в пачку все изменения за flush_interval
+            await asyncio.sleep(self.flush_interval)
+            self._wakeup.clear()
+            await self.flush()
+            if time.monotonic() >= self._next_sweep:
+                await self.sweep()
+
+    async def flush(self):
+        """Записать все измененные ключи одной транзакцией"""
+        if not self._dirty:
+            return
+        batch, self._dirty = self._dirty, {}
+
+        upserts, deletes = [], []
+        for name, (state, data, expires_at, _) in batch.items():
+            if state is None and not data:
+                deletes.append(name)
+            else:
+                upserts.append({
+                    'key': name,
+                    'state': state,
+                    'data': json.dumps(data, ensure_ascii=False),
+                    'expires_at': expires_at,
+                })
+
+        table = FsmRecord.__table__
+        try:
+            async with self.engine.begin() as conn:
+                if upserts:
+                    stmt = sqlite_insert(table)
+                    await conn.execute(
+                        stmt.on_conflict_do_update(
+                            index_elements=[table.c.key],
+                            set_={
+                                'state': stmt.excluded.state,
+                                'data': stmt.excluded.data,
+                                'expires_at': stmt.excluded.expires_at,
+                            }
+                        ),
+                        upserts
+                    )
+                if deletes:
+                    await conn.execute(table.delete().where(table.c.key.in_(deletes)))
+            self.flushes += 1
+            self.written += len(batch)
+        except (Exception, asyncio.CancelledError) as e:
+            # Вернем в очередь то, что не успели изменить заново (повторная запись безвредна)
+            for name, record in batch.items():
+                self._dirty.setdefault(name, record)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            logger.error(f"❌ Ошибка сохранения {len(batch)} состояний FSM: {e}")
+            self._wakeup.set()
+
+    async def sweep(self):
+        """Удалить брошенные диалоги из БД и устаревшие записи кэша"""
+        self._next_sweep = time.monotonic() + FSM_SWEEP_INTERVAL
+        now = time.monotonic()
+        for name in [name for name, record in self._cache.items() if record[3] < now and name not in self._dirty]:
+            del self._cache[name]
+
+        table = FsmRecord.__table__
+        try:
+            async with self.engine.begin() as conn:
+                result = await conn.execute(table.delete().where(table.c.expires_at < datetime.utcnow()))
+            if result.rowcount:
+                logger.info(f"🧹 Удалено брошенных диалогов FSM: {result.rowcount}")
+        except Exception as e:
+            logger.error(f"❌ Ошибка очистки состояний FSM: {e}")
+
+    async def close(self) -> None:
+        """Дописать несохраненные изменения и остановить фоновую запись"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
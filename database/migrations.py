@@ -1,22 +1,67 @@
 import asyncio
 import logging
-from sqlalchemy.ext.asyncio import create_async_engine
-from sqlalchemy import text
+from datetime import datetime, timezone
+from sqlalchemy import text, select, delete, update, func, and_
 
-from .models import Base
-from config import DATABASE_URL
+from .models import Base, User, UserHabit, HabitLog, HabitDailyRollup, HabitMonthlySummary, FsmRecord
+from .engine import create_engine_for_profile
+from .database import streak_update_statement, rollup_backfill_statement
+from config import DATABASE_URL, DB_PROFILE, RETENTION_DAYS
+from utils.timezones import next_fire_at
 
 logger = logging.getLogger(__name__)
 
+SCHEMA_VERSION_DDL = (
+    "CREATE TABLE IF NOT EXISTS schema_version ("
+    "version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at DATETIME NOT NULL)"
+)
+
+
+def hot_queries():
+    """Горячие запросы database/database.py для проверки планов выполнения"""
+    users = User.__table__
+    habits = UserHabit.__table__
+    rollups = HabitDailyRollup.__table__
+    return [
+        ("get_or_create_user", select(users.c.username, users.c.first_name).where(users.c.user_id == 1)),
+        ("get_user_habit", select(habits).where(habits.c.user_id == 1)),
+        ("create_user_habit", delete(habits).where(habits.c.user_id == 1)),
+        ("update_habit_streak", streak_update_statement()),
+        ("apply_check_ins", select(habits).where(habits.c.user_id.in_([1, 2, 3]))),
+        ("set_next_fire_at", UserHabit.__table__.update().where(habits.c.user_id == 1).values(next_fire_at=None)),
+        ("get_due_reminders", select(habits.c.id, users.c.timezone)
+            .select_from(habits.outerjoin(users, users.c.user_id == habits.c.user_id))
+            .where(habits.c.next_fire_at < datetime(2024, 1, 1))
+            .order_by(habits.c.next_fire_at, habits.c.id)
+            .limit(1000)),
+        ("get_habit_stats", select(rollups.c.day, rollups.c.successes, rollups.c.failures).where(
+            rollups.c.user_id == 1, rollups.c.habit_name == "Медитация", rollups.c.day >= datetime(2024, 1, 1).date())),
+    ]
+
 
 class DatabaseMigrator:
     """Класс для управления миграциями базы данных"""
 
+    # Упорядоченные шаги схемы: (версия, описание, метод). Каждый шаг идемпотентен;
+    # шаг, который нельзя повторить (v10), записывает версию в своей транзакции.
+    MIGRATIONS = [
+        (1, "создание таблиц", "init_database"),
+        (2, "notes/comment и индексы habit_logs", "migrate_v1_to_v2"),
+        (3, "постоянное расписание напоминаний", "migrate_v2_to_v3"),
+        (4, "составные индексы под горячие запросы", "migrate_v3_to_v4"),
+        (5, "дневные итоги для статистики", "migrate_v4_to_v5"),
+        (6, "хранилище состояний FSM", "migrate_v5_to_v6"),
+        (7, "часовой пояс и время напоминаний", "migrate_v6_to_v7"),
+        (8, "одна отметка привычки в день", "migrate_v7_to_v8"),
+        (9, "месячные итоги", "migrate_v8_to_v9"),
+        (10, "метки времени отметок в UTC", "migrate_v9_to_v10"),
+    ]
+
     async def add_last_log_date_column(self):
         """Добавить столбец last_log_date в таблицу user_habits"""
         return await self.add_column_if_not_exists("user_habits", "last_log_date", "DATETIME")
     def __init__(self):
-        self.engine = create_async_engine(DATABASE_URL, echo=False)
+        self.engine = create_engine_for_profile(DATABASE_URL, DB_PROFILE)
 
     async def init_database(self):
         """Инициализация базы данных (создание всех таблиц)"""
@@ -31,7 +76,7 @@ class DatabaseMigrator:
 
     async def check_tables(self):
         """Проверка существования таблиц"""
-        tables = ['users', 'user_habits', 'habit_logs']
+        tables = ['users', 'user_habits', 'habit_logs', 'habit_daily_rollups', 'habit_monthly_summaries', 'fsm_states']
         missing_tables = []
 
         async with self.engine.connect() as conn:
@@ -107,20 +152,289 @@ class DatabaseMigrator:
         logger.info("✅ Миграция v1 → v2 завершена")
         return True
 
-    async def backup_database(self, backup_path: str = "habits_backup.db"):
-        """Создание резервной копии базы данных"""
-        import shutil
-        import os
+    async def migrate_v2_to_v3(self):
+        """Миграция v2 → v3: постоянное расписание напоминаний"""
+        logger.info("🔄 Выполнение миграции v2 → v3")
+
+        await self.add_column_if_not_exists("user_habits", "next_fire_at", "DATETIME")
+        await self.create_index("user_habits", "next_fire_at", "ix_user_habits_next_fire_at")
+
+        logger.info("✅ Миграция v2 → v3 завершена")
+        return True
+
+    async def migrate_v3_to_v4(self):
+        """Миграция v3 → v4: составные индексы под запросы database/database.py"""
+        logger.info("🔄 Выполнение миграции v3 → v4")
+
+        async with self.engine.begin() as conn:
+            await conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_user_habits_user_id ON user_habits (user_id)"
+            ))
+            await conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_habit_logs_user_habit_success "
+                "ON habit_logs (user_id, habit_name, success)"
+            ))
+            await conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_habit_logs_user_log_date ON habit_logs (user_id, log_date)"
+            ))
+            # Одиночный индекс по user_id - префикс составных, только замедляет вставки
+            await conn.execute(text("DROP INDEX IF EXISTS idx_habit_logs_user_id"))
+
+        logger.info("✅ Миграция v3 → v4 завершена")
+        return True
+
+    async def migrate_v4_to_v5(self):
+        """Миграция v4 → v5: таблица дневных итогов, заполненная из habit_logs"""
+        logger.info("🔄 Выполнение миграции v4 → v5")
+        # log_day появляется только в v8
+        await self.rebuild_rollups(by_log_day=False)
+        logger.info("✅ Миграция v4 → v5 завершена")
+        return True
+
+    async def migrate_v5_to_v6(self):
+        """Миграция v5 → v6: таблица fsm_states для SQLiteStorage"""
+        logger.info("🔄 Выполнение миграции v5 → v6")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(FsmRecord.__table__.create, checkfirst=True)
+        logger.info("✅ Миграция v5 → v6 завершена")
+        return True
+
+    async def migrate_v6_to_v7(self):
+        """Миграция v6 → v7: часовой пояс и время напоминаний, ежедневное расписание"""
+        logger.info("🔄 Выполнение миграции v6 → v7")
+
+        await self.add_column_if_not_exists("users", "timezone", "VARCHAR(64)")
+        await self.add_column_if_not_exists("users", "reminder_time", "TIME")
+
+        # Напоминания раз в 30 секунд становятся ежедневными. Настройки у всех
+        # пока по умолчанию, поэтому следующее напоминание у всех одно
+        now = datetime.now(timezone.utc).timestamp()
+        fire_at = datetime.fromtimestamp(next_fire_at(None, None, now), timezone.utc).replace(tzinfo=None)
+        habits = UserHabit.__table__
+        async with self.engine.begin() as conn:
+            result = await conn.execute(
+                update(habits).where(habits.c.next_fire_at.is_not(None)).values(next_fire_at=fire_at)
+            )
+        logger.info(f"✅ Миграция v6 → v7 завершена, расписаний перенесено: {result.rowcount}")
+        return True
+
+    async def migrate_v7_to_v8(self):
+        """Миграция v7 → v8: день отметки и уникальный индекс (user_id, habit_name, log_day)
+
+        Повторные отметки одного дня удаляются безвозвратно, а run_migrations при
+        старте бота резервную копию не снимает - поэтому, если повторы есть, шаг
+        сначала снимает ее сам и без нее ничего не удаляет.
+        """
+        logger.info("🔄 Выполнение миграции v7 → v8")
+
+        await self.add_column_if_not_exists("habit_logs", "log_day", "DATE")
+        logs = HabitLog.__table__
+        # Из повторных отметок одного дня остается первая
+        first = select(func.min(logs.c.id)).group_by(logs.c.user_id, logs.c.habit_name, logs.c.log_day)
+        repeated = and_(logs.c.log_day.is_not(None), logs.c.id.not_in(first))
+        async with self.engine.begin() as conn:
+            await conn.execute(
+                update(logs)
+                .where(logs.c.log_day.is_(None), logs.c.log_date.is_not(None))
+                .values(log_day=func.date(logs.c.log_date))
+            )
+            duplicates = (await conn.execute(select(func.count()).where(repeated))).scalar()
+
+        if duplicates:
+            logger.info(f"💾 Повторных отметок: {duplicates}, резервная копия перед удалением")
+            if not await self.backup_database():
+                logger.error("❌ Резервная копия не снята - повторные отметки не удалены")
+                return False
+
+        async with self.engine.begin() as conn:
+            result = await conn.execute(delete(logs).where(repeated))
+            removed = result.rowcount
+            await conn.execute(text(
+                "CREATE UNIQUE INDEX IF NOT EXISTS ix_habit_logs_user_habit_day "
+                "ON habit_logs (user_id, habit_name, log_day)"
+            ))
+
+        # Итоги были посчитаны и по удаленным повторам. Серии миграция не трогает:
+        # пересчет меняет данные пользователей и запускается только вручную
+        if removed:
+            await self.rebuild_rollups()
+            logger.warning("⚠️ Серии могли учитывать удаленные повторы - проверьте их пунктом 7 меню")
+        logger.info(f"✅ Миграция v7 → v8 завершена, удалено повторных отметок: {removed}")
+        return True
 
+    async def migrate_v8_to_v9(self):
+        """Миграция v8 → v9: таблица месячных итогов для database/retention.py"""
+        logger.info("🔄 Выполнение миграции v8 → v9")
+
+        async with self.engine.begin() as conn:
+            await conn.run_sync(HabitMonthlySummary.__table__.create, checkfirst=True)
+
+        logger.info("✅ Миграция v8 → v9 завершена")
+        return True
+
+    async def enable_incremental_vacuum(self):
+        """Перевести БД на auto_vacuum=INCREMENTAL, чтобы retention.py возвращал место после архивации
+
+        auto_vacuum меняется только полным VACUUM: файл переписывается целиком,
+        на время нужно еще столько же места на диске. Поэтому это не шаг схемы,
+        выполняемый при старте бота, а обслуживание: пункт 9 меню или пункт 3 при
+        включенном RETENTION_DAYS (после резервной копии).
+        """
         try:
-            # SQLite база - просто копируем файл
-            if os.path.exists("habits.db"):
-                shutil.copy2("habits.db", backup_path)
-                logger.info(f"✅ Резервная копия создана: {backup_path}")
+            # VACUUM не работает внутри транзакции
+            async with self.engine.connect() as conn:
+                await conn.execution_options(isolation_level="AUTOCOMMIT")
+                mode = (await conn.exec_driver_sql("PRAGMA auto_vacuum")).scalar()
+                if mode == 2:
+                    logger.info("✅ auto_vacuum уже INCREMENTAL")
+                    return True
+                logger.info("🔄 Перевод на auto_vacuum=INCREMENTAL (полный VACUUM)")
+                await conn.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+                await conn.exec_driver_sql("VACUUM")
+            # Открытые соединения общего движка помнят прежний auto_vacuum - пусть откроются заново
+            from .database import db
+            await db.engine.dispose()
+            logger.info("✅ auto_vacuum переключен на INCREMENTAL")
+            return True
+        except Exception as e:
+            logger.error(f"❌ Ошибка перевода на auto_vacuum=INCREMENTAL: {e}")
+            return False
+
+    async def migrate_v9_to_v10(self):
+        """Миграция v9 → v10: log_date, first/last_log_at и last_log_date из местного времени сервера в UTC
+
+        Раньше эти метки писались через datetime.now(), а created_at - в UTC, и
+        на сервере западнее UTC repair_streaks отбрасывал первые часы отметок
+        новой привычки. Модификатор 'utc' SQLite переводит по часовому поясу
+        процесса (того же, что был у datetime.now()), с учетом перехода на
+        летнее время; дробная часть секунды сохраняется.
+        """
+        logger.info("🔄 Выполнение миграции v9 → v10")
+
+        def to_utc(column: str) -> str:
+            return f"{column} = datetime({column}, 'utc') || substr({column}, 20)"
+
+        # Повторный сдвиг испортил бы метки: UPDATE и запись версии - одна транзакция
+        async with self.engine.begin() as conn:
+            await self.record_version(conn, 10)
+            # Сервер в UTC без перехода на летнее время - переводить нечего
+            probe = await conn.execute(text(
+                "SELECT datetime('2024-01-15 12:00:00', 'utc'), datetime('2024-07-15 12:00:00', 'utc')"
+            ))
+            if tuple(probe.one()) == ('2024-01-15 12:00:00', '2024-07-15 12:00:00'):
+                logger.info("✅ Миграция v9 → v10 завершена, сервер в UTC")
                 return True
-            else:
-                logger.warning("⚠️ Файл базы данных не найден для резервного копирования")
-                return False
+
+            result = await conn.execute(text(
+                f"UPDATE habit_logs SET {to_utc('log_date')} WHERE log_date IS NOT NULL"
+            ))
+            await conn.execute(text(
+                # NULL остается NULL
+                f"UPDATE habit_monthly_summaries SET {to_utc('first_log_at')}, {to_utc('last_log_at')}"
+            ))
+            await conn.execute(text(
+                f"UPDATE user_habits SET {to_utc('last_log_date')} WHERE last_log_date IS NOT NULL"
+            ))
+        logger.info(f"✅ Миграция v9 → v10 завершена, логов переведено в UTC: {result.rowcount}")
+        return True
+
+    async def archive_old_logs(self):
+        """Свернуть логи старше срока хранения в месячные итоги и архив"""
+        from .retention import retention_job
+        if retention_job.days <= 0:
+            logger.info("ℹ️ RETENTION_DAYS=0 - логи хранятся без срока, архивировать нечего")
+            return None
+        try:
+            return await retention_job.run_once()
+        except Exception as e:
+            logger.error(f"❌ Ошибка архивации старых логов: {e}")
+            return None
+
+    async def rebuild_rollups(self, by_log_day: bool = True):
+        """Пересоздать habit_daily_rollups по всей истории habit_logs"""
+        try:
+            async with self.engine.begin() as conn:
+                await conn.run_sync(HabitDailyRollup.__table__.create, checkfirst=True)
+                await conn.execute(HabitDailyRollup.__table__.delete())
+                result = await conn.execute(rollup_backfill_statement(by_log_day))
+            logger.info(f"✅ Дневные итоги пересчитаны: {result.rowcount} строк")
+            return True
+        except Exception as e:
+            logger.error(f"❌ Ошибка пересчета дневных итогов: {e}")
+            return False
+
+    async def repair_streaks(self):
+        """Пересчитать серии по habit_logs и исправить расхождения в user_habits"""
+        from .streak_repair import repair_streaks
+        try:
+            return await repair_streaks(self.engine)
+        except Exception as e:
+            logger.error(f"❌ Ошибка пересчета серий: {e}")
+            return None
+
+    async def record_version(self, conn, version: int):
+        """Записать примененную версию схемы в транзакции conn (повторная запись ничего не меняет)"""
+        name = next(name for number, name, _ in self.MIGRATIONS if number == version)
+        await conn.execute(text(SCHEMA_VERSION_DDL))
+        await conn.execute(
+            text("INSERT OR IGNORE INTO schema_version (version, name, applied_at) VALUES (:version, :name, :applied_at)"),
+            {"version": version, "name": name, "applied_at": datetime.utcnow()}
+        )
+
+    async def get_schema_version(self) -> int:
+        """Текущая версия схемы (0 - миграции еще не применялись)"""
+        async with self.engine.begin() as conn:
+            await conn.execute(text(SCHEMA_VERSION_DDL))
+            result = await conn.execute(text("SELECT MAX(version) FROM schema_version"))
+            return result.scalar() or 0
+
+    async def run_migrations(self):
+        """Применить по порядку все шаги новее текущей версии схемы"""
+        current = await self.get_schema_version()
+        for version, name, method in self.MIGRATIONS:
+            if version <= current:
+                continue
+
+            logger.info(f"🔄 Схема v{version}: {name}")
+            if await getattr(self, method)() is False:
+                raise RuntimeError(f"Миграция схемы v{version} ({name}) не выполнена")
+
+            async with self.engine.begin() as conn:
+                await self.record_version(conn, version)
+            current = version
+
+        logger.info(f"✅ Версия схемы БД: v{current}")
+        await self.check_query_plans()
+        return current
+
+    async def check_query_plans(self):
+        """Проверить через EXPLAIN QUERY PLAN, что горячие запросы не сканируют таблицы целиком
+
+        Возвращает список (запрос, строка плана) для найденных полных сканирований.
+        """
+        problems = []
+        async with self.engine.connect() as conn:
+            for name, statement in hot_queries():
+                compiled = statement.compile(dialect=conn.dialect, compile_kwargs={"render_postcompile": True})
+                params = tuple(compiled.params[key] for key in compiled.positiontup)
+                result = await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params)
+                for row in result.fetchall():
+                    detail = row[-1]
+                    if detail.startswith("SCAN ") and "CONSTANT ROW" not in detail:
+                        problems.append((name, detail))
+
+        for name, detail in problems:
+            logger.warning(f"⚠️ Полное сканирование в запросе {name}: {detail}")
+        if not problems:
+            logger.info("✅ Все горячие запросы используют индексы")
+        return problems
+
+    async def backup_database(self):
+        """Создание проверенной резервной копии базы данных в BACKUP_DIR (см. backup.py)"""
+        from .backup import BackupService
+        try:
+            # Копируется файл движка мигратора - тот, который мигрирует
+            return await BackupService(self.engine.url.database or "").run_once() is not None
         except Exception as e:
             logger.error(f"❌ Ошибка создания резервной копии: {e}")
             return False
@@ -138,7 +452,11 @@ class DatabaseMigrator:
             await self.init_database()
 
         # 3. Выполняем миграции по версиям
-        await self.migrate_v1_to_v2()
+        await self.run_migrations()
+
+        # 4. Для срока хранения - возврат места после архивации (полный VACUUM один раз)
+        if RETENTION_DAYS > 0:
+            await self.enable_incremental_vacuum()
 
         logger.info("🎉 Все миграции выполнены успешно!")
         return True
@@ -156,8 +474,13 @@ async def main():
     print("2. Проверить таблицы")
     print("3. Выполнить все миграции")
     print("4. Создать резервную копию")
+    print("5. Проверить планы горячих запросов")
+    print("6. Пересчитать дневные итоги статистики")
+    print("7. Пересчитать серии по логам")
+    print("8. Архивировать логи старше срока хранения")
+    print("9. Включить incremental vacuum (полный VACUUM)")
 
-    choice = input("Выберите действие (1-4): ").strip()
+    choice = input("Выберите действие (1-9): ").strip()
 
     if choice == "1":
         await migrator.init_database()
@@ -170,6 +493,24 @@ async def main():
         await migrator.run_all_migrations()
     elif choice == "4":
         await migrator.backup_database()
+    elif choice == "5":
+        problems = await migrator.check_query_plans()
+        for name, detail in problems:
+            print(f"⚠️ {name}: {detail}")
+        if not problems:
+            print("✅ Полных сканирований нет")
+    elif choice == "6":
+        await migrator.rebuild_rollups()
+    elif choice == "7":
+        report = await migrator.repair_streaks()
+        if report:
+            print(f"Исправлено пользователей: {report['corrected']} из {report['users']}")
+    elif choice == "8":
+        report = await migrator.archive_old_logs()
+        if report:
+            print(f"Заархивировано логов: {report['logs']}, месячных итогов: {report['summaries']}")
+    elif choice == "9":
+        await migrator.enable_incremental_vacuum()
     else:
         print("❌ Неверный выбор")
 
@@ -1,40 +1,108 @@
-from sqlalchemy import Column, Integer, String, BigInteger, DateTime, Boolean
-from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy import Column, Integer, String, Text, BigInteger, Date, DateTime, Time, Boolean, Index
+from sqlalchemy.orm import declarative_base
 from datetime import datetime
 
+# Базовый класс для моделей (единственный на весь проект)
 Base = declarative_base()
 
 
 class User(Base):
+    """Модель пользователя"""
     __tablename__ = "users"
 
-    id = Column(Integer, primary_key=True)
+    id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(BigInteger, unique=True, nullable=False)
     username = Column(String(100))
     first_name = Column(String(100))
     created_at = Column(DateTime, default=datetime.utcnow)
+    timezone = Column(String(64))  # Часовой пояс IANA, NULL - DEFAULT_TIMEZONE из config.py
+    reminder_time = Column(Time)  # Местное время ежедневного напоминания, NULL - DEFAULT_REMINDER_TIME
 
 
 class UserHabit(Base):
+    """Модель привычек пользователя"""
     __tablename__ = "user_habits"
+    __table_args__ = (
+        # get_user_habit, обновление серии, смена привычки и расписание - все по user_id
+        Index("ix_user_habits_user_id", "user_id"),
+    )
 
-    id = Column(Integer, primary_key=True)
+    id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(BigInteger, nullable=False)
-    current_habit = Column(String(100))
-    habit_type = Column(String(20))  # 'positive' or 'negative'
+    current_habit = Column(String(100), nullable=False)
+    habit_type = Column(String(20), nullable=False)  # 'positive' или 'negative'
     current_streak = Column(Integer, default=0)
     best_streak = Column(Integer, default=0)
     total_days = Column(Integer, default=0)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    last_log_date = Column(DateTime)  # Добавлено
+    last_log_date = Column(DateTime)  # Добавляем поле для отслеживания последней записи
+    next_fire_at = Column(DateTime, index=True)  # Время следующего напоминания (UTC, начало минуты), NULL - напоминания выключены
 
 
 class HabitLog(Base):
+    """Модель логов привычек"""
     __tablename__ = "habit_logs"
+    __table_args__ = (
+        # Покрывающий индекс для подсчета успехов в get_habit_stats
+        Index("ix_habit_logs_user_habit_success", "user_id", "habit_name", "success"),
+        # История пользователя в хронологическом порядке
+        Index("ix_habit_logs_user_log_date", "user_id", "log_date"),
+        # Одна отметка привычки в день: повторные нажатия - ON CONFLICT DO NOTHING
+        Index("ix_habit_logs_user_habit_day", "user_id", "habit_name", "log_day", unique=True),
+    )
 
-    id = Column(Integer, primary_key=True)
+    id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(BigInteger, nullable=False)
-    habit_name = Column(String(100))
-    success = Column(Boolean)
-    log_date = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    habit_name = Column(String(100), nullable=False)
+    success = Column(Boolean, nullable=False)
+    log_date = Column(DateTime, default=datetime.utcnow)
+    log_day = Column(Date)  # День отметки (как day в habit_daily_rollups)
+
+
+class HabitDailyRollup(Base):
+    """Дневные итоги по привычке: сколько отметок за день было успешных и неуспешных
+
+    Обновляется вместе с habit_logs при каждой отметке, поэтому статистика
+    читает по строке на день, а не всю историю логов.
+    """
+    __tablename__ = "habit_daily_rollups"
+
+    user_id = Column(BigInteger, primary_key=True)
+    habit_name = Column(String(100), primary_key=True)
+    day = Column(Date, primary_key=True)
+    successes = Column(Integer, nullable=False, default=0)
+    failures = Column(Integer, nullable=False, default=0)
+
+
+class HabitMonthlySummary(Base):
+    """Месячные итоги по привычке для логов старше срока хранения (database/retention.py)
+
+    Кроме счетчиков хранит свертку серии за месяц, как fold_check_ins:
+    reset - была ли неудача, leading - успехи до первой неудачи, run_best -
+    самая длинная серия после нее, trailing - успехи после последней неудачи.
+    По цепочке месяцев серия считается так же, как по самим логам.
+    """
+    __tablename__ = "habit_monthly_summaries"
+
+    user_id = Column(BigInteger, primary_key=True)
+    habit_name = Column(String(100), primary_key=True)
+    month = Column(Date, primary_key=True)  # Первое число месяца
+    successes = Column(Integer, nullable=False, default=0)
+    failures = Column(Integer, nullable=False, default=0)
+    reset = Column(Boolean, nullable=False, default=False)
+    leading = Column(Integer, nullable=False, default=0)
+    run_best = Column(Integer, nullable=False, default=0)
+    trailing = Column(Integer, nullable=False, default=0)
+    first_log_at = Column(DateTime)  # Первый и последний log_date месяца
+    last_log_at = Column(DateTime)
+
+
+class FsmRecord(Base):
+    """Состояние и данные FSM aiogram для одного ключа (см. database/fsm_storage.py)"""
+    __tablename__ = "fsm_states"
+
+    key = Column(String(200), primary_key=True)  # bot_id:chat_id:user_id:thread_id:destiny
+    state = Column(String(100))
+    data = Column(Text)  # JSON
+    expires_at = Column(DateTime, nullable=False, index=True)  # UTC, после этого диалог считается брошенным
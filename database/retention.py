@@ -0,0 +1,261 @@
+"""
+Срок хранения habit_logs: месячные итоги, архив и incremental vacuum
+
+habit_logs только растет, а статистике и сериям старая история нужна лишь в
+свернутом виде. RetentionJob раз в сутки берет логи месяцев, целиком лежащих
+старше RETENTION_DAYS (но не ближе календаря статистики), и для каждого
+(пользователь, привычка, месяц) пишет строку habit_monthly_summaries: счетчики
+и свертку серии fold_check_ins. get_habit_stats добавляет успехи из итогов к
+дневным итогам, repair_streaks продолжает серии от итогов (см. streak_repair.py),
+а user_habits хранит серии инкрементально и логов не читает.
+
+Сами строки дописываются в сжатые архивы ARCHIVE_DIR/habit_logs-ГГГГ-ММ.jsonl.gz,
+по файлу на месяц: JSON по строке на лог, каждая пачка - отдельный член gzip,
+поэтому файл только дописывается и читается обычным gzip.open. Архив пишется и
+сбрасывается на диск до удаления строк; если удаление не прошло, следующий
+запуск допишет те же строки еще раз - повторы отсеиваются по id.
+
+Логи идут пачками по BATCH_ROWS строк по возрастанию user_id, пользователь
+целиком в одной пачке. Итоги пачки, удаление ее логов и дневных итогов - одна
+короткая транзакция, между пачками пауза BATCH_PAUSE, чтобы писатель отметок
+не ждал блокировку. Освободившиеся страницы возвращаются файловой системе
+PRAGMA incremental_vacuum по VACUUM_PAGES страниц за раз (нужен
+auto_vacuum=INCREMENTAL: его включает python -m database.migrations, пункт 9
+или пункт 3 при RETENTION_DAYS > 0).
+
+Отдельно: python -m database.retention
+"""
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+from datetime import date, timedelta
+from itertools import groupby
+from typing import Optional
+
+from sqlalchemy import and_, delete, insert, select
+
+from config import RETENTION_DAYS, ARCHIVE_DIR
+from .database import db, fold_check_ins, SQLiteDatabase, STATS_CALENDAR_DAYS
+from .models import HabitLog, HabitDailyRollup, HabitMonthlySummary
+
+logger = logging.getLogger(__name__)
+
+# Строк habit_logs в одной пачке и пауза между пачками (секунды)
+BATCH_ROWS = 5000
+BATCH_PAUSE = 0.05
+# Страниц за один PRAGMA incremental_vacuum (по 4 КБ)
+VACUUM_PAGES = 2048
+# Первый запуск через 10 минут после старта бота, дальше раз в сутки
+INITIAL_DELAY = 600
+RUN_INTERVAL = 86400
+
+
+def retention_cutoff(today: date, days: int) -> date:
+    """Первый день, логи которого остаются: начало месяца, в который попадает today - days"""
+    horizon = today - timedelta(days=max(days, STATS_CALENDAR_DAYS))
+    return horizon.replace(day=1)
+
+
+def summarize(rows) -> list:
+    """Месячные итоги по логам, идущим по (user_id, habit_name, log_day)"""
+    summaries = []
+    for (user_id, habit_name, month), group in groupby(
+        rows, key=lambda row: (row.user_id, row.habit_name, row.log_day.replace(day=1))
+    ):
+        group = list(group)
+        folded = fold_check_ins(row.success for row in group)
+        summaries.append({
+            'user_id': user_id,
+            'habit_name': habit_name,
+            'month': month,
+            'failures': len(group) - folded['successes'],
+            'first_log_at': group[0].log_date,
+            'last_log_at': group[-1].log_date,
+            **folded,
+        })
+    return summaries
+
+
+def archive_path(archive_dir: str, month: date) -> str:
+    return os.path.join(archive_dir, f"habit_logs-{month:%Y-%m}.jsonl.gz")
+
+
+def write_archive(archive_dir: str, rows) -> int:
+    """Дописать логи в архивы их месяцев и сбросить на диск; возвращает число байт"""
+    os.makedirs(archive_dir, exist_ok=True)
+    written = 0
+    by_month = sorted(rows, key=lambda row: row.log_day)
+    for month, group in groupby(by_month, key=lambda row: row.log_day.replace(day=1)):
+        lines = "".join(
+            json.dumps({
+                'id': row.id,
+                'user_id': row.user_id,
+                'habit_name': row.habit_name,
+                'success': bool(row.success),
+                'log_date': row.log_date.isoformat() if row.log_date else None,
+                'log_day': row.log_day.isoformat(),
+            }, ensure_ascii=False) + "\n"
+            for row in group
+        )
+        data = gzip.compress(lines.encode("utf-8"))
+        with open(archive_path(archive_dir, month), "ab") as archive:
+            archive.write(data)
+            archive.flush()
+            os.fsync(archive.fileno())
+        written += len(data)
+    return written
+
+
+class RetentionJob:
+    """Сворачивание, архив и удаление логов старше срока хранения"""
+
+    def __init__(self, database: SQLiteDatabase, days: int = RETENTION_DAYS, archive_dir: str = ARCHIVE_DIR,
+                 batch_rows: int = BATCH_ROWS, pause: float = BATCH_PAUSE):
+        self.database = database
+        self.days = days
+        self.archive_dir = archive_dir
+        self.batch_rows = batch_rows
+        self.pause = pause
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Запустить ежедневный цикл, если он еще не работает"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановить цикл; прерванная пачка откатывается целиком"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        await asyncio.sleep(INITIAL_DELAY)
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"❌ Ошибка архивации старых логов: {e}")
+            await asyncio.sleep(RUN_INTERVAL)
+
+    async def _next_batch(self, conn, cutoff: date, after):
+        logs = HabitLog.__table__.c
+        stmt = (
+            select(logs.id, logs.user_id, logs.habit_name, logs.success, logs.log_date, logs.log_day)
+            .where(logs.log_day < cutoff)
+            .order_by(logs.user_id, logs.habit_name, logs.log_day)
+        )
+        if after is not None:
+            stmt = stmt.where(logs.user_id > after)
+        rows = (await conn.execute(stmt.limit(self.batch_rows))).all()
+        if len(rows) < self.batch_rows:
+            return rows
+
+        # Последний пользователь мог не войти целиком - он уходит в следующую пачку
+        last = rows[-1].user_id
+        complete = [row for row in rows if row.user_id != last]
+        if complete:
+            return complete
+        # Один пользователь больше пачки - берем его целиком
+        return (await conn.execute(stmt.where(logs.user_id == last))).all()
+
+    async def _apply(self, rows, summaries, cutoff: date):
+        logs = HabitLog.__table__.c
+        rollups = HabitDailyRollup.__table__.c
+        users = and_(logs.user_id >= rows[0].user_id, logs.user_id <= rows[-1].user_id)
+        async with self.database.engine.begin() as conn:
+            await conn.execute(insert(HabitMonthlySummary.__table__), summaries)
+            result = await conn.execute(delete(HabitLog.__table__).where(users, logs.log_day < cutoff))
+            await conn.execute(
+                delete(HabitDailyRollup.__table__).where(
+                    rollups.user_id >= rows[0].user_id, rollups.user_id <= rows[-1].user_id, rollups.day < cutoff
+                )
+            )
+        return result.rowcount
+
+    async def vacuum(self) -> int:
+        """Вернуть свободные страницы файловой системе; возвращает число освобожденных страниц"""
+        engine = self.database.engine
+        async with engine.connect() as conn:
+            mode = (await conn.exec_driver_sql("PRAGMA auto_vacuum")).scalar()
+            free = (await conn.exec_driver_sql("PRAGMA freelist_count")).scalar()
+        if mode != 2:
+            if free:
+                logger.info(f"ℹ️ auto_vacuum не INCREMENTAL, свободных страниц в файле: {free} "
+                            f"(включить - пункт 9 python -m database.migrations)")
+            return 0
+
+        freed = 0
+        while free:
+            async with engine.begin() as conn:
+                # execute() в sqlite3 делает один шаг PRAGMA - одну страницу, executescript - все
+                raw = (await conn.get_raw_connection()).driver_connection
+                await raw.executescript(f"PRAGMA incremental_vacuum({VACUUM_PAGES})")
+                left = (await conn.exec_driver_sql("PRAGMA freelist_count")).scalar()
+            freed += free - left
+            if left >= free:
+                break
+            free = left
+            await asyncio.sleep(self.pause)
+        return freed
+
+    async def run_once(self, today: date = None) -> dict:
+        """Один проход: итоги, архив и удаление всех логов до срока хранения, затем vacuum"""
+        started = time.perf_counter()
+        cutoff = retention_cutoff(today or date.today(), self.days)
+        report = {'cutoff': cutoff, 'logs': 0, 'summaries': 0, 'batches': 0, 'archived_bytes': 0}
+
+        after = None
+        while True:
+            async with self.database.engine.connect() as conn:
+                rows = await self._next_batch(conn, cutoff, after)
+            if not rows:
+                break
+
+            summaries = summarize(rows)
+            report['archived_bytes'] += await asyncio.to_thread(write_archive, self.archive_dir, rows)
+            report['logs'] += await self._apply(rows, summaries, cutoff)
+            report['summaries'] += len(summaries)
+            report['batches'] += 1
+            after = rows[-1].user_id
+            if report['batches'] % 100 == 0:
+                logger.info(f"🗄 Архивация логов до {cutoff}: {report['logs']} строк")
+            await asyncio.sleep(self.pause)
+
+        report['freed_pages'] = await self.vacuum()
+        report['seconds'] = round(time.perf_counter() - started, 2)
+        if report['logs']:
+            logger.info(
+                f"✅ Логи до {cutoff} свернуты: {report['logs']} строк, {report['summaries']} месячных итогов, "
+                f"архив {report['archived_bytes'] / 1024:.0f} КБ, освобождено страниц {report['freed_pages']} "
+                f"за {report['seconds']} с"
+            )
+        return report
+
+
+# Общая задача срока хранения для bot.py
+retention_job = RetentionJob(db)
+
+
+async def main():
+    logging.basicConfig(level=logging.INFO)
+    if RETENTION_DAYS <= 0:
+        print("RETENTION_DAYS=0 - логи хранятся без срока")
+        return
+    try:
+        report = await retention_job.run_once()
+    finally:
+        await db.engine.dispose()
+    print(f"Заархивировано логов: {report['logs']}, месячных итогов: {report['summaries']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,282 @@
+"""
+Пересчет серий из habit_logs
+
+current_streak, best_streak и total_days в user_habits обновляются
+инкрементально и с habit_logs не сверяются. Эта задача заново считает их по
+логам текущей привычки и исправляет расхождения.
+
+Логи читаются в порядке (user_id, log_date) кусками по chunk_rows строк с
+курсором по ключу индекса, поэтому память ограничена размером куска, а
+долгая читающая транзакция не мешает контрольным точкам WAL. Внутри куска серии
+считаются операциями NumPy над массивами, без цикла по строкам: для каждой
+отметки длина серии после нее - расстояние до последнего сброса (неудачи или
+начала пользователя). Пользователь, не закончившийся в куске, переносится в
+следующий.
+
+Месяцы старше срока хранения вместо логов представлены месячными итогами
+(database/retention.py). Для пользователей куска они читаются отдельным
+запросом и сворачиваются в начальные значения серий, от которых продолжают
+считаться логи; пользователь, от которого остались только итоги, получает
+значения по итогам.
+
+Строки, которые изменились после старта задачи (по updated_at), не трогаются:
+их серии уже пересчитал обычный путь записи.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import String, and_, bindparam, exists, or_, select, tuple_, type_coerce, update
+
+from .models import UserHabit, HabitLog, HabitMonthlySummary
+
+logger = logging.getLogger(__name__)
+
+# Строк habit_logs в одном куске (~17 байт на строку в массивах NumPy)
+REPAIR_CHUNK_ROWS = 1_000_000
+
+
+def streak_runs(user_ids: np.ndarray, successes: np.ndarray):
+    """Серии по отсортированным по пользователю отметкам
+
+    Возвращает (starts, streak): индексы начала каждого пользователя и длину
+    серии после каждой отметки.
+    """
+    n = len(user_ids)
+    positions = np.arange(n, dtype=np.int64)
+    user_start = np.empty(n, dtype=bool)
+    user_start[0] = True
+    np.not_equal(user_ids[1:], user_ids[:-1], out=user_start[1:])
+    starts = np.flatnonzero(user_start)
+
+    # Последний сброс: неудача обнуляет серию на себе, начало пользователя - перед собой
+    resets = np.where(successes, -1, positions)
+    resets[starts] = np.maximum(resets[starts], starts - 1)
+    streak = positions - np.maximum.accumulate(resets)
+    return starts, streak
+
+
+def chain_summaries(rows) -> dict:
+    """Серии по месячным итогам, идущим по (user_id, month)
+
+    rows - (user_id, reset, successes, leading, run_best, trailing).
+    Возвращает {user_id: (current, best, total)} на конец последнего месяца.
+    """
+    seeds = {}
+    for user_id, reset, successes, leading, run_best, trailing in rows:
+        current, best, total = seeds.get(user_id, (0, 0, 0))
+        if reset:
+            best = max(best, current + leading, run_best)
+            current = trailing
+        else:
+            current += successes
+            best = max(best, current)
+        seeds[user_id] = (current, best, total + successes)
+    return seeds
+
+
+def fold_chunk(user_ids: np.ndarray, successes: np.ndarray, carry=None, seeds: dict = None):
+    """Посчитать серии куска с учетом того, с чем пользователи в него пришли
+
+    seeds - {user_id: (current, best, total)} по месячным итогам пользователей
+    куска; пользователи из seeds без логов в куске считаются завершенными.
+    carry и последний элемент ответа - (user_id, current, best, total) для
+    пользователя, который может продолжиться в следующем куске. Возвращает
+    (массивы user_id, current, best, total для завершенных пользователей, carry).
+    """
+    starts, streak = streak_runs(user_ids, successes)
+    ends = np.append(starts[1:], len(user_ids))
+
+    users = user_ids[starts]
+    current = streak[ends - 1]
+    best = np.maximum.reduceat(streak, starts)
+    total = np.add.reduceat(successes.astype(np.int64), starts)
+
+    seeds = dict(seeds or {})
+    if carry is not None and carry[0] == users[0]:
+        seeds[carry[0]] = carry[1:]
+        carry = None
+    if seeds:
+        seed_users = np.fromiter(seeds, dtype=np.int64, count=len(seeds))
+        seed_values = np.array(list(seeds.values()), dtype=np.int64).reshape(-1, 3)
+        order = np.argsort(seed_users)
+        seed_users, seed_values = seed_users[order], seed_values[order]
+        index = np.minimum(np.searchsorted(seed_users, users), len(seed_users) - 1)
+        found = seed_users[index] == users
+        seed_current, seed_best, seed_total = (np.where(found, seed_values[index, k], 0) for k in range(3))
+
+        # Успехи до первой неудачи продолжают серию, с которой пользователь пришел
+        first_failure = np.minimum.reduceat(np.where(successes, len(successes), np.arange(len(successes))), starts)
+        leading = np.minimum(first_failure, ends) - starts
+        best = np.maximum.reduce([best, seed_best, seed_current + leading])
+        current = np.where(first_failure >= ends, current + seed_current, current)
+        total = total + seed_total
+
+        # Пользователи, от которых остались только месячные итоги
+        only_seeds = np.ones(len(seed_users), dtype=bool)
+        only_seeds[index[found]] = False
+        # (последний пользователь куска остается последним - он уходит в carry)
+        if only_seeds.any():
+            users = np.concatenate((seed_users[only_seeds], users))
+            current = np.concatenate((seed_values[only_seeds, 0], current))
+            best = np.concatenate((seed_values[only_seeds, 1], best))
+            total = np.concatenate((seed_values[only_seeds, 2], total))
+
+    if carry is not None:
+        users = np.insert(users, 0, carry[0])
+        current = np.insert(current, 0, carry[1])
+        best = np.insert(best, 0, carry[2])
+        total = np.insert(total, 0, carry[3])
+
+    carry = (users[-1], current[-1], best[-1], total[-1])
+    return (users[:-1], current[:-1], best[:-1], total[:-1]), carry
+
+
+async def repair_streaks(engine, chunk_rows: int = REPAIR_CHUNK_ROWS) -> dict:
+    """Пересчитать серии всех пользователей и исправить расходящиеся строки user_habits
+
+    Возвращает отчет: сколько логов прочитано, пользователей проверено и исправлено.
+    """
+    started_at = datetime.utcnow()
+    started = time.perf_counter()
+    habits = UserHabit.__table__
+    logs = HabitLog.__table__
+
+    # Логи текущей привычки, записанные после ее выбора
+    owned = and_(
+        habits.c.user_id == logs.c.user_id,
+        habits.c.current_habit == logs.c.habit_name,
+        logs.c.log_date >= habits.c.created_at,
+    )
+    # log_date нужен только для курсора - читаем его строкой, без разбора в datetime
+    log_date = type_coerce(logs.c.log_date, String)
+    page = (
+        select(logs.c.user_id, logs.c.success, log_date, logs.c.id)
+        .join(habits, owned)
+        .order_by(logs.c.user_id, logs.c.log_date, logs.c.id)
+        .limit(chunk_rows)
+    )
+    # Месячные итоги текущей привычки за месяцы после ее выбора
+    summaries = HabitMonthlySummary.__table__
+    owned_summary = and_(
+        habits.c.user_id == summaries.c.user_id,
+        habits.c.current_habit == summaries.c.habit_name,
+        summaries.c.first_log_at >= habits.c.created_at,
+    )
+    seed_page = (
+        select(summaries.c.user_id, summaries.c.reset, summaries.c.successes,
+               summaries.c.leading, summaries.c.run_best, summaries.c.trailing)
+        .join(habits, owned_summary)
+        .order_by(summaries.c.user_id, summaries.c.month)
+    )
+
+    async def load_seeds(after, until) -> dict:
+        """Начальные серии пользователей с after < user_id <= until (None - без границы)"""
+        stmt = seed_page
+        if after is not None:
+            stmt = stmt.where(summaries.c.user_id > after)
+        if until is not None:
+            stmt = stmt.where(summaries.c.user_id <= until)
+        async with engine.connect() as conn:
+            return chain_summaries(await conn.execute(stmt))
+
+    not_touched = or_(habits.c.updated_at.is_(None), habits.c.updated_at <= started_at)
+    fix = (
+        update(habits)
+        .where(
+            habits.c.user_id == bindparam('b_user_id'),
+            not_touched,
+            or_(
+                habits.c.current_streak.is_distinct_from(bindparam('b_current')),
+                habits.c.best_streak.is_distinct_from(bindparam('b_best')),
+                habits.c.total_days.is_distinct_from(bindparam('b_total')),
+            ),
+        )
+        .values(
+            current_streak=bindparam('b_current'),
+            best_streak=bindparam('b_best'),
+            total_days=bindparam('b_total'),
+        )
+    )
+
+    report = {'logs': 0, 'users': 0, 'corrected': 0}
+
+    async def apply(users, current, best, total):
+        if not len(users):
+            return
+        params = [
+            {'b_user_id': u, 'b_current': c, 'b_best': b, 'b_total': t}
+            for u, c, b, t in zip(users.tolist(), current.tolist(), best.tolist(), total.tolist())
+        ]
+        async with engine.begin() as conn:
+            result = await conn.execute(fix, params)
+        report['users'] += len(params)
+        report['corrected'] += max(result.rowcount, 0)
+
+    carry = None
+    cursor = None
+    while True:
+        stmt = page
+        if cursor is not None:
+            stmt = stmt.where(tuple_(logs.c.user_id, log_date, logs.c.id) > tuple_(*cursor))
+        async with engine.connect() as conn:
+            rows = (await conn.execute(stmt)).all()
+        if not rows:
+            break
+
+        user_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        successes = np.fromiter((row[1] for row in rows), dtype=bool, count=len(rows))
+        seeds = await load_seeds(cursor[0] if cursor else None, rows[-1][0])
+        done, carry = fold_chunk(user_ids, successes, carry, seeds)
+        cursor = (rows[-1][0], rows[-1][2], rows[-1][3])
+        report['logs'] += len(rows)
+        await apply(*done)
+        logger.info(f"🔄 Пересчет серий: прочитано {report['logs']} логов")
+
+    if carry is not None:
+        await apply(*(np.array([value]) for value in carry))
+    # Пользователи после последнего лога, от которых остались только месячные итоги
+    seeds = await load_seeds(cursor[0] if cursor else None, None)
+    if seeds:
+        values = np.array(list(seeds.values()), dtype=np.int64).reshape(-1, 3)
+        await apply(np.fromiter(seeds, dtype=np.int64, count=len(seeds)), *values.T)
+
+    # Привычки без единого лога и месячного итога текущей привычки должны иметь нулевые счетчики
+    async with engine.begin() as conn:
+        result = await conn.execute(
+            update(habits)
+            .where(
+                not_touched,
+                or_(habits.c.current_streak != 0, habits.c.best_streak != 0, habits.c.total_days != 0),
+                ~exists().where(owned),
+                ~exists().where(owned_summary),
+            )
+            .values(current_streak=0, best_streak=0, total_days=0)
+        )
+        report['corrected'] += max(result.rowcount, 0)
+
+    report['seconds'] = round(time.perf_counter() - started, 2)
+    logger.info(
+        f"✅ Серии пересчитаны: {report['logs']} логов, {report['users']} пользователей, "
+        f"исправлено {report['corrected']} за {report['seconds']} с"
+    )
+    return report
+
+
+async def main():
+    from config import DATABASE_URL, DB_PROFILE
+    from .engine import create_engine_for_profile
+
+    logging.basicConfig(level=logging.INFO)
+    engine = create_engine_for_profile(DATABASE_URL, DB_PROFILE)
+    try:
+        report = await repair_streaks(engine)
+    finally:
+        await engine.dispose()
+    print(f"Исправлено пользователей: {report['corrected']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
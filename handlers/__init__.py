@@ -13,6 +13,12 @@ from .habit_handlers import (
     process_positive_habit,
     process_daily_check
 )
+from .export_handlers import cmd_export, cmd_export_all
+from .reminder_handlers import (
+    reminder_settings_start,
+    process_timezone,
+    process_reminder_time
+)
 
 __all__ = [
     'cmd_start',
@@ -26,5 +32,10 @@ __all__ = [
     'process_habit_type',
     'process_negative_habit',
     'process_positive_habit',
-    'process_daily_check'
+    'process_daily_check',
+    'reminder_settings_start',
+    'process_timezone',
+    'process_reminder_time',
+    'cmd_export',
+    'cmd_export_all'
 ]
\ No newline at end of file
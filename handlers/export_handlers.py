@@ -0,0 +1,55 @@
+import logging
+
+from aiogram import types
+from aiogram.filters import CommandObject
+from aiogram.types import FSInputFile
+
+from services.export import EXPORT_FORMATS, TELEGRAM_UPLOAD_LIMIT, export_all, export_user
+from utils.texts import render
+
+logger = logging.getLogger(__name__)
+
+
+def _format(command: CommandObject) -> str:
+    """Формат из аргумента команды: /export json, иначе CSV"""
+    fmt = (command.args or "").strip().lower()
+    return fmt if fmt in EXPORT_FORMATS else "csv"
+
+
+async def cmd_export(message: types.Message, command: CommandObject):
+    user_id = message.from_user.id
+    try:
+        document, rows = await export_user(user_id, _format(command))
+    except Exception as e:
+        logger.error(f"❌ Ошибка выгрузки истории: {e}", extra={'user_id': user_id, 'handler': 'cmd_export'})
+        await message.answer(render('export_error'))
+        return
+
+    try:
+        if not rows:
+            await message.answer(render('export_empty'))
+            return
+        await message.answer_document(document, caption=render('export_ready', rows=rows))
+    finally:
+        document.spool.close()
+
+
+async def cmd_export_all(message: types.Message, command: CommandObject):
+    """Выгрузка логов всех пользователей (только ADMIN_IDS, см. bot.py)"""
+    user_id = message.from_user.id
+    await message.answer(render('export_all_started'))
+    try:
+        report = await export_all(_format(command))
+    except Exception as e:
+        logger.error(f"❌ Ошибка выгрузки всех логов: {e}", extra={'user_id': user_id, 'handler': 'cmd_export_all'})
+        await message.answer(render('export_error'))
+        return
+
+    size_mb = report['bytes'] / 2**20
+    if report['bytes'] > TELEGRAM_UPLOAD_LIMIT:
+        await message.answer(render('export_all_too_big', rows=report['rows'], size_mb=size_mb, path=report['path']))
+        return
+    await message.answer_document(
+        FSInputFile(report['path']),
+        caption=render('export_all_ready', rows=report['rows'], size_mb=size_mb, seconds=report['seconds']),
+    )
@@ -1,30 +1,41 @@
+import logging
 from aiogram import types, F
 from aiogram.fsm.context import FSMContext
 from database.database import db
+from database.checkin_writer import checkin_writer
 from utils.states import HabitStates
 from keyboards.keyboards import (
     get_main_menu_keyboard, get_habit_type_keyboard,
     get_negative_habits_keyboard, get_positive_habits_keyboard,
-    get_daily_check_keyboard, get_negative_check_keyboard
+    get_daily_check_keyboard, get_negative_check_keyboard,
+    BTN_QUIT_HABIT, SUCCESS_BUTTONS
 )
-from services.reminder_service import schedule_reminders
+from services.reminder_service import start_habit
+from handlers.start_handlers import cmd_menu
+from utils.texts import render
+
+logger = logging.getLogger(__name__)
 
 
 async def go_back(message: types.Message, state: FSMContext):
     current_state = await state.get_state()
 
     if current_state in [HabitStates.choosing_negative_habit, HabitStates.choosing_positive_habit]:
-        await message.answer("Выбери тип привычки:", reply_markup=get_habit_type_keyboard())
+        await message.answer(render('choose_habit_type'), reply_markup=get_habit_type_keyboard())
         await state.set_state(HabitStates.choosing_habit_type)
+    elif current_state in [HabitStates.choosing_timezone, HabitStates.choosing_reminder_time]:
+        # Настройка напоминаний отменена - возвращаемся в меню
+        await state.clear()
+        await cmd_menu(message)
 
 
 async def process_habit_type(message: types.Message, state: FSMContext):
-    if message.text == "❌ Отказаться от":
-        await message.answer("Выбери привычку, от которой хочешь отказаться:",
+    if message.text == BTN_QUIT_HABIT:
+        await message.answer(render('choose_negative_habit'),
                              reply_markup=get_negative_habits_keyboard())
         await state.set_state(HabitStates.choosing_negative_habit)
     else:
-        await message.answer("Выбери привычку, которую хочешь приобрести:",
+        await message.answer(render('choose_positive_habit'),
                              reply_markup=get_positive_habits_keyboard())
         await state.set_state(HabitStates.choosing_positive_habit)
 
@@ -33,55 +44,52 @@ async def process_negative_habit(message: types.Message, state: FSMContext):
     user_id = message.from_user.id
     habit = message.text
 
-    await db.create_user_habit(user_id, habit, "negative")
+    # Сохраняем привычку и запускаем ежедневные напоминания
+    next_at = await start_habit(user_id, habit, "negative")
 
-    await message.answer(
-        f"Отлично! Теперь мы будем каждый день отслеживать: {habit}.\n"
-        f"Я буду напоминать тебе утром и спрашивать вечером о результате.",
-        reply_markup=get_main_menu_keyboard()
-    )
+    await message.answer(render('habit_set_negative', habit=habit, time=f"{next_at:%H:%M}", timezone=next_at.tzinfo),
+                         reply_markup=get_main_menu_keyboard())
     await state.clear()
 
-    # Запускаем напоминания
-    await schedule_reminders(user_id, habit, "negative")
-
 
 async def process_positive_habit(message: types.Message, state: FSMContext):
     user_id = message.from_user.id
     habit = message.text
 
-    await db.create_user_habit(user_id, habit, "positive")
+    # Сохраняем привычку и запускаем ежедневные напоминания
+    next_at = await start_habit(user_id, habit, "positive")
 
-    await message.answer(
-        f"Отлично! Теперь мы будем каждый день отслеживать: {habit}.\n"
-        f"Я буду напоминать тебе в подходящее время.",
-        reply_markup=get_main_menu_keyboard()
-    )
+    await message.answer(render('habit_set_positive', habit=habit, time=f"{next_at:%H:%M}", timezone=next_at.tzinfo),
+                         reply_markup=get_main_menu_keyboard())
     await state.clear()
 
-    # Запускаем напоминания
-    await schedule_reminders(user_id, habit, "positive")
-
 
 async def process_daily_check(message: types.Message):
     user_id = message.from_user.id
     habit = await db.get_user_habit(user_id)
 
     if not habit:
-        await message.answer("Сначала выбери привычку через /start")
+        await message.answer(render('need_habit'))
         return
 
-    success = message.text in ["✅ Сделал(а)", "✅ Да, удалось!"]
+    success = message.text in SUCCESS_BUTTONS
 
-    # Используем упрощенную версию для отладки
-    updated_habit = await db.add_habit_log_simple(user_id, habit.current_habit, success)
+    # Отметка уходит общему писателю и сохраняется групповым коммитом
+    try:
+        updated_habit, counted = await checkin_writer.submit(user_id, habit.current_habit, success)
+    except Exception as e:
+        logger.error(f"❌ Ошибка сохранения отметки: {e}", extra={'user_id': user_id, 'handler': 'process_daily_check'})
+        updated_habit, counted = None, False
 
-    if updated_habit:
+    if updated_habit and not counted:
+        # Сегодня привычка уже отмечена - повторное нажатие ничего не меняет
+        response = render('check_already', streak=updated_habit.current_streak)
+    elif updated_habit:
         if success:
-            response = f"Отлично! Ты молодец. Твоя серия: {updated_habit.current_streak} дней подряд!"
+            response = render('check_success', streak=updated_habit.current_streak)
         else:
-            response = "Бывает. Главное — не сдаваться. Завтра новый день!"
+            response = render('check_failure')
     else:
-        response = "Произошла ошибка при сохранении результата. Попробуй еще раз."
+        response = render('check_error')
 
     await message.answer(response, reply_markup=get_main_menu_keyboard())
\ No newline at end of file
@@ -1,29 +1,67 @@
+import logging
 from aiogram import types, F
 from aiogram.fsm.context import FSMContext
+from aiogram.types import BufferedInputFile
+from datetime import timedelta
 from database.database import db
+from database.cache import MISSING
+from services.charts import chart_renderer
 from utils.states import HabitStates
 from keyboards.keyboards import get_main_menu_keyboard, get_confirmation_keyboard, get_habit_type_keyboard
 from handlers.start_handlers import cmd_menu
+from utils.texts import render
+
+logger = logging.getLogger(__name__)
+
 
 async def show_current_habit(message: types.Message):
     await cmd_menu(message)
 
 
+def render_calendar(calendar: dict, start, days: int) -> str:
+    """Календарь по дням: ✅ был успех, ❌ только срывы, ▫️ отметок не было"""
+    cells = []
+    for offset in range(days):
+        successes, failures = calendar.get(start + timedelta(days=offset), (0, 0))
+        cells.append("✅" if successes else "❌" if failures else "▫️")
+    return "\n".join("".join(cells[i:i + 7]) for i in range(0, days, 7))
+
+
 async def show_statistics(message: types.Message):
     user_id = message.from_user.id
-    habit = await db.get_user_habit(user_id)
+    text = db.cache.get_text(user_id, 'statistics')
+    if text is MISSING:
+        stats = await db.get_habit_stats(user_id)
+        if not stats:
+            await message.answer(render('need_habit'))
+            return
 
-    if not habit:
-        await message.answer("Сначала выбери привычку через /start")
-        return
+        habit = stats['habit']
+        days = stats['calendar_days']
+        text = render(
+            'statistics',
+            habit=habit.current_habit,
+            streak=habit.current_streak,
+            best_streak=habit.best_streak,
+            total_days=habit.total_days,
+            weekly_rate=stats['weekly_rate'],
+            monthly_rate=stats['monthly_rate'],
+            days=days,
+            calendar_start=stats['calendar_start'],
+            calendar=render_calendar(stats['calendar'], stats['calendar_start'], days),
+        )
+        db.cache.put_text(user_id, 'statistics', text)
 
-    stats = (
-        f"📊 Статистика по привычке '{habit.current_habit}':\n"
-        f"🔥 Текущая серия: {habit.current_streak} дней\n"
-        f"🏆 Лучшая серия: {habit.best_streak} дней\n"
-        f"📅 Всего дней с привычкой: {habit.total_days}"
-    )
-    await message.answer(stats)
+    # График прогресса с текстом в подписи; без графика - только текст
+    try:
+        chart = await chart_renderer.chart(user_id)
+    except Exception as e:
+        logger.error(f"❌ Ошибка отрисовки графика: {e}", extra={'user_id': user_id, 'handler': 'show_statistics'})
+        chart = None
+    if chart:
+        await message.answer_photo(BufferedInputFile(chart, "progress.png"), caption=text)
+    else:
+        await message.answer(text)
 
 
 async def change_habit_start(message: types.Message, state: FSMContext):
@@ -31,18 +69,18 @@ async def change_habit_start(message: types.Message, state: FSMContext):
     habit = await db.get_user_habit(user_id)
 
     if not habit:
-        await message.answer("Сначала выбери привычку через /start")
+        await message.answer(render('need_habit'))
         return
 
     await message.answer(
-        f"Ты уверен? Текущая серия из {habit.current_streak} дней будет сброшена.",
+        render('change_confirm', streak=habit.current_streak),
         reply_markup=get_confirmation_keyboard()
     )
     await state.set_state(HabitStates.confirming_change)
 
 
 async def confirm_habit_change(message: types.Message, state: FSMContext):
-    await message.answer("Хорошо! Давай выберем новую цель.",
+    await message.answer(render('change_accepted'),
                          reply_markup=get_habit_type_keyboard())
     await state.set_state(HabitStates.choosing_habit_type)
 
@@ -50,6 +88,6 @@ async def confirm_habit_change(message: types.Message, state: FSMContext):
 async def cancel_habit_change(message: types.Message, state: FSMContext):
     user_id = message.from_user.id
     habit = await db.get_user_habit(user_id)
-    await message.answer(f"Отлично! Продолжаем работать над '{habit.current_habit}'.",
+    await message.answer(render('change_cancelled', habit=habit.current_habit),
                          reply_markup=get_main_menu_keyboard())
     await state.clear()
\ No newline at end of file
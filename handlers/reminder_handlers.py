@@ -0,0 +1,51 @@
+from aiogram import types
+from aiogram.fsm.context import FSMContext
+from database.database import db
+from utils.states import HabitStates
+from utils.timezones import describe, parse_timezone, parse_reminder_time
+from keyboards.keyboards import get_main_menu_keyboard, get_timezone_keyboard, get_reminder_time_keyboard
+from services.reminder_service import reschedule_reminders
+from utils.texts import render
+
+
+async def reminder_settings_start(message: types.Message, state: FSMContext):
+    settings = await db.get_reminder_settings(message.from_user.id)
+    zone_name, reminder_time = describe(*(settings or (None, None)))
+
+    await message.answer(render('reminder_settings', time=reminder_time, timezone=zone_name),
+                         reply_markup=get_timezone_keyboard())
+    await state.set_state(HabitStates.choosing_timezone)
+
+
+async def process_timezone(message: types.Message, state: FSMContext):
+    zone_name = parse_timezone(message.text)
+    if zone_name is None:
+        await message.answer(render('timezone_unknown'))
+        return
+
+    await state.update_data(timezone=zone_name)
+    await message.answer(render('choose_reminder_time', timezone=zone_name),
+                         reply_markup=get_reminder_time_keyboard())
+    await state.set_state(HabitStates.choosing_reminder_time)
+
+
+async def process_reminder_time(message: types.Message, state: FSMContext):
+    user_id = message.from_user.id
+    reminder_time = parse_reminder_time(message.text)
+    if reminder_time is None:
+        await message.answer(render('time_unknown'))
+        return
+
+    zone_name = (await state.get_data()).get('timezone')
+    if not await db.set_reminder_settings(user_id, timezone=zone_name, reminder_time=reminder_time):
+        await message.answer(render('error_restart'))
+        await state.clear()
+        return
+
+    # Новое время действует уже для ближайшего напоминания
+    next_at = await reschedule_reminders(user_id)
+    zone_name, shown_time = describe(zone_name, reminder_time)
+    await message.answer(render('reminder_saved' if next_at else 'reminder_saved_no_habit',
+                                time=shown_time, timezone=zone_name),
+                         reply_markup=get_main_menu_keyboard())
+    await state.clear()
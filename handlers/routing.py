@@ -0,0 +1,119 @@
+"""
+Маршрутизация нажатий кнопок
+
+Вместо цепочки фильтров F.text == ... (aiogram проверяет их по очереди для
+каждого сообщения) все кнопки разбираются одним словарем
+(состояние FSM, текст кнопки) -> обработчик. Поиск - два обращения к словарю:
+сначала точное состояние, затем ANY_STATE для кнопок, работающих в любом
+состоянии.
+
+Таблица строится из раскладок keyboards/keyboards.py: кнопка, добавленная в
+раскладку, сразу попадает в маршруты своего обработчика.
+"""
+import inspect
+import logging
+import time
+from typing import Callable, Dict, Optional, Tuple, Union
+
+from aiogram import types
+from aiogram.filters import Filter
+from aiogram.fsm.context import FSMContext
+
+from keyboards.keyboards import (
+    BTN_BACK, BTN_CHANGE_HABIT, BTN_CURRENT_HABIT, BTN_STATISTICS, BTN_REMINDERS,
+    BTN_CONFIRM_CHANGE, BTN_CANCEL_CHANGE,
+    HABIT_TYPE_LAYOUT, NEGATIVE_HABITS_LAYOUT, POSITIVE_HABITS_LAYOUT,
+    DAILY_CHECK_LAYOUT, NEGATIVE_CHECK_LAYOUT, TIMEZONE_LAYOUT, REMINDER_TIME_LAYOUT,
+    layout_buttons
+)
+from utils.states import HabitStates
+from .menu_handlers import (
+    show_current_habit, show_statistics, change_habit_start,
+    confirm_habit_change, cancel_habit_change
+)
+from .habit_handlers import (
+    go_back, process_habit_type, process_negative_habit,
+    process_positive_habit, process_daily_check
+)
+from .reminder_handlers import reminder_settings_start, process_timezone, process_reminder_time
+
+logger = logging.getLogger(__name__)
+
+# Ключ состояния для кнопок, которые работают в любом состоянии
+ANY_STATE = None
+
+# (состояние, текст) -> (обработчик, принимает ли он FSMContext)
+Routes = Dict[Tuple[Optional[str], str], Tuple[Callable, bool]]
+
+
+def build_routes() -> Routes:
+    """Собрать таблицу маршрутов из раскладок клавиатур"""
+    routes: Routes = {}
+    routed_texts = set()
+
+    def route(state, texts, handler):
+        state_name = state.state if state is not ANY_STATE else ANY_STATE
+        takes_state = 'state' in inspect.signature(handler).parameters
+        for text in texts:
+            if text == BTN_BACK and handler is not go_back:
+                continue
+            # Кнопка "в любом состоянии" перекрыла бы такую же кнопку конкретного состояния
+            if (state_name, text) in routes or (ANY_STATE, text) in routes or (
+                    state_name is ANY_STATE and text in routed_texts):
+                raise ValueError(f"Кнопка {text!r} привязана к нескольким обработчикам")
+            routes[(state_name, text)] = (handler, takes_state)
+            routed_texts.add(text)
+
+    # Главное меню и "Назад" - в любом состоянии
+    route(ANY_STATE, [BTN_CURRENT_HABIT], show_current_habit)
+    route(ANY_STATE, [BTN_STATISTICS], show_statistics)
+    route(ANY_STATE, [BTN_CHANGE_HABIT], change_habit_start)
+    route(ANY_STATE, [BTN_REMINDERS], reminder_settings_start)
+    route(ANY_STATE, [BTN_BACK], go_back)
+
+    # Смена привычки
+    route(HabitStates.confirming_change, [BTN_CONFIRM_CHANGE], confirm_habit_change)
+    route(HabitStates.confirming_change, [BTN_CANCEL_CHANGE], cancel_habit_change)
+
+    # Выбор привычек
+    route(HabitStates.choosing_habit_type, layout_buttons(HABIT_TYPE_LAYOUT), process_habit_type)
+    route(HabitStates.choosing_negative_habit, layout_buttons(NEGATIVE_HABITS_LAYOUT), process_negative_habit)
+    route(HabitStates.choosing_positive_habit, layout_buttons(POSITIVE_HABITS_LAYOUT), process_positive_habit)
+
+    # Настройка напоминаний; пояс и время, присланные текстом, ловят обработчики
+    # состояний в bot.py
+    route(HabitStates.choosing_timezone, layout_buttons(TIMEZONE_LAYOUT), process_timezone)
+    route(HabitStates.choosing_reminder_time, layout_buttons(REMINDER_TIME_LAYOUT), process_reminder_time)
+
+    # Ежедневные проверки
+    route(ANY_STATE, layout_buttons(DAILY_CHECK_LAYOUT) + layout_buttons(NEGATIVE_CHECK_LAYOUT), process_daily_check)
+    return routes
+
+
+class ButtonRoute(Filter):
+    """Фильтр, находящий обработчик кнопки по (состояние, текст) за O(1)"""
+
+    def __init__(self, routes: Routes):
+        self.routes = routes
+
+    async def __call__(self, message: types.Message, raw_state: Optional[str] = None) -> Union[bool, dict]:
+        text = message.text
+        route = self.routes.get((raw_state, text)) or self.routes.get((ANY_STATE, text))
+        if route is None:
+            return False
+        return {'route': route}
+
+
+async def dispatch_button(message: types.Message, state: FSMContext, route: tuple):
+    handler, takes_state = route
+    started = time.perf_counter()
+    if takes_state:
+        await handler(message, state)
+    else:
+        await handler(message)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("🔘 Кнопка обработана", extra={
+            'user_id': message.from_user.id,
+            'handler': handler.__name__,
+            'duration_ms': round((time.perf_counter() - started) * 1000, 1),
+        })
@@ -1,59 +1,56 @@
+import logging
+import time
+
 from aiogram import types, F
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from database.database import db
 from utils.states import HabitStates
 from keyboards.keyboards import get_habit_type_keyboard, get_main_menu_keyboard
+from utils.texts import render
+
+logger = logging.getLogger(__name__)
 
 
 async def cmd_start(message: types.Message, state: FSMContext):
     user_id = message.from_user.id
+    started = time.perf_counter()
+    log_fields = {'user_id': user_id, 'handler': 'cmd_start'}
 
     try:
         # Создаем/получаем пользователя
-        user = await db.get_or_create_user(
+        changed = await db.get_or_create_user(
             user_id=user_id,
             username=message.from_user.username,
             first_name=message.from_user.first_name
         )
-        # ОШИБКА: Использование print вместо logging
-        print(f"✅ Пользователь создан/получен: {user_id}")
+        logger.debug(f"✅ Пользователь создан/получен (изменен: {changed})", extra=log_fields)
 
         # Проверяем есть ли привычка
         habit = await db.get_user_habit(user_id)
-        # ОШИБКА: Использование print вместо logging
-        print(f"✅ Привычка получена: {habit}")
+        logger.debug(f"✅ Привычка получена: {habit}", extra=log_fields)
 
         if habit:
             # Если привычка есть - показываем меню
-            habit_info = (
-                f"С возвращением! 👋\n"
-                f"📋 Текущая привычка: {habit.current_habit}\n"
-                f"🔥 Текущая серия: {habit.current_streak} дней"
-            )
+            habit_info = db.cache.cached_text(user_id, 'welcome', lambda: render(
+                'welcome_back', habit=habit.current_habit, streak=habit.current_streak
+            ))
             await message.answer(habit_info, reply_markup=get_main_menu_keyboard())
             await state.clear()
-            # ОШИБКА: Использование print вместо logging
-            print("✅ Показано главное меню")
+            outcome = "✅ Показано главное меню"
         else:
             # Если привычки нет - предлагаем выбрать
-            await message.answer(
-                "Привет! Я помогу тебе работать с одной привычкой. "
-                "Выбери, что для тебя важнее всего прямо сейчас.",
-                reply_markup=get_habit_type_keyboard()
-            )
+            await message.answer(render('welcome_new'), reply_markup=get_habit_type_keyboard())
             await state.set_state(HabitStates.choosing_habit_type)
-            # ОШИБКА: Использование print вместо logging
-            print("✅ Перешли к выбору типа привычки")
+            outcome = "✅ Перешли к выбору типа привычки"
+
+        log_fields['duration_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        logger.info(outcome, extra=log_fields)
 
     except Exception as e:
-        # ОШИБКА: Использование print вместо logging
-        print(f"❌ Ошибка в cmd_start: {e}")
+        logger.error(f"❌ Ошибка в cmd_start: {e}", extra=log_fields)
         # Показываем меню даже при ошибке
-        await message.answer(
-            "Привет! Давайте выберем привычку для отслеживания.",
-            reply_markup=get_habit_type_keyboard()
-        )
+        await message.answer(render('welcome_fallback'), reply_markup=get_habit_type_keyboard())
         await state.set_state(HabitStates.choosing_habit_type)
 
 
@@ -63,21 +60,15 @@ async def cmd_menu(message: types.Message):
         habit = await db.get_user_habit(user_id)
 
         if not habit:
-            await message.answer(
-                "У вас еще нет привычки. Выберите ее через /start",
-                reply_markup=get_habit_type_keyboard()
-            )
+            await message.answer(render('no_habit_yet'), reply_markup=get_habit_type_keyboard())
             return
 
-        habit_info = (
-            f"📋 Текущая привычка: {habit.current_habit}\n"
-            f"🔥 Текущая серия: {habit.current_streak} дней\n"
-            f"🏆 Лучшая серия: {habit.best_streak} дней\n"
-            f"📅 Всего дней с привычкой: {habit.total_days}"
-        )
+        habit_info = db.cache.cached_text(user_id, 'menu', lambda: render(
+            'menu', habit=habit.current_habit, streak=habit.current_streak,
+            best_streak=habit.best_streak, total_days=habit.total_days
+        ))
 
         await message.answer(habit_info, reply_markup=get_main_menu_keyboard())
     except Exception as e:
-        # ОШИБКА: Использование print вместо logging
-        print(f"❌ Ошибка в cmd_menu: {e}")
-        await message.answer("Произошла ошибка. Попробуйте /start")
\ No newline at end of file
+        logger.error(f"❌ Ошибка в cmd_menu: {e}", extra={'user_id': user_id, 'handler': 'cmd_menu'})
+        await message.answer(render('error_restart'))
\ No newline at end of file
@@ -5,7 +5,10 @@ from .keyboards import (
     get_positive_habits_keyboard,
     get_daily_check_keyboard,
     get_negative_check_keyboard,
-    get_confirmation_keyboard
+    get_confirmation_keyboard,
+    layout_buttons,
+    prebuilt_markup_json,
+    KEYBOARDS
 )
 
 __all__ = [
@@ -15,5 +18,8 @@ __all__ = [
     'get_positive_habits_keyboard',
     'get_daily_check_keyboard',
     'get_negative_check_keyboard',
-    'get_confirmation_keyboard'
+    'get_confirmation_keyboard',
+    'layout_buttons',
+    'prebuilt_markup_json',
+    'KEYBOARDS'
 ]
\ No newline at end of file
@@ -1,63 +1,136 @@
+import json
+from types import MappingProxyType
+from typing import Optional
+
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
+from pydantic import ConfigDict
 
-def get_main_menu_keyboard():
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="🔄 Сменить привычку"), KeyboardButton(text="📊 Статистика")],
-            [KeyboardButton(text="📋 Текущая привычка")]
-        ],
+# Тексты кнопок. По ним же строится таблица маршрутов в handlers/routing.py,
+# поэтому подписи и обработчики не могут разойтись.
+BTN_CHANGE_HABIT = "🔄 Сменить привычку"
+BTN_STATISTICS = "📊 Статистика"
+BTN_CURRENT_HABIT = "📋 Текущая привычка"
+BTN_BACK = "🔙 Назад"
+BTN_QUIT_HABIT = "❌ Отказаться от"
+BTN_GAIN_HABIT = "✅ Приобрести"
+BTN_DONE = "✅ Сделал(а)"
+BTN_NOT_DONE = "❌ Не сделал(а)"
+BTN_RESISTED = "✅ Да, удалось!"
+BTN_NOT_RESISTED = "❌ Нет, не удалось"
+BTN_CONFIRM_CHANGE = "✅ Да, сменить"
+BTN_CANCEL_CHANGE = "❌ Нет, остаться"
+BTN_REMINDERS = "⏰ Напоминания"
+
+NEGATIVE_HABITS = ["Курение", "Алкоголь", "Телефон допоздна", "Прокрастинация", "Недостаток сна"]
+POSITIVE_HABITS = ["Зарядка утром", "Медитация", "Пить воду", "Чтение книг", "Режим питания"]
+# Кнопка выбора часового пояса -> имя IANA (другие пояса можно прислать текстом)
+TIMEZONE_BUTTONS = {
+    "Калининград UTC+2": "Europe/Kaliningrad",
+    "Москва UTC+3": "Europe/Moscow",
+    "Самара UTC+4": "Europe/Samara",
+    "Екатеринбург UTC+5": "Asia/Yekaterinburg",
+    "Омск UTC+6": "Asia/Omsk",
+    "Новосибирск UTC+7": "Asia/Novosibirsk",
+    "Иркутск UTC+8": "Asia/Irkutsk",
+    "Якутск UTC+9": "Asia/Yakutsk",
+    "Владивосток UTC+10": "Asia/Vladivostok",
+    "Магадан UTC+11": "Asia/Magadan",
+    "Камчатка UTC+12": "Asia/Kamchatka",
+}
+# Готовые варианты времени напоминания (любое другое можно прислать текстом)
+REMINDER_TIMES = ["07:00", "08:00", "09:00", "12:00", "18:00", "20:00", "21:00", "22:00"]
+
+# Раскладки клавиатур: строки кнопок
+MAIN_MENU_LAYOUT = [[BTN_CHANGE_HABIT, BTN_STATISTICS], [BTN_CURRENT_HABIT, BTN_REMINDERS]]
+HABIT_TYPE_LAYOUT = [[BTN_QUIT_HABIT, BTN_GAIN_HABIT], [BTN_BACK]]
+NEGATIVE_HABITS_LAYOUT = [NEGATIVE_HABITS[0:2], NEGATIVE_HABITS[2:4], [NEGATIVE_HABITS[4], BTN_BACK]]
+POSITIVE_HABITS_LAYOUT = [POSITIVE_HABITS[0:2], POSITIVE_HABITS[2:4], [POSITIVE_HABITS[4], BTN_BACK]]
+DAILY_CHECK_LAYOUT = [[BTN_DONE, BTN_NOT_DONE]]
+NEGATIVE_CHECK_LAYOUT = [[BTN_RESISTED, BTN_NOT_RESISTED]]
+CONFIRMATION_LAYOUT = [[BTN_CONFIRM_CHANGE, BTN_CANCEL_CHANGE]]
+_ZONES = list(TIMEZONE_BUTTONS)
+TIMEZONE_LAYOUT = [_ZONES[i:i + 2] for i in range(0, 10, 2)] + [[_ZONES[10], BTN_BACK]]
+REMINDER_TIME_LAYOUT = [REMINDER_TIMES[0:3], REMINDER_TIMES[3:6], REMINDER_TIMES[6:8] + [BTN_BACK]]
+
+# Ответы на ежедневную проверку, означающие успех
+SUCCESS_BUTTONS = frozenset([BTN_DONE, BTN_RESISTED])
+
+
+def layout_buttons(layout):
+    """Все тексты кнопок раскладки по порядку"""
+    return [text for row in layout for text in row]
+
+
+class PrebuiltKeyboard(ReplyKeyboardMarkup):
+    """Клавиатура из реестра KEYBOARDS: создается один раз, менять поля нельзя"""
+    model_config = ConfigDict(frozen=True)
+
+
+def _drop_none(value):
+    # Как BaseSession.prepare_value: None-поля в запрос не попадают
+    if isinstance(value, dict):
+        return {key: _drop_none(item) for key, item in value.items() if item is not None}
+    if isinstance(value, list):
+        return [_drop_none(item) for item in value if item is not None]
+    return value
+
+
+def _keyboard(layout) -> PrebuiltKeyboard:
+    return PrebuiltKeyboard(
+        keyboard=[[KeyboardButton(text=text) for text in row] for row in layout],
         resize_keyboard=True
     )
 
+
+# Все клавиатуры бота, собранные при импорте. Функции get_*_keyboard отдают
+# эти же объекты, поэтому pydantic не строит и не валидирует их заново.
+KEYBOARDS = MappingProxyType({
+    'main_menu': _keyboard(MAIN_MENU_LAYOUT),
+    'habit_type': _keyboard(HABIT_TYPE_LAYOUT),
+    'negative_habits': _keyboard(NEGATIVE_HABITS_LAYOUT),
+    'positive_habits': _keyboard(POSITIVE_HABITS_LAYOUT),
+    'daily_check': _keyboard(DAILY_CHECK_LAYOUT),
+    'negative_check': _keyboard(NEGATIVE_CHECK_LAYOUT),
+    'confirmation': _keyboard(CONFIRMATION_LAYOUT),
+    'timezones': _keyboard(TIMEZONE_LAYOUT),
+    'reminder_times': _keyboard(REMINDER_TIME_LAYOUT),
+})
+
+# id клавиатуры из реестра -> готовое значение поля reply_markup (JSON)
+_MARKUP_JSON = {
+    id(keyboard): json.dumps(_drop_none(keyboard.model_dump(warnings=False)))
+    for keyboard in KEYBOARDS.values()
+}
+
+
+def prebuilt_markup_json(markup) -> Optional[str]:
+    """Сериализованный reply_markup для клавиатуры из реестра, иначе None"""
+    return _MARKUP_JSON.get(id(markup))
+
+
+def get_main_menu_keyboard():
+    return KEYBOARDS['main_menu']
+
 def get_habit_type_keyboard():
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="❌ Отказаться от"), KeyboardButton(text="✅ Приобрести")],
-            [KeyboardButton(text="🔙 Назад")]
-        ],
-        resize_keyboard=True
-    )
+    return KEYBOARDS['habit_type']
 
 def get_negative_habits_keyboard():
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="Курение"), KeyboardButton(text="Алкоголь")],
-            [KeyboardButton(text="Телефон допоздна"), KeyboardButton(text="Прокрастинация")],
-            [KeyboardButton(text="Недостаток сна"), KeyboardButton(text="🔙 Назад")]
-        ],
-        resize_keyboard=True
-    )
+    return KEYBOARDS['negative_habits']
 
 def get_positive_habits_keyboard():
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="Зарядка утром"), KeyboardButton(text="Медитация")],
-            [KeyboardButton(text="Пить воду"), KeyboardButton(text="Чтение книг")],
-            [KeyboardButton(text="Режим питания"), KeyboardButton(text="🔙 Назад")]
-        ],
-        resize_keyboard=True
-    )
+    return KEYBOARDS['positive_habits']
 
 def get_daily_check_keyboard():
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="✅ Сделал(а)"), KeyboardButton(text="❌ Не сделал(а)")]
-        ],
-        resize_keyboard=True
-    )
+    return KEYBOARDS['daily_check']
 
 def get_negative_check_keyboard():
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="✅ Да, удалось!"), KeyboardButton(text="❌ Нет, не удалось")]
-        ],
-        resize_keyboard=True
-    )
+    return KEYBOARDS['negative_check']
 
 def get_confirmation_keyboard():
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="✅ Да, сменить"), KeyboardButton(text="❌ Нет, остаться")]
-        ],
-        resize_keyboard=True
-    )
\ No newline at end of file
+    return KEYBOARDS['confirmation']
+
+def get_timezone_keyboard():
+    return KEYBOARDS['timezones']
+
+def get_reminder_time_keyboard():
+    return KEYBOARDS['reminder_times']
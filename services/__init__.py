@@ -1,13 +1,22 @@
 from .reminder_service import (
     schedule_reminders,
+    start_habit,
     send_morning_reminder,
     send_demo_reminder,
     send_evening_check
 )
+from .send_queue import outbound_queue, OutboundQueue
+from .webhook import WebhookServer
+from .bot_session import PrebuiltMarkupSession
 
 __all__ = [
     'schedule_reminders',
+    'start_habit',
     'send_morning_reminder',
     'send_demo_reminder',
-    'send_evening_check'
+    'send_evening_check',
+    'outbound_queue',
+    'OutboundQueue',
+    'WebhookServer',
+    'PrebuiltMarkupSession'
 ]
\ No newline at end of file
@@ -0,0 +1,35 @@
+"""
+HTTP-сессия бота с готовыми reply_markup
+
+AiohttpSession на каждый запрос делает model_dump всего метода и заново
+сериализует клавиатуру в JSON. Клавиатуры бота неизменны (реестр KEYBOARDS),
+поэтому для них подставляется JSON, посчитанный один раз при импорте.
+Остальные запросы собираются как обычно.
+"""
+from aiohttp import FormData
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.methods import TelegramMethod
+
+from keyboards.keyboards import prebuilt_markup_json
+
+
+class PrebuiltMarkupSession(AiohttpSession):
+    """AiohttpSession, не сериализующая клавиатуры из реестра повторно"""
+
+    def build_form_data(self, bot: Bot, method: TelegramMethod) -> FormData:
+        markup_json = prebuilt_markup_json(getattr(method, "reply_markup", None))
+        if markup_json is None:
+            return super().build_form_data(bot, method)
+
+        form = FormData(quote_fields=False)
+        files = {}
+        for key, value in method.model_dump(warnings=False, exclude={"reply_markup"}).items():
+            value = self.prepare_value(value, bot=bot, files=files)
+            if not value:
+                continue
+            form.add_field(key, value)
+        form.add_field("reply_markup", markup_json)
+        for key, value in files.items():
+            form.add_field(key, value.read(bot), filename=value.filename or key)
+        return form
@@ -0,0 +1,284 @@
+"""
+Графики прогресса для "📊 Статистика": календарь отметок и линия успешности
+
+Картинка - PNG из двух частей: тепловая карта последних CHART_DAYS дней
+(столбец - неделя, строка - день недели: успех, только срывы, без отметок)
+и линия доли успешных дней за скользящие 7 и 28 дней. CHART_DAYS - это
+CHART_WEEKS недель, но не дальше, чем хранятся дневные итоги: при включенном
+RETENTION_DAYS более старые дни свернуты в месячные итоги и на графике
+выглядели бы днями без отметок.
+
+matplotlib рисует сотни миллисекунд процессорного времени, поэтому
+render_chart выполняется в ProcessPoolExecutor с CHART_WORKERS процессами
+(по умолчанию по числу ядер), а цикл событий бота только ждет результат.
+Процессы запускаются через spawn: fork процесса с потоками aiosqlite и
+логирования может унести в дочерний процесс захваченные блокировки.
+
+Готовые PNG кэшируются по (user_id, id привычки, привычка, last_log_date,
+сегодня в поясе пользователя): новая отметка или смена привычки меняют ключ, а с новым днем
+сдвигается окно календаря. Кэш двухуровневый - LRU в памяти на
+CHART_MEMORY_ITEMS картинок и файлы в CHART_DIR, переживающие перезапуск:
+по файлу на пользователя с последним графиком и SHA-1 его ключа в начале. Одновременные
+нажатия одного пользователя ждут одну отрисовку.
+"""
+import asyncio
+import hashlib
+import io
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from typing import Optional
+
+from config import CHART_DIR, CHART_WORKERS, RETENTION_DAYS
+from database.database import db, SQLiteDatabase, STATS_CALENDAR_DAYS
+from utils.metrics import CHART_RENDER_SECONDS, CHART_REQUESTS
+from utils.timezones import local_today
+
+logger = logging.getLogger(__name__)
+
+# Недель в календаре графика
+CHART_WEEKS = 25
+# Картинок в памяти (PNG около 50 КБ)
+CHART_MEMORY_ITEMS = 1024
+
+# Статус дня в календаре
+NO_LOG, FAILURE, SUCCESS = 0, -1, 1
+WEEKDAYS = ("Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс")
+
+
+def chart_days(retention_days: int = RETENTION_DAYS) -> int:
+    """Дней в графике: CHART_WEEKS недель, но не больше срока хранения дневных итогов
+
+    retention_cutoff оставляет итоги не меньше чем за max(RETENTION_DAYS,
+    STATS_CALENDAR_DAYS) дней; 0 - срок хранения выключен.
+    """
+    days = CHART_WEEKS * 7
+    if retention_days > 0:
+        days = min(days, max(retention_days, STATS_CALENDAR_DAYS))
+    return days
+
+
+CHART_DAYS = chart_days()
+
+
+def day_statuses(calendar: dict, start: date, days: int) -> list:
+    """Статусы дней от start: SUCCESS - был успех, FAILURE - только срывы, NO_LOG - отметок не было"""
+    statuses = []
+    for offset in range(days):
+        successes, failures = calendar.get(start + timedelta(days=offset), (0, 0))
+        statuses.append(SUCCESS if successes else FAILURE if failures else NO_LOG)
+    return statuses
+
+
+def _init_worker():
+    # Импорт matplotlib - около секунды, делается один раз при запуске процесса
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot  # noqa: F401
+
+
+def render_chart(habit_name: str, start: date, statuses: list, streak: int, best_streak: int) -> bytes:
+    """PNG графика по статусам дней от start (выполняется в процессе пула)"""
+    import numpy as np
+    from matplotlib.colors import ListedColormap
+    from matplotlib.figure import Figure
+
+    days = len(statuses)
+    values = np.array(statuses, dtype=float)
+
+    # Календарь: дополняем до целых недель с понедельника, пустые клетки - NaN
+    lead = start.weekday()
+    weeks = -(-(lead + days) // 7)
+    grid = np.full(weeks * 7, np.nan)
+    grid[lead:lead + days] = values
+    grid = grid.reshape(weeks, 7).T
+
+    # Доля дней с успехом за скользящее окно, с первого дня окна
+    done = np.cumsum(values == SUCCESS)
+
+    def rolling(window: int) -> np.ndarray:
+        shifted = np.concatenate((np.zeros(window), done[:-window])) if days > window else np.zeros(days)
+        span = np.minimum(np.arange(1, days + 1), window)
+        return (done - shifted[:days]) / span * 100
+
+    figure = Figure(figsize=(8, 4.2), dpi=100)
+    calendar_axes, trend_axes = figure.subplots(2, 1, gridspec_kw={'height_ratios': (1, 1.1)})
+    figure.suptitle(f"{habit_name}: серия {streak}, лучшая {best_streak}", fontsize=12)
+
+    cmap = ListedColormap(["#e5534b", "#ebedf0", "#2da44e"])
+    cmap.set_bad("white")
+    calendar_axes.pcolormesh(np.ma.masked_invalid(grid), cmap=cmap, vmin=FAILURE, vmax=SUCCESS,
+                             edgecolors="white", linewidth=1.5)
+    calendar_axes.invert_yaxis()
+    calendar_axes.set_yticks(np.arange(7) + 0.5, WEEKDAYS, fontsize=7)
+    first_monday = start - timedelta(days=lead)
+    month_ticks = [week for week in range(weeks) if (first_monday + timedelta(weeks=week)).day <= 7]
+    calendar_axes.set_xticks(
+        np.array(month_ticks) + 0.5, [f"{first_monday + timedelta(weeks=week):%m.%y}" for week in month_ticks], fontsize=7
+    )
+    calendar_axes.tick_params(length=0)
+    for side in calendar_axes.spines.values():
+        side.set_visible(False)
+
+    x = np.arange(days)
+    trend_axes.plot(x, rolling(7), color="#2da44e", linewidth=1.5, label="7 дней")
+    trend_axes.plot(x, rolling(28), color="#0969da", linewidth=1.2, linestyle="--", label="28 дней")
+    trend_axes.set_ylim(0, 105)
+    trend_axes.set_xlim(0, max(days - 1, 1))
+    trend_axes.set_ylabel("успешность, %", fontsize=8)
+    label_days = list(range(0, days, 28))
+    trend_axes.set_xticks(label_days, [f"{start + timedelta(days=day):%d.%m}" for day in label_days], fontsize=7)
+    trend_axes.tick_params(axis="y", labelsize=7)
+    trend_axes.grid(alpha=0.3)
+    trend_axes.legend(fontsize=7, loc="lower left")
+    # Поля заданы заранее: tight_layout заново раскладывает все подписи, это около 40 мс на график
+    figure.subplots_adjust(left=0.08, right=0.98, top=0.9, bottom=0.07, hspace=0.3)
+
+    out = io.BytesIO()
+    figure.savefig(out, format="png")
+    return out.getvalue()
+
+
+class ChartRenderer:
+    """Графики прогресса: пул процессов для отрисовки и кэш PNG в памяти и на диске"""
+
+    def __init__(self, database: SQLiteDatabase, cache_dir: str = CHART_DIR, workers: int = CHART_WORKERS,
+                 memory_items: int = CHART_MEMORY_ITEMS):
+        self.database = database
+        self.cache_dir = cache_dir
+        self.workers = workers or os.cpu_count() or 1
+        self.memory_items = memory_items
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # ключ -> PNG, в порядке последнего обращения
+        self._memory: "OrderedDict[tuple, bytes]" = OrderedDict()
+        # ключ -> отрисовка, которую ждут одновременные нажатия
+        self._pending: dict = {}
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.shared = 0
+        self.renders = 0
+
+    def start(self):
+        """Запустить процессы пула заранее, чтобы первое нажатие не ждало импорт matplotlib"""
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker
+            )
+            for _ in range(self.workers):
+                self._executor.submit(int)
+
+    def stop(self):
+        """Остановить пул; недорисованные графики отменяются"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    @staticmethod
+    def cache_key(habit, today: date) -> tuple:
+        return habit.user_id, habit.id, habit.current_habit, habit.last_log_date, today
+
+    def _path(self, key: tuple) -> str:
+        return os.path.join(self.cache_dir, f"{key[0]}.png")
+
+    @staticmethod
+    def _digest(key: tuple) -> bytes:
+        return hashlib.sha1(repr(key).encode("utf-8")).digest()
+
+    def _remember(self, key: tuple, png: bytes):
+        self._memory[key] = png
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _read_disk(self, key: tuple) -> Optional[bytes]:
+        """PNG из файла пользователя, если он нарисован для того же ключа"""
+        try:
+            with open(self._path(key), "rb") as cached:
+                data = cached.read()
+        except FileNotFoundError:
+            return None
+        digest = self._digest(key)
+        return data[len(digest):] if data.startswith(digest) else None
+
+    def _write_disk(self, key: tuple, png: bytes):
+        """Заменить график пользователя: файл - SHA-1 ключа и PNG"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        part = f"{path}.{threading.get_ident()}.part"
+        with open(part, "wb") as out:
+            out.write(self._digest(key) + png)
+        os.replace(part, path)
+
+    async def _render(self, key: tuple, habit) -> Optional[bytes]:
+        png = await asyncio.to_thread(self._read_disk, key)
+        if png is not None:
+            self.disk_hits += 1
+            CHART_REQUESTS.inc("disk")
+            return png
+
+        stats = await self.database.get_habit_stats(habit.user_id, CHART_DAYS)
+        if not stats:
+            return None
+        statuses = day_statuses(stats['calendar'], stats['calendar_start'], CHART_DAYS)
+
+        self.start()
+        started = time.perf_counter()
+        png = await asyncio.get_running_loop().run_in_executor(
+            self._executor, render_chart, habit.current_habit, stats['calendar_start'], statuses,
+            habit.current_streak, habit.best_streak
+        )
+        CHART_RENDER_SECONDS.observe(time.perf_counter() - started)
+        self.renders += 1
+        CHART_REQUESTS.inc("render")
+        await asyncio.to_thread(self._write_disk, key, png)
+        return png
+
+    async def chart(self, user_id: int) -> Optional[bytes]:
+        """PNG графика прогресса пользователя или None, если привычки нет"""
+        habit = await self.database.get_user_habit(user_id)
+        if not habit:
+            return None
+
+        # Сегодня - в поясе пользователя, как в get_habit_stats: иначе окно
+        # календаря и ключ кэша сдвигаются в разные моменты
+        settings = await self.database.get_reminder_settings(user_id)
+        key = self.cache_key(habit, local_today(settings.timezone if settings else None))
+        png = self._memory.get(key)
+        if png is not None:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            CHART_REQUESTS.inc("memory")
+            return png
+
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = asyncio.ensure_future(self._render(key, habit))
+            pending.add_done_callback(lambda _: self._pending.pop(key, None))
+        else:
+            self.shared += 1
+            CHART_REQUESTS.inc("shared")
+        png = await asyncio.shield(pending)
+        if png is not None:
+            self._remember(key, png)
+        return png
+
+    def stats(self) -> dict:
+        hits = self.memory_hits + self.disk_hits + self.shared
+        requests = hits + self.renders
+        return {
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'shared': self.shared,
+            'renders': self.renders,
+            'hit_rate': hits / requests if requests else 0.0,
+        }
+
+
+# Общий отрисовщик графиков для обработчиков и bot.py
+chart_renderer = ChartRenderer(db)
@@ -0,0 +1,188 @@
+"""
+Выгрузка истории отметок: /export для пользователя и /export_all для админов
+
+Логи читаются серверным курсором (AsyncConnection.stream с yield_per) и
+кодируются в CSV или JSON lines порциями по EXPORT_YIELD_PER строк, поэтому
+в памяти одновременно находится одна порция, а не весь результат, как при
+fetchall(). Пользовательская выгрузка копится в SpooledTemporaryFile: до
+EXPORT_SPOOL_BYTES в памяти, дальше во временном файле, и уходит в Telegram
+через SpooledInputFile кусками, не собираясь в один bytes.
+
+Общая выгрузка всех пользователей пишется в gzip-файл в EXPORT_DIR. Логи
+идут по id страницами по EXPORT_PAGE_ROWS строк - каждая страница своей
+читающей транзакцией, чтобы долгая выгрузка не мешала контрольным точкам
+WAL, - а кодирование и сжатие порций уходят в поток, чтобы не задерживать
+цикл событий.
+Файл до TELEGRAM_UPLOAD_LIMIT отправляется админу документом, больший
+остается на сервере.
+
+Месяцы старше срока хранения в выгрузку не попадают: их логи уже лежат в
+архивах ARCHIVE_DIR (см. database/retention.py) в том же формате JSON lines.
+
+Отдельно: python -m services.export [--format csv|json] [--path файл.gz]
+"""
+import argparse
+import asyncio
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime
+from typing import AsyncGenerator
+
+from aiogram import Bot
+from aiogram.types import InputFile
+from sqlalchemy import Integer, String, select, type_coerce
+
+from config import EXPORT_DIR
+from database.database import db
+from database.models import HabitLog
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ("csv", "json")
+# Строк в одной порции серверного курсора
+EXPORT_YIELD_PER = 5000
+# Сколько байт пользовательской выгрузки держать в памяти до перехода во временный файл
+EXPORT_SPOOL_BYTES = 1024 * 1024
+# Строк в одной читающей транзакции общей выгрузки
+EXPORT_PAGE_ROWS = 500_000
+# Больше Bot API не принимает от бота
+TELEGRAM_UPLOAD_LIMIT = 50 * 1024 * 1024
+
+# Столбцы выгрузок: пользователю не нужны id и user_id, общая - как в архивах retention
+USER_COLUMNS = ("log_date", "habit_name", "success")
+ALL_COLUMNS = ("id", "user_id", "habit_name", "success", "log_date", "log_day")
+
+
+def _columns(names) -> list:
+    logs = HabitLog.__table__.c
+    # Даты отдаются строкой как в БД, без разбора в datetime и обратно
+    coerce = {"log_date": String, "log_day": String, "success": Integer}
+    return [type_coerce(logs[name], coerce[name]) if name in coerce else logs[name] for name in names]
+
+
+def encode_rows(rows, columns, fmt: str) -> bytes:
+    """Порция строк в CSV (без заголовка) или JSON lines"""
+    if fmt == "json":
+        return "".join(
+            json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n" for row in rows
+        ).encode("utf-8")
+    text = io.StringIO()
+    csv.writer(text, lineterminator="\n").writerows(rows)
+    return text.getvalue().encode("utf-8")
+
+
+def encode_header(columns, fmt: str) -> bytes:
+    return (",".join(columns) + "\n").encode("utf-8") if fmt == "csv" else b""
+
+
+async def stream_rows(engine, stmt) -> AsyncGenerator[list, None]:
+    """Порции строк stmt по серверному курсору"""
+    async with engine.connect() as conn:
+        result = await conn.stream(stmt.execution_options(yield_per=EXPORT_YIELD_PER))
+        async for partition in result.partitions():
+            yield partition
+
+
+async def write_user_logs(engine, user_id: int, fmt: str, out) -> int:
+    """Записать в out все логи пользователя по времени; возвращает число строк"""
+    logs = HabitLog.__table__.c
+    stmt = select(*_columns(USER_COLUMNS)).where(logs.user_id == user_id).order_by(logs.log_date, logs.id)
+    if fmt == "csv":
+        # BOM - чтобы Excel открыл CSV с кириллицей в UTF-8
+        out.write(b"\xef\xbb\xbf" + encode_header(USER_COLUMNS, fmt))
+    rows = 0
+    async for partition in stream_rows(engine, stmt):
+        out.write(encode_rows(partition, USER_COLUMNS, fmt))
+        rows += len(partition)
+    return rows
+
+
+async def write_all_logs(engine, fmt: str, out) -> int:
+    """Записать в out (файловый объект, пишется в потоке) логи всех пользователей по id"""
+    logs = HabitLog.__table__.c
+    page = select(*_columns(ALL_COLUMNS)).order_by(logs.id).limit(EXPORT_PAGE_ROWS)
+    await asyncio.to_thread(out.write, encode_header(ALL_COLUMNS, fmt))
+    rows = 0
+    last_id = None
+    while True:
+        stmt = page if last_id is None else page.where(logs.id > last_id)
+        page_rows = 0
+        async for partition in stream_rows(engine, stmt):
+            await asyncio.to_thread(lambda: out.write(encode_rows(partition, ALL_COLUMNS, fmt)))
+            page_rows += len(partition)
+            last_id = partition[-1][0]
+        rows += page_rows
+        if page_rows < EXPORT_PAGE_ROWS:
+            return rows
+
+
+class SpooledInputFile(InputFile):
+    """Документ для Bot API из SpooledTemporaryFile: читается кусками с начала при каждой отправке"""
+
+    def __init__(self, spool, filename: str):
+        super().__init__(filename=filename)
+        self.spool = spool
+
+    async def read(self, bot: Bot) -> AsyncGenerator[bytes, None]:
+        # Повтор запроса после 429 читает файл заново
+        self.spool.seek(0)
+        while chunk := self.spool.read(self.chunk_size):
+            yield chunk
+
+
+async def export_user(user_id: int, fmt: str = "csv"):
+    """Выгрузить логи пользователя; возвращает (SpooledInputFile, число строк)
+
+    Вызывающий закрывает spool документа после отправки.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES)
+    try:
+        rows = await write_user_logs(db.engine, user_id, fmt, spool)
+    except Exception:
+        spool.close()
+        raise
+    extension = "csv" if fmt == "csv" else "jsonl"
+    return SpooledInputFile(spool, f"habits-{user_id}.{extension}"), rows
+
+
+async def export_all(fmt: str = "csv", path: str = None) -> dict:
+    """Выгрузить логи всех пользователей в gzip-файл; возвращает путь, число строк, размер и время"""
+    started = time.perf_counter()
+    if path is None:
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        extension = "csv" if fmt == "csv" else "jsonl"
+        path = os.path.join(EXPORT_DIR, f"habit_logs-{datetime.now():%Y%m%d-%H%M%S}.{extension}.gz")
+
+    with gzip.open(path, "wb", compresslevel=6) as out:
+        rows = await write_all_logs(db.engine, fmt, out)
+    report = {
+        'path': path,
+        'rows': rows,
+        'bytes': os.path.getsize(path),
+        'seconds': round(time.perf_counter() - started, 1),
+    }
+    logger.info(f"📦 Выгрузка всех логов: {rows} строк, {report['bytes'] / 2**20:.1f} МБ за {report['seconds']} с -> {path}")
+    return report
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Выгрузка логов всех пользователей в gzip")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    parser.add_argument("--path", help="файл .gz (по умолчанию - новый файл в EXPORT_DIR)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    try:
+        report = await export_all(args.format, args.path)
+    finally:
+        await db.engine.dispose()
+    print(f"Выгружено строк: {report['rows']} -> {report['path']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
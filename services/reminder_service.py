@@ -1,35 +1,50 @@
 """
 Сервис напоминаний для бота
+
+Напоминание приходит раз в день в местное время, выбранное пользователем
+(часовой пояс и время - в users, см. utils/timezones.py). Расписание
+хранится только в БД: user_habits.next_fire_at - момент следующего
+напоминания в UTC, всегда начало минуты.
+
+Один корутин-планировщик просыпается в начале каждой минуты и отправляет ее
+когорту: все привычки с next_fire_at раньше конца минуты, включая
+просроченные после простоя бота. Когорта читается диапазонными запросами по
+индексу next_fire_at порциями по REMINDER_BATCH_SIZE; на порцию приходится
+одна транзакция, переносящая next_fire_at на следующий день, и пачка
+отправок. В памяти расписание не держится, поэтому ни память, ни число
+пробуждений планировщика не зависят от числа пользователей.
 """
 import logging
+import time
 from aiogram import Bot
 import asyncio
-from datetime import datetime
-from typing import Dict, Set
+from datetime import datetime, timezone
+from typing import Optional
+from database.database import db
 from keyboards.keyboards import get_daily_check_keyboard, get_negative_check_keyboard
+from utils.texts import render
+from utils.timezones import local_time, next_fire_at
+from utils.metrics import REMINDER_LATENESS_SECONDS, REMINDER_SEND_ERRORS, REMINDER_SEND_SECONDS
 
-# Настройка логирования
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
+# Строка на каждое отправленное напоминание: частоту ограничивает LOG_POLICIES
+sent_logger = logging.getLogger(f"{__name__}.sent")
 
-# Создаем обработчик если его нет
-if not logger.handlers:
-    handler = logging.StreamHandler()
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
+# Длина когорты (секунды): все напоминания одной минуты уходят вместе
+COHORT_SECONDS = 60
+# Напоминаний в одной порции когорты: один запрос, одна транзакция, одна пачка отправок
+REMINDER_BATCH_SIZE = 500
+# Напоминания, опоздавшие больше чем на столько секунд (бот был остановлен),
+# не отправляются, а переносятся на следующий день
+REMINDER_GRACE = 3600
 
 # Глобальная переменная для бота
 bot_instance: Bot = None
 
-# Хранилище активных задач напоминаний
-active_reminders: Dict[int, asyncio.Task] = {}
-# Словарь для хранения информации о привычках пользователей
-user_habits: Dict[int, dict] = {}
-# Множество для отслеживания пользователей, у которых уже запущены напоминания
-active_users: Set[int] = set()
-# Счетчик отправок напоминаний для каждого пользователя
-reminder_counts: Dict[int, int] = {}
+# Задача планировщика
+_scheduler_task: Optional[asyncio.Task] = None
+# Количество проходов цикла планировщика (для бенчмарков и отладки)
+scheduler_wakeups = 0
 
 
 def set_bot(bot: Bot):
@@ -37,126 +52,192 @@ def set_bot(bot: Bot):
     bot_instance = bot
 
 
-async def schedule_reminders(user_id: int, habit: str, habit_type: str):
+async def _next_reminder(user_id: int) -> datetime:
+    """Следующее напоминание по настройкам пользователя, в его местном времени"""
+    settings = await db.get_reminder_settings(user_id)
+    zone_name, reminder_time = settings if settings is not None else (None, None)
+    return local_time(zone_name, next_fire_at(zone_name, reminder_time, time.time()))
+
+
+async def start_habit(user_id: int, habit: str, habit_type: str) -> datetime:
     """
-    Запланировать напоминания для пользователя
-    Теперь напоминания будут приходить регулярно ДЛЯ ВСЕХ типов привычек
+    Сменить привычку пользователя и включить ежедневные напоминания
+    Привычка и первое напоминание пишутся одной транзакцией; возвращает его в местном времени
     """
-    logger.info(f"📅 Запланированы напоминания для {user_id}: {habit} ({habit_type})")
+    local_fire_at = await _next_reminder(user_id)
+    await db.create_user_habit(user_id, habit, habit_type, next_fire_at=_to_datetime(local_fire_at.timestamp()))
+    _ensure_scheduler()
+
+    logger.info(f"📅 Запланированы напоминания для {user_id}: {habit} ({habit_type}), "
+                f"следующее {local_fire_at:%d.%m %H:%M} {local_fire_at.tzinfo}")
+    return local_fire_at
 
-    # Сохраняем информацию о привычке
-    user_habits[user_id] = {
-        'habit': habit,
-        'habit_type': habit_type
-    }
 
-    # Инициализируем счетчик отправок
-    reminder_counts[user_id] = 0
+async def schedule_reminders(user_id: int, habit: str, habit_type: str) -> datetime:
+    """
+    Включить ежедневные напоминания для уже выбранной привычки
+    Возвращает следующее напоминание в местном времени пользователя
+    """
+    local_fire_at = await _next_reminder(user_id)
+    await db.set_next_fire_at(user_id, _to_datetime(local_fire_at.timestamp()))
+    _ensure_scheduler()
 
-    # Если у пользователя уже есть активные напоминания, останавливаем их
-    if user_id in active_reminders:
-        await stop_reminders(user_id)
+    logger.info(f"📅 Запланированы напоминания для {user_id}: {habit} ({habit_type}), "
+                f"следующее {local_fire_at:%d.%m %H:%M} {local_fire_at.tzinfo}")
+    return local_fire_at
 
-    # Запускаем цикл напоминаний
-    task = asyncio.create_task(
-        reminder_loop(user_id, habit, habit_type)
-    )
-    active_reminders[user_id] = task
-    active_users.add(user_id)
 
-    # Отправляем первое напоминание сразу
-    await send_reminder(user_id, habit, habit_type)
+async def reschedule_reminders(user_id: int) -> Optional[datetime]:
+    """Пересчитать следующее напоминание после смены часового пояса или времени"""
+    habit = await db.get_user_habit(user_id)
+    if not habit:
+        return None
+    return await schedule_reminders(user_id, habit.current_habit, habit.habit_type)
 
 
 async def stop_reminders(user_id: int):
     """Остановить напоминания для пользователя"""
-    if user_id in active_reminders:
-        active_reminders[user_id].cancel()
-        del active_reminders[user_id]
+    await db.set_next_fire_at(user_id, None)
+
+    logger.info(f"⏹️ Напоминания остановлены для пользователя {user_id}")
 
-    if user_id in active_users:
-        active_users.remove(user_id)
 
-    if user_id in user_habits:
-        del user_habits[user_id]
+async def restore_reminders():
+    """
+    Запустить планировщик после перезапуска
+    Расписание уже в БД; просроченные за время простоя напоминания уйдут первой когортой
+    """
+    restored = await db.count_scheduled_reminders()
+    _ensure_scheduler()
+    logger.info(f"♻️ Напоминаний в расписании: {restored}")
+    return restored
 
-    if user_id in reminder_counts:
-        del reminder_counts[user_id]
 
-    logger.info(f"⏹️ Напоминания остановлены для пользователя {user_id}")
+def _to_datetime(timestamp: float) -> datetime:
+    """unix time -> наивный UTC datetime, как остальные даты в БД"""
+    return datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None)
+
+
+def _to_timestamp(value: datetime) -> float:
+    """Наивный UTC datetime из БД -> unix time"""
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+def _ensure_scheduler():
+    """Запустить корутину планировщика, если она еще не работает"""
+    global _scheduler_task
+
+    if _scheduler_task is None or _scheduler_task.done():
+        _scheduler_task = asyncio.create_task(reminder_scheduler())
 
 
-async def reminder_loop(user_id: int, habit: str, habit_type: str):
+async def fire_due(until: float, now: Optional[float] = None) -> int:
     """
-    Основной цикл отправки напоминаний
-    Отправляет напоминания каждые 30 секунд для ВСЕХ типов привычек
+    Отправить все напоминания с next_fire_at < until
+    Возвращает число отправленных; now подменяет текущее время (для бенчмарков)
     """
+    sent = 0
+    until_at = _to_datetime(until)
+    while True:
+        rows = await db.get_due_reminders(until_at, REMINDER_BATCH_SIZE)
+        if not rows:
+            return sent
+
+        current = time.time() if now is None else now
+        batch = []
+        schedule_updates = []
+        for row in rows:
+            fire_at = _to_timestamp(row.next_fire_at)
+            # Следующее - строго после планового и текущего времени: в эту же когорту строка не вернется
+            following = next_fire_at(row.timezone, row.reminder_time, max(fire_at, current))
+            schedule_updates.append((row.id, _to_datetime(following)))
+            if current - fire_at <= REMINDER_GRACE:
+                batch.append(send_reminder(
+                    row.user_id, row.current_habit, row.habit_type, fire_at, local_time(row.timezone, current)
+                ))
+
+        # Расписание сдвигается до отправки: если запись не удалась, порция не уйдет дважды
+        if await db.bulk_set_next_fire_at(schedule_updates) != len(schedule_updates):
+            logger.error("❌ Расписание не сдвинуто, когорта будет повторена в следующую минуту")
+            return sent
+        await asyncio.gather(*batch)
+        sent += len(batch)
+
+
+async def reminder_scheduler():
+    """
+    Единый цикл отправки напоминаний
+    В начале каждой минуты отправляет ее когорту и спит до следующей минуты
+    """
+    global scheduler_wakeups
+
+    while True:
+        scheduler_wakeups += 1
+        now = time.time()
+        minute_end = now - now % COHORT_SECONDS + COHORT_SECONDS
+        try:
+            sent = await fire_due(minute_end, now)
+            if sent:
+                logger.info(f"📨 Когорта {_to_datetime(minute_end - COHORT_SECONDS):%H:%M} UTC: "
+                            f"{sent} напоминаний за {time.time() - now:.1f} с")
+        except asyncio.CancelledError:
+            # Задача была отменена - нормальное завершение
+            logger.info("🔇 Планировщик напоминаний остановлен")
+            raise
+        except Exception as e:
+            logger.error(f"❌ Ошибка в планировщике напоминаний: {e}")
+
+        await asyncio.sleep(max(0.0, minute_end - time.time()))
+
+
+async def _send_timed(user_id: int, text: str, keyboard, habit_type: str):
+    """send_message с замером времени отправки и учетом ошибок"""
+    started = time.perf_counter()
     try:
-        while True:
-            # Ждем 30 секунд между напоминаниями
-            await asyncio.sleep(30)
-
-            # Проверяем, не отменена ли задача
-            if user_id not in active_users:
-                break
-
-            # Отправляем напоминание для ЛЮБОГО типа привычки
-            await send_reminder(user_id, habit, habit_type)
-
-    except asyncio.CancelledError:
-        # Задача была отменена - нормальное завершение
-        logger.info(f"🔇 Цикл напоминаний отменен для {user_id}")
-        if user_id in active_users:
-            active_users.remove(user_id)
-    except Exception as e:
-        logger.error(f"❌ Ошибка в цикле напоминаний для {user_id}: {e}")
-        if user_id in active_users:
-            active_users.remove(user_id)
+        await bot_instance.send_message(user_id, text, reply_markup=keyboard)
+    except Exception:
+        REMINDER_SEND_ERRORS.inc(habit_type)
+        raise
+    finally:
+        REMINDER_SEND_SECONDS.observe(time.perf_counter() - started, habit_type)
+
 
+async def send_reminder(user_id: int, habit: str, habit_type: str, scheduled_at: Optional[float] = None,
+                        local_now: Optional[datetime] = None):
+    """Отправка одного напоминания для ЛЮБОГО типа привычки
 
-async def send_reminder(user_id: int, habit: str, habit_type: str):
-    """Отправка одного напоминания для ЛЮБОГО типа привычки"""
+    local_now - местное время пользователя: по нему выбирается утренний или
+    вечерний текст. Без него берется время сервера.
+    """
     global bot_instance
 
     if not bot_instance:
         logger.error("❌ Бот не установлен в reminder_service")
         return
 
-    try:
-        current_time = datetime.now().strftime('%H:%M:%S')
+    if scheduled_at is not None:
+        REMINDER_LATENESS_SECONDS.observe(max(0.0, time.time() - scheduled_at))
 
-        # Увеличиваем счетчик отправок
-        reminder_counts[user_id] = reminder_counts.get(user_id, 0) + 1
-        send_count = reminder_counts[user_id]
+    try:
+        local_now = local_now or datetime.now()
+        current_time = local_now.strftime('%H:%M')
 
         if habit_type == "negative":
             # Для отрицательных привычек
-            await bot_instance.send_message(
+            await _send_timed(
                 user_id,
-                f"🔔 Напоминание: сегодня ваша цель - день без '{habit}'! Ты справишься! 💪\n"
-                f"⏰ Время: {current_time}\n"
-                f"🔁 Отправка №{send_count}",
-                reply_markup=get_negative_check_keyboard()
+                render('reminder_negative', habit=habit, time=current_time),
+                get_negative_check_keyboard(),
+                habit_type
             )
         else:
-            # Для положительных привычек
-            morning_habits = ["Зарядка утром", "Пить воду", "Режим питания"]
+            # Для положительных привычек: до полудня - утренний текст, после - вечерний
+            template = 'reminder_positive_morning' if local_now.hour < 12 else 'reminder_positive_evening'
+            message = render(template, habit=habit, time=current_time)
 
-            if habit in morning_habits:
-                message = f"🌅 Доброе утро! Не забудь про '{habit}' сегодня!\n⏰ {current_time}"
-            else:
-                message = f"🌙 Добрый вечер! Самое время для '{habit}'!\n⏰ {current_time}"
+            await _send_timed(user_id, message, get_daily_check_keyboard(), habit_type)
 
-            # Добавляем счетчик отправок
-            message += f"\n🔁 Отправка №{send_count}"
-
-            await bot_instance.send_message(
-                user_id,
-                message,
-                reply_markup=get_daily_check_keyboard()
-            )
-
-        logger.info(f"✅ Напоминание отправлено пользователю {user_id} ({habit_type}) в {current_time}, отправка №{send_count}")
+        sent_logger.info(f"✅ Напоминание отправлено ({habit_type}) в {current_time}", extra={'user_id': user_id})
 
     except Exception as e:
         logger.error(f"❌ Ошибка при отправке напоминания {user_id}: {e}")
@@ -176,19 +257,9 @@ async def send_demo_reminder(user_id: int, habit: str, habit_type: str):
 
     try:
         if habit_type == "negative":
-            await bot_instance.send_message(
-                user_id,
-                f"🔔 Демо-напоминание: сегодня ваша цель - день без '{habit}'! 💪\n"
-                f"⚠️ Это демо-версия (только один раз)",
-                reply_markup=get_negative_check_keyboard()
-            )
+            await _send_timed(user_id, render('demo_negative', habit=habit), get_negative_check_keyboard(), habit_type)
         else:
-            await bot_instance.send_message(
-                user_id,
-                f"🔔 Демо-напоминание: не забудь про '{habit}' сегодня! ✅\n"
-                f"⚠️ Это демо-версия (только один раз)",
-                reply_markup=get_daily_check_keyboard()
-            )
+            await _send_timed(user_id, render('demo_positive', habit=habit), get_daily_check_keyboard(), habit_type)
 
         logger.info(f"✅ Демо-напоминание отправлено пользователю {user_id}")
 
@@ -199,31 +270,24 @@ async def send_demo_reminder(user_id: int, habit: str, habit_type: str):
 async def send_morning_reminder(user_id: int, habit: str):
     """Утреннее напоминание"""
     if bot_instance:
-        await bot_instance.send_message(
-            user_id,
-            f"🌅 Доброе утро! Напоминаю: сегодня цель - день без '{habit}'!",
-            reply_markup=get_negative_check_keyboard()
-        )
+        await _send_timed(user_id, render('morning_negative', habit=habit), get_negative_check_keyboard(), "negative")
 
 
 async def send_evening_check(user_id: int, habit: str):
     """Вечерняя проверка"""
     if bot_instance:
-        await bot_instance.send_message(
-            user_id,
-            f"🌙 Привет! Как прошел день? Удалось избежать '{habit}'?",
-            reply_markup=get_negative_check_keyboard()
-        )
+        await _send_timed(user_id, render('evening_check', habit=habit), get_negative_check_keyboard(), "negative")
 
 
 async def get_active_users():
     """Получить список пользователей с активными напоминаниями"""
-    return list(active_users)
+    return await db.get_scheduled_user_ids()
 
 
 async def is_user_active(user_id: int):
-    """Проверить, есть ли у пользователя активные напоминания"""
-    return user_id in active_users
+    """Проверить, есть ли у пользователя активные напоминания (next_fire_at в строке привычки)"""
+    habit = await db.get_user_habit(user_id)
+    return habit is not None and habit.next_fire_at is not None
 
 
 async def cleanup_user_reminders(user_id: int):
@@ -0,0 +1,154 @@
+"""
+Очередь исходящих сообщений с учетом лимитов Telegram
+
+Все запросы бота к Bot API проходят через OutboundQueue - middleware сессии
+aiogram. Поэтому одни и те же лимиты действуют и для напоминаний из
+reminder_service, и для ответов обработчиков (message.answer).
+
+Лимиты реализованы как резервирование слотов (GCRA, "виртуальное
+расписание"): общий бакет на весь бот (~30 сообщений/с) и отдельный бакет на
+каждый чат (~1 сообщение/с с небольшим запасом на всплеск). Ожидающие запросы
+и есть очередь: каждый сразу получает свой слот и спит до него.
+"""
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from typing import Dict
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+
+logger = logging.getLogger(__name__)
+
+# Общий лимит бота (сообщений в секунду) и допустимый всплеск
+GLOBAL_RATE = 30
+GLOBAL_BURST = 30
+# Лимит на один чат
+PER_CHAT_RATE = 1
+PER_CHAT_BURST = 3
+# Повторные попытки при 429 и сетевых ошибках
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.5
+# Окно (секунды), по которому считается скорость отправки
+DRAIN_WINDOW = 10
+
+
+class OutboundQueue(BaseRequestMiddleware):
+    """Глобальный и поканальный ограничитель исходящих запросов с повторами"""
+
+    def __init__(
+        self,
+        global_rate: float = GLOBAL_RATE,
+        global_burst: int = GLOBAL_BURST,
+        per_chat_rate: float = PER_CHAT_RATE,
+        per_chat_burst: int = PER_CHAT_BURST,
+        max_retries: int = MAX_RETRIES,
+    ):
+        self.global_interval = 1 / global_rate
+        self.global_burst = global_burst
+        self.chat_interval = 1 / per_chat_rate
+        self.chat_burst = per_chat_burst
+        self.max_retries = max_retries
+
+        # Теоретическое время прибытия следующего запроса (GCRA) - общее и по чатам
+        self._global_tat = 0.0
+        self._chat_tat: Dict[int, float] = {}
+
+        # Метрики
+        self.depth = 0
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self._sent_times = deque()
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            # getUpdates, getMe и т.п. не относятся к флуд-лимитам на сообщения
+            return await make_request(bot, method)
+
+        self.depth += 1
+        try:
+            for attempt in range(self.max_retries + 1):
+                await self._acquire(chat_id)
+                try:
+                    result = await make_request(bot, method)
+                except TelegramRetryAfter as e:
+                    if attempt == self.max_retries:
+                        raise
+                    self.retried += 1
+                    logger.warning(f"⏳ Флуд-контроль для чата {chat_id}: повтор через {e.retry_after} с")
+                    self._penalize(chat_id, e.retry_after + random.uniform(0, BACKOFF_BASE))
+                except (TelegramNetworkError, TelegramServerError) as e:
+                    if attempt == self.max_retries:
+                        raise
+                    self.retried += 1
+                    delay = BACKOFF_BASE * 2 ** attempt * random.uniform(0.5, 1.5)
+                    logger.warning(f"🔁 Ошибка отправки в чат {chat_id} ({e}), повтор через {delay:.1f} с")
+                    await asyncio.sleep(delay)
+                else:
+                    self._record_sent()
+                    return result
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.depth -= 1
+
+    async def _acquire(self, chat_id: int):
+        """Дождаться своего слота: сначала в чате, затем в общем бакете"""
+        now = time.monotonic()
+        tat = self._chat_tat.get(chat_id, now)
+        delay, self._chat_tat[chat_id] = self._reserve(tat, now, self.chat_interval, self.chat_burst)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        now = time.monotonic()
+        delay, self._global_tat = self._reserve(self._global_tat, now, self.global_interval, self.global_burst)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        if len(self._chat_tat) > 10_000:
+            self._prune(now)
+
+    @staticmethod
+    def _reserve(tat: float, now: float, interval: float, burst: int):
+        """GCRA: вернуть задержку до слота и новое теоретическое время прибытия"""
+        tat = max(tat, now)
+        delay = max(0.0, tat - now - (burst - 1) * interval)
+        return delay, tat + interval
+
+    def _penalize(self, chat_id: int, retry_after: float):
+        """Отодвинуть все слоты чата на время, которое потребовал Telegram"""
+        until = time.monotonic() + retry_after + self.chat_interval * (self.chat_burst - 1)
+        self._chat_tat[chat_id] = max(self._chat_tat.get(chat_id, 0.0), until)
+
+    def _prune(self, now: float):
+        """Забыть чаты, чьи слоты уже в прошлом"""
+        self._chat_tat = {chat: tat for chat, tat in self._chat_tat.items() if tat > now}
+
+    def _record_sent(self):
+        now = time.monotonic()
+        self.sent += 1
+        self._sent_times.append(now)
+        while self._sent_times and self._sent_times[0] < now - DRAIN_WINDOW:
+            self._sent_times.popleft()
+
+    def stats(self) -> dict:
+        """Глубина очереди, счетчики и скорость отправки за последние DRAIN_WINDOW секунд"""
+        now = time.monotonic()
+        while self._sent_times and self._sent_times[0] < now - DRAIN_WINDOW:
+            self._sent_times.popleft()
+        return {
+            'depth': self.depth,
+            'sent': self.sent,
+            'retried': self.retried,
+            'failed': self.failed,
+            'drain_rate': len(self._sent_times) / DRAIN_WINDOW,
+        }
+
+
+# Единая очередь для всех исходящих сообщений бота
+outbound_queue = OutboundQueue()
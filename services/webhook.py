@@ -0,0 +1,181 @@
+"""
+Прием обновлений через webhook
+
+Альтернатива long polling: Telegram сам присылает обновления POST-запросами
+на встроенный aiohttp-сервер, поэтому нет паузы на цикл getUpdates, а
+несколько экземпляров бота можно поставить за балансировщиком.
+
+- Запрос без верного X-Telegram-Bot-Api-Secret-Token отклоняется (401).
+- Обновление сразу подтверждается (200) и обрабатывается в фоне, одновременно
+  не больше WEBHOOK_MAX_CONCURRENCY обработчиков.
+- Если принятых, но не обработанных обновлений уже WEBHOOK_MAX_PENDING,
+  сервер отвечает 503: Telegram повторит доставку позже. Это и есть обратное
+  давление - очередь в памяти не растет без предела.
+- GET /health отдает состояние для балансировщика (503 во время остановки).
+- При остановке новые обновления получают 503, а уже принятые
+  дорабатываются не дольше WEBHOOK_DRAIN_TIMEOUT секунд.
+"""
+import asyncio
+import hmac
+import logging
+import signal
+import time
+from contextlib import suppress
+from typing import Optional, Set
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+logger = logging.getLogger(__name__)
+
+# Одновременно обрабатываемых обновлений и предел принятых, но не обработанных
+WEBHOOK_MAX_CONCURRENCY = 64
+WEBHOOK_MAX_PENDING = 1000
+# Сколько секунд дорабатывать принятые обновления при остановке
+WEBHOOK_DRAIN_TIMEOUT = 25
+# Одновременных соединений, которые Telegram откроет к серверу (setWebhook)
+WEBHOOK_MAX_CONNECTIONS = 40
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """aiohttp-сервер, передающий обновления Telegram в Dispatcher.feed_update"""
+
+    def __init__(
+        self,
+        dispatcher: Dispatcher,
+        bot: Bot,
+        path: str,
+        secret_token: Optional[str] = None,
+        max_concurrency: int = WEBHOOK_MAX_CONCURRENCY,
+        max_pending: int = WEBHOOK_MAX_PENDING,
+        drain_timeout: float = WEBHOOK_DRAIN_TIMEOUT,
+    ):
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.path = path
+        self.secret_token = secret_token
+        self.max_pending = max_pending
+        self.drain_timeout = drain_timeout
+
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._tasks: Set[asyncio.Task] = set()
+        self._runner: Optional[web.AppRunner] = None
+        self._draining = False
+        self.port: Optional[int] = None
+
+        # Метрики
+        self.received = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._started_at = time.monotonic()
+
+        self.app = web.Application()
+        self.app.router.add_post(path, self._handle_update)
+        self.app.router.add_get("/health", self._handle_health)
+
+    @property
+    def pending(self) -> int:
+        return len(self._tasks)
+
+    async def start(self, host: str, port: int):
+        """Поднять HTTP-сервер (порт 0 - выбрать свободный)"""
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        logger.info(f"🌐 Webhook-сервер слушает {host}:{self.port}{self.path}")
+
+    async def set_webhook(self, url: str):
+        """Сообщить Telegram адрес webhook и секрет"""
+        await self.bot.set_webhook(
+            url=url,
+            secret_token=self.secret_token,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=self.dispatcher.resolve_used_update_types(),
+        )
+        logger.info(f"✅ Webhook установлен: {url}")
+
+    async def stop(self):
+        """Перестать принимать обновления, доработать принятые и закрыть сервер"""
+        self._draining = True
+        if self._tasks:
+            logger.info(f"⏳ Дорабатываем {len(self._tasks)} принятых обновлений")
+            done, pending = await asyncio.wait(set(self._tasks), timeout=self.drain_timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                logger.warning(f"⚠️ Не успели обработать {len(pending)} обновлений за {self.drain_timeout} с")
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def serve(self, host: str, port: int, url: Optional[str] = None):
+        """Работать до SIGINT/SIGTERM, затем корректно остановиться"""
+        await self.dispatcher.emit_startup(bot=self.bot)
+        await self.start(host, port)
+        if url:
+            await self.set_webhook(url)
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            with suppress(NotImplementedError):
+                loop.add_signal_handler(sig, stop.set)
+        try:
+            await stop.wait()
+        finally:
+            await self.stop()
+            # Как и start_polling: закрывает хранилище FSM и прочие ресурсы диспетчера
+            await self.dispatcher.emit_shutdown(bot=self.bot)
+
+    def _verify_secret(self, request: web.Request) -> bool:
+        if not self.secret_token:
+            return True
+        return hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret_token)
+
+    async def _handle_update(self, request: web.Request) -> web.Response:
+        if not self._verify_secret(request):
+            return web.Response(status=401)
+        if self._draining or len(self._tasks) >= self.max_pending:
+            self.rejected += 1
+            return web.Response(status=503)
+
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except Exception as e:
+            logger.warning(f"⚠️ Некорректное обновление в webhook: {e}")
+            return web.Response(status=400)
+
+        self.received += 1
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response()
+
+    async def _process(self, update: Update):
+        async with self._semaphore:
+            try:
+                await self.dispatcher.feed_update(self.bot, update)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"❌ Ошибка обработки обновления {update.update_id}: {e}")
+
+    async def _handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response(
+            {
+                'status': 'draining' if self._draining else 'ok',
+                'pending': self.pending,
+                'received': self.received,
+                'processed': self.processed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'uptime': round(time.monotonic() - self._started_at),
+            },
+            status=503 if self._draining else 200,
+        )
@@ -0,0 +1,65 @@
+"""
+Ротация резервных копий: последняя копия остается при любом BACKUP_KEEP
+
+Запуск: python -m unittest discover tests
+"""
+import os
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime
+from unittest import mock
+
+os.environ.setdefault("BOT_TOKEN", "123456:test")
+
+from database.backup import BackupService
+
+
+class RotateTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.database_path = os.path.join(self._tmp.name, "habits.db")
+        conn = sqlite3.connect(self.database_path)
+        conn.execute("CREATE TABLE habit_logs (id INTEGER PRIMARY KEY)")
+        conn.commit()
+        conn.close()
+        self.backup_dir = os.path.join(self._tmp.name, "backups")
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def copies(self) -> list:
+        return sorted(name for name in os.listdir(self.backup_dir) if name.endswith(".db"))
+
+    async def run_at(self, service: BackupService, day: int) -> dict:
+        # Имя копии - метка времени с точностью до секунды; подменяем ее, чтобы не ждать
+        with mock.patch("database.backup.datetime") as clock:
+            clock.now.return_value = datetime(2026, 1, day)
+            return await service.run_once()
+
+    async def test_keep_zero_keeps_new_copy(self):
+        service = BackupService(self.database_path, self.backup_dir, keep=0, pause=0)
+
+        first = await self.run_at(service, 1)
+        self.assertEqual(first['removed'], 0)
+        self.assertGreater(first['bytes'], 0)
+        self.assertEqual(self.copies(), ["habits-20260101-000000.db"])
+
+        second = await self.run_at(service, 2)
+        self.assertEqual(second['removed'], 1)
+        self.assertEqual(self.copies(), ["habits-20260102-000000.db"])
+
+    async def test_keep_two(self):
+        service = BackupService(self.database_path, self.backup_dir, keep=2, pause=0)
+        for day in range(1, 4):
+            await self.run_at(service, day)
+        self.assertEqual(self.copies(), ["habits-20260102-000000.db", "habits-20260103-000000.db"])
+
+    def test_negative_keep_rejected(self):
+        with self.assertRaises(ValueError):
+            BackupService(self.database_path, self.backup_dir, keep=-1)
+
+
+if __name__ == "__main__":
+    unittest.main()
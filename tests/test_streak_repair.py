@@ -0,0 +1,113 @@
+"""
+Пересчет серий на сервере с часовым поясом западнее UTC
+
+created_at привычки пишется в UTC, и log_date отметок должен быть в том же
+времени: иначе repair_streaks считает первые часы отметок новой привычки
+записанными до ее выбора и обнуляет серию. Тесты меняют TZ процесса на
+America/New_York (UTC-4/-5), как у сервера в США.
+
+Запуск: python -m unittest discover tests
+"""
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta
+
+os.environ.setdefault("BOT_TOKEN", "123456:test")
+
+from database.database import SQLiteDatabase
+from database.migrations import DatabaseMigrator
+from database.streak_repair import repair_streaks
+
+STREAK = "SELECT current_streak, best_streak, total_days FROM user_habits WHERE user_id = ?"
+
+
+class WestOfUtcTest(unittest.IsolatedAsyncioTestCase):
+    TZ = "America/New_York"
+
+    def setUp(self):
+        self._tz = os.environ.get("TZ")
+        os.environ["TZ"] = self.TZ
+        time.tzset()
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._tmp.name, "test.db")
+
+    def tearDown(self):
+        if self._tz is None:
+            os.environ.pop("TZ", None)
+        else:
+            os.environ["TZ"] = self._tz
+        time.tzset()
+        self._tmp.cleanup()
+
+    async def asyncSetUp(self):
+        self.database = SQLiteDatabase(f"sqlite+aiosqlite:///{self.path}", profile="default")
+        await self.database.init_models()
+
+    async def asyncTearDown(self):
+        await self.database.engine.dispose()
+
+    def streak(self, user_id: int) -> tuple:
+        conn = sqlite3.connect(self.path)
+        try:
+            return conn.execute(STREAK, (user_id,)).fetchone()
+        finally:
+            conn.close()
+
+    async def test_repair_keeps_first_check_in(self):
+        self.assertNotEqual(datetime.now().hour, datetime.utcnow().hour)
+        await self.database.create_user_habit(1, "Медитация", "positive")
+        await self.database.add_habit_log_simple(1, "Медитация", True)
+        await self.database.create_user_habit(2, "Бег", "positive")
+        await self.database.apply_check_ins([(2, "Бег", True)])
+        self.assertEqual(self.streak(1), (1, 1, 1))
+        self.assertEqual(self.streak(2), (1, 1, 1))
+
+        report = await repair_streaks(self.database.engine)
+
+        self.assertEqual(report['corrected'], 0)
+        self.assertEqual(self.streak(1), (1, 1, 1))
+        self.assertEqual(self.streak(2), (1, 1, 1))
+
+    async def test_migration_moves_local_log_dates_to_utc(self):
+        await self.database.create_user_habit(1, "Медитация", "positive")
+        # Отметка, записанная до v10: log_date - местное время сервера
+        local_now = datetime.now()
+        conn = sqlite3.connect(self.path)
+        conn.execute(
+            "INSERT INTO habit_logs (user_id, habit_name, success, log_date, log_day) VALUES (1, 'Медитация', 1, ?, ?)",
+            (local_now.isoformat(sep=" "), local_now.date().isoformat())
+        )
+        conn.execute("UPDATE user_habits SET current_streak = 1, best_streak = 1, total_days = 1, last_log_date = ?",
+                     (local_now.isoformat(sep=" "),))
+        conn.commit()
+        conn.close()
+
+        migrator = DatabaseMigrator()
+        await migrator.engine.dispose()
+        migrator.engine = self.database.engine
+        self.assertTrue(await migrator.migrate_v9_to_v10())
+
+        conn = sqlite3.connect(self.path)
+        (log_date,) = conn.execute("SELECT log_date FROM habit_logs").fetchone()
+        conn.close()
+        moved = datetime.fromisoformat(log_date)
+        self.assertLess(abs(moved - datetime.utcnow()), timedelta(minutes=1))
+        self.assertEqual(moved.microsecond, local_now.microsecond)
+
+        # Версия записана вместе со сдвигом: следующий запуск миграций не сдвигает метки еще раз
+        self.assertEqual(await migrator.get_schema_version(), 10)
+        await migrator.run_migrations()
+        conn = sqlite3.connect(self.path)
+        self.assertEqual(conn.execute("SELECT log_date FROM habit_logs").fetchone(), (log_date,))
+        conn.close()
+
+        report = await repair_streaks(self.database.engine)
+        self.assertEqual(report['corrected'], 0)
+        self.assertEqual(self.streak(1), (1, 1, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
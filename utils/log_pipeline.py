@@ -0,0 +1,170 @@
+"""
+Неблокирующее логирование
+
+Обработчики с вводом-выводом (поток stderr) работают в отдельном потоке
+QueueListener. В цикле событий запись лога - это фильтры и put_nowait в
+очередь. Если вывод не успевает и очередь заполнена, запись отбрасывается
+и учитывается в счетчике dropped, а бот не ждет.
+
+Структурные поля передаются через extra: user_id, handler, duration_ms.
+Форматтер дописывает их к строке в виде key=value.
+
+Для шумных логгеров (LOG_POLICIES, включая дочерние) записи INFO и DEBUG
+выборочно пропускаются (sample - сохраняемая доля) и ограничиваются по
+частоте (rate записей в секунду с запасом burst). WARNING и выше проходят
+всегда. Число записей, отброшенных лимитом, дописывается к следующей
+пропущенной записи этого логгера как suppressed=N.
+"""
+import atexit
+import logging
+import queue
+import random
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional, Union
+
+# Записей в очереди, ожидающих вывода
+LOG_QUEUE_SIZE = 10_000
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+# Поля из extra, которые попадают в строку лога
+STRUCTURED_FIELDS = ("user_id", "handler", "duration_ms", "suppressed")
+
+# логгер -> sample: доля сохраняемых записей, rate/burst: записей в секунду и запас
+LOG_POLICIES = {
+    # По строке на каждое отправленное напоминание
+    "services.reminder_service.sent": {"sample": 1.0, "rate": 5, "burst": 20},
+    # "Update id=... is handled" на каждое обновление
+    "aiogram.event": {"sample": 0.1, "rate": 20, "burst": 50},
+    # SQL в профиле debug
+    "sqlalchemy.engine": {"sample": 1.0, "rate": 200, "burst": 500},
+}
+
+_listener: Optional[QueueListener] = None
+_formatter = logging.Formatter()
+
+
+class StructuredFormatter(logging.Formatter):
+    """Обычная строка лога плюс структурные поля key=value"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = [
+            f"{name}={value}" for name in STRUCTURED_FIELDS
+            if (value := getattr(record, name, None)) is not None
+        ]
+        return f"{line} | {' '.join(fields)}" if fields else line
+
+
+class _Policy:
+    __slots__ = ("sample", "rate", "burst", "tokens", "updated", "suppressed")
+
+    def __init__(self, sample: float = 1.0, rate: Optional[float] = None, burst: int = 1):
+        self.sample = sample
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.suppressed = 0
+
+
+class SamplingFilter(logging.Filter):
+    """Выборка и ограничение частоты INFO/DEBUG записей по имени логгера"""
+
+    def __init__(self, policies: Dict[str, dict]):
+        super().__init__()
+        self._policies = {name: _Policy(**policy) for name, policy in policies.items()}
+        # Имя логгера -> политика его ближайшего настроенного предка (или None)
+        self._resolved: Dict[str, Optional[_Policy]] = {}
+
+    def _policy(self, name: str) -> Optional[_Policy]:
+        try:
+            return self._resolved[name]
+        except KeyError:
+            pass
+        policy, prefix = None, name
+        while prefix:
+            policy = self._policies.get(prefix)
+            if policy is not None:
+                break
+            prefix = prefix.rpartition(".")[0]
+        self._resolved[name] = policy
+        return policy
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        policy = self._policy(record.name)
+        if policy is None:
+            return True
+        if policy.sample < 1.0 and random.random() >= policy.sample:
+            return False
+        if policy.rate is not None:
+            now = time.monotonic()
+            policy.tokens = min(policy.burst, policy.tokens + (now - policy.updated) * policy.rate)
+            policy.updated = now
+            if policy.tokens < 1:
+                policy.suppressed += 1
+                return False
+            policy.tokens -= 1
+            if policy.suppressed:
+                record.suppressed = policy.suppressed
+                policy.suppressed = 0
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler, который при полной очереди отбрасывает запись, а не ждет"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Сообщение и трейсбек собираются здесь, пока аргументы не изменились;
+        # копия записи не нужна - у корневого логгера нет других обработчиков
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(level: Union[int, str] = logging.INFO, stream=None) -> NonBlockingQueueHandler:
+    """Заменить обработчики корневого логгера очередью с выводом в отдельном потоке"""
+    global _listener
+    if _listener is not None:
+        stop_logging()
+
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(StructuredFormatter(LOG_FORMAT))
+
+    handler = NonBlockingQueueHandler(log_queue)
+    handler.addFilter(SamplingFilter(LOG_POLICIES))
+
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return handler
+
+
+def stop_logging():
+    """Вывести оставшиеся в очереди записи и остановить поток вывода"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,262 @@
+"""
+Метрики бота в формате Prometheus
+
+Счетчики и гистограммы хранятся в памяти процесса: запись - это поиск в
+словаре по кортежу меток и bisect по границам корзин, без блокировок (все
+пишет один цикл событий). Накопительные значения корзин считаются только
+при выдаче /metrics.
+
+Что собирается:
+- время и ошибки обработчиков сообщений (MetricsMiddleware);
+- время SQL-запросов по типу оператора (instrument_engine, события диалекта);
+- время отправки напоминаний и опоздание относительно расписания
+  (services/reminder_service.py);
+- сообщения, отброшенные антифлудом (utils/throttling.py).
+
+start_metrics_server поднимает локальный HTTP-сервер с GET /metrics.
+"""
+import logging
+import time
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, Optional, Sequence
+
+from aiohttp import web
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин (секунды) для задержек внутри процесса и для опозданий
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+LATENESS_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Монотонный счетчик с метками"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0.0)
+
+    def render(self) -> list:
+        # В формате 0.0.4 HELP и TYPE называют метрику так же, как ее строки
+        name = f"{self.name}_total"
+        lines = [f"# HELP {name} {self.documentation}", f"# TYPE {name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    """Гистограмма с метками: счетчики по корзинам, сумма и количество"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # метки -> [попадания в каждую корзину..., попадания выше последней, сумма]
+        self._series: Dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def count(self, *labels) -> int:
+        series = self._series.get(labels)
+        return sum(series[:-1]) if series else 0
+
+    def total(self, *labels) -> float:
+        series = self._series.get(labels)
+        return series[-1] if series else 0.0
+
+    def quantile(self, q: float, *labels) -> Optional[float]:
+        """Оценка квантиля сверху: граница корзины, в которую он попал"""
+        series = self._series.get(labels)
+        if not series:
+            return None
+        rank = q * sum(series[:-1])
+        cumulative = 0
+        for bound, hits in zip(self.buckets, series):
+            cumulative += hits
+            if cumulative >= rank:
+                return bound
+        return float("inf")
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        bounds = [f'le="{bound}"' for bound in self.buckets] + ['le="+Inf"']
+        for labels, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, hits in zip(bounds, series):
+                cumulative += hits
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, bound)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {series[-1]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Все метрики процесса и их выдача в текстовом формате Prometheus"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Глобальный реестр
+metrics = MetricsRegistry()
+
+HANDLER_SECONDS = metrics.histogram(
+    "habit_bot_handler_seconds", "Время обработки сообщения", ["handler"])
+HANDLER_ERRORS = metrics.counter(
+    "habit_bot_handler_errors", "Исключения, вышедшие из обработчиков", ["handler"])
+DB_QUERY_SECONDS = metrics.histogram(
+    "habit_bot_db_query_seconds", "Время выполнения SQL-запроса", ["statement"])
+REMINDER_SEND_SECONDS = metrics.histogram(
+    "habit_bot_reminder_send_seconds", "Время отправки напоминания", ["habit_type"])
+REMINDER_SEND_ERRORS = metrics.counter(
+    "habit_bot_reminder_send_errors", "Неудачные отправки напоминаний", ["habit_type"])
+REMINDER_LATENESS_SECONDS = metrics.histogram(
+    "habit_bot_reminder_lateness_seconds", "Опоздание напоминания относительно расписания",
+    buckets=LATENESS_BUCKETS)
+THROTTLED_MESSAGES = metrics.counter(
+    "habit_bot_throttled_messages", "Сообщения, отброшенные антифлудом")
+BACKUP_SECONDS = metrics.histogram(
+    "habit_bot_backup_seconds", "Время резервной копии БД вместе с проверкой", buckets=LATENESS_BUCKETS)
+BACKUP_PAGES_COPIED = metrics.counter(
+    "habit_bot_backup_pages", "Страницы БД, скопированные в резервные копии")
+BACKUP_ERRORS = metrics.counter(
+    "habit_bot_backup_errors", "Неудачные резервные копии")
+CHART_RENDER_SECONDS = metrics.histogram(
+    "habit_bot_chart_render_seconds", "Время отрисовки графика прогресса в пуле процессов")
+CHART_REQUESTS = metrics.counter(
+    "habit_bot_chart_requests", "Запросы графиков прогресса по источнику: memory, disk, shared, render", ["source"])
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Время и ошибки обработчиков; кнопки учитываются по своему обработчику из ButtonRoute"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        route = data.get("route")
+        name = route[0].__name__ if route else data["handler"].callback.__name__
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, name)
+
+
+@lru_cache(maxsize=1024)
+def statement_type(statement: str) -> str:
+    """SELECT, INSERT, UPDATE, ... - первое слово SQL-запроса"""
+    words = statement.split(None, 1)
+    return words[0].upper() if words else "OTHER"
+
+
+def instrument_engine(engine: AsyncEngine):
+    """
+    Замерять каждый SQL-запрос движка
+
+    Используются события диалекта do_execute*, которые сами выполняют запрос
+    (как диалект по умолчанию) и возвращают True. События движка
+    before/after_cursor_execute для этого не подходят: с ними каждое
+    соединение собирает цепочки слушателей всех событий, и запрос дорожает
+    примерно на сотню вызовов функций.
+    """
+
+    @event.listens_for(engine.sync_engine, "do_execute")
+    def do_execute(cursor, statement, parameters, context):
+        started = time.perf_counter()
+        try:
+            cursor.execute(statement, parameters)
+        finally:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - started, statement_type(statement))
+        return True
+
+    @event.listens_for(engine.sync_engine, "do_execute_no_params")
+    def do_execute_no_params(cursor, statement, context):
+        started = time.perf_counter()
+        try:
+            cursor.execute(statement)
+        finally:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - started, statement_type(statement))
+        return True
+
+    @event.listens_for(engine.sync_engine, "do_executemany")
+    def do_executemany(cursor, statement, parameters, context):
+        started = time.perf_counter()
+        try:
+            cursor.executemany(statement, parameters)
+        finally:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - started, statement_type(statement))
+        return True
+
+
+async def _handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(body=metrics.render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+
+async def start_metrics_server(host: str, port: int) -> Optional[web.AppRunner]:
+    """Поднять GET /metrics; порт 0 - метрики не публикуются"""
+    if not port:
+        return None
+    app = web.Application()
+    app.router.add_get("/metrics", _handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"📈 Метрики доступны на http://{host}:{port}/metrics")
+    return runner
@@ -5,3 +5,5 @@ class HabitStates(StatesGroup):
     choosing_negative_habit = State()
     choosing_positive_habit = State()
     confirming_change = State()
+    choosing_timezone = State()
+    choosing_reminder_time = State()
@@ -0,0 +1,141 @@
+"""
+Тексты сообщений бота
+
+Все фиксированные ответы и шаблоны напоминаний собраны в одну таблицу.
+Шаблоны разбираются один раз при импорте: ошибка в шаблоне видна сразу при
+запуске, а не при первой отправке, и для текстов без подстановок render
+отдает готовую строку без вызова format.
+"""
+from string import Formatter
+from types import MappingProxyType
+
+TEXTS = MappingProxyType({
+    # /start и /menu
+    'welcome_back': (
+        "С возвращением! 👋\n"
+        "📋 Текущая привычка: {habit}\n"
+        "🔥 Текущая серия: {streak} дней"
+    ),
+    'welcome_new': (
+        "Привет! Я помогу тебе работать с одной привычкой. "
+        "Выбери, что для тебя важнее всего прямо сейчас."
+    ),
+    'welcome_fallback': "Привет! Давайте выберем привычку для отслеживания.",
+    'no_habit_yet': "У вас еще нет привычки. Выберите ее через /start",
+    'menu': (
+        "📋 Текущая привычка: {habit}\n"
+        "🔥 Текущая серия: {streak} дней\n"
+        "🏆 Лучшая серия: {best_streak} дней\n"
+        "📅 Всего дней с привычкой: {total_days}"
+    ),
+    'error_restart': "Произошла ошибка. Попробуйте /start",
+    'need_habit': "Сначала выбери привычку через /start",
+
+    # Выбор привычки
+    'choose_habit_type': "Выбери тип привычки:",
+    'choose_negative_habit': "Выбери привычку, от которой хочешь отказаться:",
+    'choose_positive_habit': "Выбери привычку, которую хочешь приобрести:",
+    'habit_set_negative': (
+        "Отлично! Теперь мы будем каждый день отслеживать: {habit}.\n"
+        "Я буду напоминать тебе каждый день в {time} ({timezone}) и спрашивать о результате.\n"
+        "Изменить время - кнопка «⏰ Напоминания»."
+    ),
+    'habit_set_positive': (
+        "Отлично! Теперь мы будем каждый день отслеживать: {habit}.\n"
+        "Я буду напоминать тебе каждый день в {time} ({timezone}).\n"
+        "Изменить время - кнопка «⏰ Напоминания»."
+    ),
+
+    # Ежедневная проверка
+    'check_success': "Отлично! Ты молодец. Твоя серия: {streak} дней подряд!",
+    'check_failure': "Бывает. Главное — не сдаваться. Завтра новый день!",
+    'check_error': "Произошла ошибка при сохранении результата. Попробуй еще раз.",
+    'check_already': "Сегодня отметка уже есть ✅ Твоя серия: {streak} дней подряд. Жду тебя завтра!",
+
+    # Статистика и смена привычки
+    'statistics': (
+        "📊 Статистика по привычке '{habit}':\n"
+        "🔥 Текущая серия: {streak} дней\n"
+        "🏆 Лучшая серия: {best_streak} дней\n"
+        "📅 Всего дней с привычкой: {total_days}\n"
+        "📈 Успешность за неделю: {weekly_rate:.0f}%\n"
+        "📈 Успешность за месяц: {monthly_rate:.0f}%\n\n"
+        "🗓 Последние {days} дней (с {calendar_start:%d.%m}):\n"
+        "{calendar}"
+    ),
+    'change_confirm': "Ты уверен? Текущая серия из {streak} дней будет сброшена.",
+    'change_accepted': "Хорошо! Давай выберем новую цель.",
+    'change_cancelled': "Отлично! Продолжаем работать над '{habit}'.",
+
+    # Напоминания
+    'reminder_negative': (
+        "🔔 Напоминание: сегодня ваша цель - день без '{habit}'! Ты справишься! 💪\n"
+        "⏰ Время: {time}"
+    ),
+    'reminder_positive_morning': (
+        "🌅 Доброе утро! Не забудь про '{habit}' сегодня!\n"
+        "⏰ {time}"
+    ),
+    'reminder_positive_evening': (
+        "🌙 Добрый вечер! Самое время для '{habit}'!\n"
+        "⏰ {time}"
+    ),
+    'demo_negative': (
+        "🔔 Демо-напоминание: сегодня ваша цель - день без '{habit}'! 💪\n"
+        "⚠️ Это демо-версия (только один раз)"
+    ),
+    'demo_positive': (
+        "🔔 Демо-напоминание: не забудь про '{habit}' сегодня! ✅\n"
+        "⚠️ Это демо-версия (только один раз)"
+    ),
+    'morning_negative': "🌅 Доброе утро! Напоминаю: сегодня цель - день без '{habit}'!",
+    'evening_check': "🌙 Привет! Как прошел день? Удалось избежать '{habit}'?",
+
+    # Настройка напоминаний
+    'reminder_settings': (
+        "⏰ Сейчас напоминания приходят в {time} ({timezone}).\n"
+        "Выбери свой часовой пояс или пришли его текстом: например, Europe/Berlin или UTC+5."
+    ),
+    'choose_reminder_time': (
+        "Часовой пояс: {timezone}.\n"
+        "Во сколько напоминать? Выбери время или пришли его в формате ЧЧ:ММ."
+    ),
+    'timezone_unknown': "Не получилось распознать часовой пояс. Пришли имя вроде Europe/Berlin или смещение вроде UTC+5.",
+    'time_unknown': "Не получилось распознать время. Пришли его в формате ЧЧ:ММ, например 07:30.",
+    'reminder_saved': "✅ Готово! Напоминания будут приходить каждый день в {time} ({timezone}).",
+    'reminder_saved_no_habit': (
+        "✅ Сохранено: {time} ({timezone}).\n"
+        "Напоминания начнутся, когда ты выберешь привычку через /start."
+    ),
+
+    # Выгрузка истории
+    'export_ready': "📄 Твоя история отметок: {rows} записей.",
+    'export_empty': "Отметок пока нет - выгружать нечего.",
+    'export_error': "Не получилось собрать выгрузку. Попробуй позже.",
+    'export_all_started': "📦 Собираю выгрузку всех логов...",
+    'export_all_ready': "📦 Все логи: {rows} строк, {size_mb:.1f} МБ за {seconds} с.",
+    'export_all_too_big': "📦 Все логи: {rows} строк, {size_mb:.1f} МБ - больше лимита Telegram, файл на сервере: {path}",
+
+    # Антифлуд
+    'throttled': "⏳ Слишком много сообщений подряд. Подожди пару секунд и попробуй снова.",
+})
+
+
+def _compile(template: str):
+    """Готовая строка для текста без полей, иначе связанный str.format"""
+    fields = [name for _, name, _, _ in Formatter().parse(template) if name is not None]
+    if not fields:
+        # Экранированные скобки {{ }} раскрываются один раз здесь
+        return template.format()
+    return template.format
+
+
+_COMPILED = {name: _compile(template) for name, template in TEXTS.items()}
+
+
+def render(name: str, **fields) -> str:
+    """Текст из таблицы TEXTS с подстановкой полей"""
+    compiled = _COMPILED[name]
+    if type(compiled) is str:
+        return compiled
+    return compiled(**fields)
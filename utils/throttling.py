@@ -0,0 +1,90 @@
+"""
+Антифлуд: ограничение частоты сообщений от одного пользователя
+
+ThrottlingMiddleware - внешний middleware сообщений: он срабатывает до
+фильтров и обработчиков, поэтому отброшенное нажатие не стоит ни одного
+запроса к БД. У каждого пользователя корзина токенов емкостью burst,
+пополняемая со скоростью rate в секунду. Корзина хранится одним числом
+(GCRA): моментом, когда она снова будет полной. Сообщение проходит, если
+после него корзина не окажется пустой, и сдвигает этот момент на 1 / rate.
+
+Момент полной корзины не уходит дальше window = burst / rate секунд вперед,
+а прошедший момент равносилен отсутствию записи. Поэтому записи живут в двух
+поколениях словарей, которые меняются раз в window: при смене старшее
+поколение выбрасывается целиком - все его записи к этому времени уже истекли.
+Память - около сотни байт на пользователя, писавшего за последние два окна,
+без обходов и таймеров.
+
+Первое отброшенное сообщение в окне получает ответ 'throttled', остальные
+отбрасываются молча.
+"""
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message
+
+from config import THROTTLE_RATE, THROTTLE_BURST
+from utils.metrics import THROTTLED_MESSAGES
+from utils.texts import render
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Корзина токенов на пользователя: сообщения сверх лимита отбрасываются до обработчиков"""
+
+    def __init__(self, rate: float = THROTTLE_RATE, burst: int = THROTTLE_BURST):
+        self.interval = 1 / rate
+        # Насколько момент полной корзины может быть в будущем, чтобы сообщение прошло
+        self.tolerance = (burst - 1) * self.interval
+        self.window = burst * self.interval
+        # user_id -> момент (time.monotonic()), когда корзина снова полна
+        self._current: Dict[int, float] = {}
+        self._previous: Dict[int, float] = {}
+        # Кого уже предупредили в текущем окне
+        self._warned = set()
+        self._rotate_at = time.monotonic() + self.window
+
+        # Метрики: пропущено и отброшено сообщений
+        self.passed = 0
+        self.dropped = 0
+
+    def _rotate(self, now: float):
+        # Записи старшего поколения уже истекли; после долгой паузы - и младшего
+        self._previous = self._current if now < self._rotate_at + self.window else {}
+        self._current = {}
+        self._warned = set()
+        self._rotate_at = now + self.window
+
+    def allow(self, user_id: int, now: float) -> bool:
+        """Взять токен из корзины пользователя; False - корзина пуста"""
+        if now >= self._rotate_at:
+            self._rotate(now)
+        full_at = self._current.get(user_id)
+        if full_at is None:
+            full_at = self._previous.get(user_id, now)
+        full_at = max(full_at, now)
+        if full_at - now > self.tolerance:
+            return False
+        self._current[user_id] = full_at + self.interval
+        return True
+
+    def tracked_users(self) -> int:
+        return len(self._current) + len(self._previous)
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = event.from_user
+        if user is None or self.allow(user.id, time.monotonic()):
+            self.passed += 1
+            return await handler(event, data)
+
+        self.dropped += 1
+        THROTTLED_MESSAGES.inc()
+        if user.id not in self._warned:
+            self._warned.add(user.id)
+            await event.answer(render('throttled'))
+        return None
@@ -0,0 +1,100 @@
+"""
+Часовые пояса и местное время напоминаний
+
+Пользователь хранит часовой пояс IANA (users.timezone) и местное время
+напоминания (users.reminder_time); NULL означает значения по умолчанию из
+config.py. Отсюда планировщик берет момент следующего напоминания в UTC.
+Он всегда приходится на начало минуты, поэтому все напоминания одной минуты
+выбираются из user_habits одним диапазонным запросом по next_fire_at.
+
+Часовой пояс можно выбрать кнопкой (keyboards.TIMEZONE_BUTTONS) или прислать текстом:
+имя IANA ("Europe/Berlin") или смещение ("UTC+5", "GMT-3", "+5:30").
+"""
+import re
+from datetime import date, datetime, time, timedelta, timezone
+from functools import lru_cache
+from typing import Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from config import DEFAULT_TIMEZONE, DEFAULT_REMINDER_TIME
+from keyboards.keyboards import TIMEZONE_BUTTONS
+
+_OFFSET = re.compile(r"^(?:UTC|GMT)?\s*([+-])\s*(\d{1,2})(?::?(\d{2}))?$", re.IGNORECASE)
+_TIME = re.compile(r"^(\d{1,2})[:.\s](\d{2})$")
+
+
+@lru_cache(maxsize=512)
+def get_zone(name: Optional[str]):
+    """tzinfo по имени из БД; неизвестное имя или NULL - DEFAULT_TIMEZONE"""
+    if name:
+        match = _OFFSET.match(name)
+        if match:
+            sign, hours, minutes = match.groups()
+            offset = timedelta(hours=int(hours), minutes=int(minutes or 0))
+            return timezone(offset if sign == "+" else -offset, name)
+        try:
+            return ZoneInfo(name)
+        except (ZoneInfoNotFoundError, ValueError):
+            pass
+    return ZoneInfo(DEFAULT_TIMEZONE)
+
+
+def parse_timezone(text: str) -> Optional[str]:
+    """Имя часового пояса для БД из кнопки или ввода пользователя, None - не распознан"""
+    text = text.strip()
+    if text in TIMEZONE_BUTTONS:
+        return TIMEZONE_BUTTONS[text]
+
+    match = _OFFSET.match(text)
+    if match:
+        sign, hours, minutes = match.groups()
+        if int(hours) > 14 or int(minutes or 0) >= 60:
+            return None
+        return f"UTC{sign}{int(hours):02d}:{minutes or '00'}"
+
+    try:
+        ZoneInfo(text)
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+    return text
+
+
+def parse_reminder_time(text: str) -> Optional[time]:
+    """Время "ЧЧ:ММ" (или "Ч.ММ", "Ч ММ"), None - не распознано"""
+    match = _TIME.match(text.strip())
+    if not match:
+        return None
+    hours, minutes = int(match.group(1)), int(match.group(2))
+    if hours > 23 or minutes > 59:
+        return None
+    return time(hours, minutes)
+
+
+DEFAULT_TIME = parse_reminder_time(DEFAULT_REMINDER_TIME) or time(20, 0)
+
+
+def next_fire_at(zone_name: Optional[str], reminder_time: Optional[time], after: float) -> float:
+    """Ближайший строго после after (unix time) момент reminder_time в поясе пользователя"""
+    zone = get_zone(zone_name)
+    reminder_time = reminder_time or DEFAULT_TIME
+    local_day = datetime.fromtimestamp(after, zone).date()
+    candidate = datetime.combine(local_day, reminder_time, zone).timestamp()
+    if candidate <= after:
+        candidate = datetime.combine(local_day + timedelta(days=1), reminder_time, zone).timestamp()
+    # Время, пропущенное при переводе часов, zoneinfo сдвигает на час - минута остается целой
+    return candidate - candidate % 60
+
+
+def local_time(zone_name: Optional[str], timestamp: float) -> datetime:
+    """Местное время пользователя в момент timestamp"""
+    return datetime.fromtimestamp(timestamp, get_zone(zone_name))
+
+
+def local_today(zone_name: Optional[str]) -> date:
+    """Сегодняшняя дата пользователя - тот же день, что log_day его новых отметок"""
+    return datetime.now(get_zone(zone_name)).date()
+
+
+def describe(zone_name: Optional[str], reminder_time: Optional[time]) -> tuple:
+    """(пояс, время) для показа пользователю: значения по умолчанию подставлены"""
+    return zone_name or DEFAULT_TIMEZONE, (reminder_time or DEFAULT_TIME).strftime("%H:%M")